@@ -2,10 +2,12 @@
 
 from ROOT import kRed, kBlue, kBlack, kGreen
 from copy import deepcopy
+import numpy as np
 from base.Helper import HistToGraph
 from base.Graphics import Style, Frame, TwoPanelPlot, GraphicsObject
 from base.FileHandler import LegoTrainFileReader
 from base.SpectrumFitter import MinBiasFitter
+from util.FitDriver import FitDriver
 
 class ComparisonPlot(TwoPanelPlot):
     def __init__(self, comparison):
@@ -103,9 +105,9 @@ class MultipleFitPlot(TwoPanelPlot):
 
 class DataFitComparison:
     
-    def __init__(self, data, fitmin):
+    def __init__(self, data, mbfitter):
         self.__data = data
-        self.__mbfitter = MinBiasFitter(data, fitmin)
+        self.__mbfitter = mbfitter
         self.__parameterised = self.__CreateBinnedParameterisation()
         self.__ratio = self.__CreateRatioDataParam()
         
@@ -132,9 +134,11 @@ class DataFitComparison:
     def __CreateBinnedParameterisation(self):
         print "Called"
         parameterised = deepcopy(self.__data)
-        for mybin in range(1, parameterised.GetXaxis().GetNbins()+1):
-            parameterised.SetBinContent(mybin, \
-                            self.__mbfitter.CalculateBinned(parameterised.GetXaxis().GetBinLowEdge(mybin), parameterised.GetXaxis().GetBinUpEdge(mybin)))
+        nbins = parameterised.GetXaxis().GetNbins()
+        binmeans = self.__mbfitter.CalculateBinMean(np.array([parameterised.GetXaxis().GetBinLowEdge(mybin) for mybin in range(1, nbins+1)]), \
+                                                    np.array([parameterised.GetXaxis().GetBinUpEdge(mybin) for mybin in range(1, nbins+1)]))
+        for mybin in range(1, nbins+1):
+            parameterised.SetBinContent(mybin, binmeans[mybin-1])
             parameterised.SetBinError(mybin, 0)
         return parameterised
     
@@ -183,21 +187,29 @@ def MakeNormalisedSpectrum(inputdata, name):
 def CompareDataFit(filename, fitmin, fitmax):
     reader = LegoTrainFileReader(filename)
     mbspectrum = MakeNormalisedSpectrum(reader.ReadFile().GetData("MinBias").FindTrackContainer("tracksAll"), "MinBias")
-    comparison = DataFitComparison(mbspectrum, fitmin)
+    comparison = DataFitComparison(mbspectrum, MinBiasFitter("mbfitter", mbspectrum, fitmin))
     comparison.SetRange(2., 100.)
     comparisonPlot = ComparisonPlot(comparison)
     comparisonPlot.SetTag("Fit range: %.1f - %.1f Gev/c" %(fitmin, fitmax))
     comparisonPlot.Create()
     return comparisonPlot
 
-def CheckFitRanges(filename):
+def CheckFitRanges(filename, nworkers = 1):
     reader = LegoTrainFileReader(filename)
     mbspectrum = MakeNormalisedSpectrum(reader.ReadFile().GetData("MinBias").FindTrackContainer("tracksAll"), "MinBias")
 
+    # run the fits for all fit ranges at once
+    driver = FitDriver(nworkers)
+    fitters = {}
+    for imin in range(10, 30, 5):
+        fitters[imin] = MinBiasFitter("mbfitter%d" %(imin), mbspectrum, imin, doFit = False)
+        driver.AddFitter("fitmin%d" %(imin), fitters[imin])
+    driver.Run()
+
     plot = MultipleFitPlot()
     styles = {10:Style(kBlue,24),15:Style(kBlack,25),20:Style(kRed,26),25:Style(kGreen,27)}
     for imin in range(10, 30, 5):
-        comparison = DataFitComparison(mbspectrum, imin)
+        comparison = DataFitComparison(mbspectrum, fitters[imin])
         comparison.SetRange(2., 100.)
         comparison.SetStyle("Param",styles[imin])
         isRef = False
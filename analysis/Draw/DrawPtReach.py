@@ -6,6 +6,7 @@ Created on 18.09.2014
 
 from base.Graphics import Style
 from plots.PtReachPlot import PtReachData, PtReachPlot
+from util.PtReachCalculation import PtReachCalculator, CalculatePtReachMatrix
 from base.FileHandler import LegoTrainFileReader
 from ROOT import kBlack, kRed, kBlue, kGreen, kOrange
 
@@ -25,12 +26,9 @@ def DrawPtReach(filename, doIntegral = False):
     plot = PtReachPlot()
     triggers = ["MinBias", "EMCJHigh", "EMCJLow", "EMCGHigh", "EMCGLow"]
     styles = {"MinBias":Style(kBlack, 20), "EMCJHigh":Style(kRed,24), "EMCJLow":Style(kOrange, 25), "EMCGHigh":Style(kBlue, 26), "EMCGLow":Style(kGreen, 27)}
-    isMinBias = False
-    for trigger in triggers:
-        if trigger == "MinBias":
-            isMinBias = True
-        else:
-            isMinBias = False
-        plot.AddData(trigger, PtReachData(trigger, MakeNormalisedSpectrum(content.GetData(trigger)), isMinBias, doIntegral), styles[trigger])
+    calculators = [PtReachCalculator(trigger, MakeNormalisedSpectrum(content.GetData(trigger)), trigger == "MinBias", 50) for trigger in triggers]
+    ptreach = CalculatePtReachMatrix([calculator.GetFitter() for calculator in calculators], PtReachData.DefaultEvents, 50, doIntegral)
+    for trigger, values in zip(triggers, ptreach):
+        plot.AddData(trigger, PtReachData(trigger, PtReachData.DefaultEvents, values, doIntegral), styles[trigger])
     plot.Create()
     return plot
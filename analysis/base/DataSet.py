@@ -66,12 +66,17 @@ class DataSet(object):
         self.__trackContainers = {}
         self.__clusterContainers = {}
         self.__jetContainer = JetContainer()
+        # Builders of containers which are created on first access
+        self.__lazyTrackContainers = {}
+        self.__lazyClusterContainers = {}
+        self.__jetContainerBuilder = None
         
     def __copy__(self):
         """
         shallow copy constructor
         """
         print "Simple copy called from %s" %(self.__class__)
+        self.__LoadLazyContainers()
         newobject = DataSet()
         for name,tc in self.__trackContainers.iteritems():
             newobject.AddTrackContainer(name, copy(tc))
@@ -84,6 +89,7 @@ class DataSet(object):
         deep copy constructor
         """
         print "deep copy called from %s" %(self.__class__)
+        self.__LoadLazyContainers()
         newobject = DataSet()
         for name,tc in self.__trackContainers.iteritems():
             newobject.AddTrackContainer(name, deepcopy(tc, memo))
@@ -100,10 +106,23 @@ class DataSet(object):
         :param data: track container to be added
         :type data: TrackContainer
         """
-        if name in self.__trackContainers.keys():
+        if name in self.GetListOfTrackContainers():
             raise DataSet.ContentException(name, "TrackContainer")
         self.__trackContainers[name] = data
         
+    def AddLazyTrackContainer(self, name, builder):
+        """
+        Add a track container which is created only when it is accessed for the first time
+        
+        :param name: name of the track container
+        :type name: str
+        :param builder: function creating the track container
+        :type builder: function
+        """
+        if name in self.GetListOfTrackContainers():
+            raise DataSet.ContentException(name, "TrackContainer")
+        self.__lazyTrackContainers[name] = builder
+        
     def AddJetSpectrum(self, spectrum, jetpt, isMCkine):
         """
         Add pt spectrum of tracks in jets to the dataset
@@ -135,10 +154,32 @@ class DataSet(object):
         :param data: cluster container to be added
         :type data: ClusterContainer
         """
-        if name in self.__clusterContainers.keys():
+        if name in self.GetListOfClusterContainers():
             raise DataSet.ContentException(name, "ClusterContainer")
         self.__clusterContainers[name] = data
         
+    def AddLazyClusterContainer(self, name, builder):
+        """
+        Add a cluster container which is created only when it is accessed for the first time
+        
+        :param name: name of the cluster container
+        :type name: str
+        :param builder: function creating the cluster container
+        :type builder: function
+        """
+        if name in self.GetListOfClusterContainers():
+            raise DataSet.ContentException(name, "ClusterContainer")
+        self.__lazyClusterContainers[name] = builder
+        
+    def SetJetContainerBuilder(self, builder):
+        """
+        Set function creating the jet container on first access (replacing the current jet container)
+        
+        :param builder: function creating the jet container
+        :type builder: function
+        """
+        self.__jetContainerBuilder = builder
+        
     def FindTrackContainer(self, name):
         """
         Find a track container within the dataset
@@ -148,6 +189,8 @@ class DataSet(object):
         :return: The track container (None if not found)
         :rtype: TrackContainer
         """
+        if name in self.__lazyTrackContainers.keys():
+            self.__trackContainers[name] = self.__lazyTrackContainers.pop(name)()
         if not name in self.__trackContainers.keys():
             return None
         return self.__trackContainers[name]
@@ -161,6 +204,8 @@ class DataSet(object):
         :return: The cluster container (None if not found)
         :rtype: TrackContainer
         """
+        if name in self.__lazyClusterContainers.keys():
+            self.__clusterContainers[name] = self.__lazyClusterContainers.pop(name)()
         if not name in self.__clusterContainers:
             return None
         return self.__clusterContainers[name]
@@ -172,6 +217,9 @@ class DataSet(object):
         :return: the jet container
         :rtype: JetContainer
         """
+        if self.__jetContainerBuilder:
+            self.__jetContainer = self.__jetContainerBuilder()
+            self.__jetContainerBuilder = None
         return self.__jetContainer
     
     def GetListOfTrackContainers(self):
@@ -181,7 +229,7 @@ class DataSet(object):
         :return: list of container names
         :rtype: list
         """
-        return self.__trackContainers.keys()
+        return self.__trackContainers.keys() + self.__lazyTrackContainers.keys()
     
     def GetListOfClusterContainers(self):
         """
@@ -190,7 +238,7 @@ class DataSet(object):
         :return: list of container names
         :rtype: list
         """
-        return self.__clusterContainers.keys()
+        return self.__clusterContainers.keys() + self.__lazyClusterContainers.keys()
     
     def Add(self, other):
         """
@@ -201,6 +249,7 @@ class DataSet(object):
         """
         if not isinstance(other, DataSet):
             raise MergeException("Incompatible types: this(Dataset), other(%s)" %(str(other.__class__)))
+        self.__LoadLazyContainers()
         nfailure = 0
         for cont in self.GetListOfTrackContainers():
             othercont = other.FindTrackContainer(cont)
@@ -224,15 +273,26 @@ class DataSet(object):
         :param scalefactor: Scale factor applied
         :type scalefactor: float
         """
+        self.__LoadLazyContainers()
         for cont in self.__trackContainers.values():
             cont.Scale(scalefactor)
         for cont in self.__clusterContainers.values():
             cont.Scale(scalefactor)
      
+    def __LoadLazyContainers(self):
+        """
+        Create all containers which are not yet created
+        """
+        for name in self.__lazyTrackContainers.keys():
+            self.FindTrackContainer(name)
+        for name in self.__lazyClusterContainers.keys():
+            self.FindClusterContainer(name)
+     
     def GetRootPrimitive(self, listname):
         """
         Make root primitives (for root IO)
         """
+        self.__LoadLazyContainers()
         result = TList()
         result.SetName(listname)
         tracklist = TList()
@@ -287,9 +347,13 @@ class DataSet(object):
         print "   Track Containers:"
         for cont in self.__trackContainers.keys():
             print "      %s" %(cont)
+        for cont in self.__lazyTrackContainers.keys():
+            print "      %s (not loaded)" %(cont)
         print "   Cluster Containers:"
         for cont in self.__clusterContainers.keys():
             print "      %s" %(cont)
+        for cont in self.__lazyClusterContainers.keys():
+            print "      %s (not loaded)" %(cont)
         print "--------------------------------------------"
         print "Status of the different containers:"
         for contname, container in self.__trackContainers.iteritems():
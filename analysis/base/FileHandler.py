@@ -5,12 +5,20 @@ FileHandler.py
      Author: markusfasel
 """
 
+import re
 from ROOT import TFile,TIter,TObject,gDirectory,gROOT
+from collections import OrderedDict
 from base.DataSet import DataSet
 from base.FileResults import ResultData
+from base.HistogramCache import HistogramCache
 from base.struct.ParticleTHnSparse import ParticleTHnSparse
 from base.struct.DataContainerFactory import DataContainerFactory
     
+# Names of the result histograms: histogram type, trigger class and, for jet histograms,
+# the jet pt (3 digits) in front of or behind the trigger class
+_HISTNAME_PATTERN = re.compile(r"^(?P<histtype>hEventHist|h(?:MC)?Track(?:InAcceptance)?Hist|hCluster(?:Calib|Uncalib)Hist|h\w*?TrackJetHist)" \
+                               r"(?P<before>\w*?)(?:jetPt(?P<jetpt>\d{3})(?P<after>\w*))?$")
+
 class FileReader(object):
     
     class FileReaderException(Exception):
@@ -45,6 +53,23 @@ class FileReader(object):
         self.__datafactory = DataContainerFactory("new")
         self._histlist = "histosPtEMCalTriggerHistograms"
         self._trackCutsTag = ""
+        self.__cache = None
+        self.__lazyLoading = False
+        
+    def SetLazyLoading(self, doLazy = True):
+        """
+        Create data sets and containers only when they are accessed for the first time.
+        In combination with the cache the histogram arrays are memory mapped.
+        """
+        self.__lazyLoading = doLazy
+        
+    def SetCacheDirectory(self, cachedir):
+        """
+        Use a persistent cache of the histograms in the given directory. If the file
+        was already read before, the histograms are taken from the cache, otherwise
+        they are written to the cache after reading the file.
+        """
+        self.__cache = HistogramCache(cachedir)
         
     def SetHistList(self, histlist):
         self._histlist = histlist
@@ -79,23 +104,23 @@ class FileReader(object):
         to trigger classes. Raising FileReaderExceptions if the file can't be opened, doesn't contain
         the directory or list, or has an empty histogram list
         """
-        filecontent = self.__ReadHistList()
+        return self.BuildResultData(self.ReadHistograms())
+    
+    def BuildResultData(self, filecontent):
+        """
+        Create a ResultData structure from the histograms read from the file (see ReadHistograms).
+        Raising FileReaderExceptions if the histogram list is empty
+        """
         if self.__isReadWeights:
             self.__weightlist = filecontent["weights"]
         hlist = filecontent["spectra"]
-        if not hlist.GetEntries():
+        if not len(hlist):
             raise self.FileReaderException("Empty list of histograms in file %s" %(self.__filename))
         result = ResultData("result")
         
-        # build list of histograms and extract trigger names
-        histnames = []
-        for oID in range(0, hlist.GetEntries()):
-            histnames.append(hlist.At(oID).GetName())    
-        triggers = []
-        for hname in histnames:
-            if not "hEventHist" in hname:
-                continue
-            triggers.append(hname.replace("hEventHist",""))
+        # index the histograms by trigger class and extract trigger names
+        histindex = self.IndexHistograms(hlist.keys())
+        triggers = histindex.keys()
         print "Found the following triggers:"
         print "================================="
         isFirst = True
@@ -112,62 +137,160 @@ class FileReader(object):
         
         # Handle MC-truth data
         if self.__isMC:
-            result.SetMCTruth(self.__datafactory.CreateParticleContainer(hlist.FindObject("hMCtrueParticles")))
+            result.SetMCTruth(self.__datafactory.CreateParticleContainer(hlist.get("hMCtrueParticles")))
         
         # Add the result hists to the result container
         for trigger in triggers:
-            eventhist = hlist.FindObject("hEventHist%s" %(trigger))
-            trackhist = hlist.FindObject("hTrackHist%s" %(trigger))
-            #eventhist.Sumw2()
-            #trackhist.Sumw2()
-            triggerdata = DataSet()
-            triggerdata.AddEventHistForJets(eventhist)
-            triggerdata.AddTrackContainer("tracksAll", self.__datafactory.CreateTrackContainer(eventhist, trackhist))
-            tracksWithClusters = hlist.FindObject("hTrackInAcceptanceHist%s" %(trigger)) 
-            if tracksWithClusters:
-                triggerdata.AddTrackContainer("tracksWithClusters", self.__datafactory.CreateTrackContainer(eventhist, tracksWithClusters))
-            tracksMCKine = hlist.FindObject("hMCTrackHist%s" %(trigger))
-            if tracksMCKine:
-                triggerdata.AddTrackContainer("tracksMCKineAll", self.__datafactory.CreateTrackContainer(eventhist, tracksMCKine))
-            tracksMCKineWithClusters = hlist.FindObject("hMCTrackInAcceptanceHist%s" %(trigger)) 
-            if tracksMCKineWithClusters:
-                triggerdata.AddTrackContainer("tracksMCKineWithClusters", self.__datafactory.CreateTrackContainer(eventhist, tracksMCKineWithClusters))
-            clusterhists = ["hClusterCalibHist","hClusterUncalibHist"]
-            for clust in clusterhists:
-                clhist = hlist.FindObject("%s%s" %(clust, trigger))
-                if clhist:
-                    tag = clust.replace("hCluster","").replace("Hist","")
-                    #clhist.Sumw2()
-                    triggerdata.AddClusterContainer(tag, self.__datafactory.CreateClusterContainer(eventhist, clhist))
-            self.ProcessJets(trigger, triggerdata, hlist)
-            result.SetData(trigger, triggerdata)
+            if self.__lazyLoading:
+                result.SetLazyData(trigger, self.__MakeDataSetBuilder(trigger, hlist, histindex[trigger]))
+            else:
+                result.SetData(trigger, self.__BuildDataSet(trigger, hlist, histindex[trigger]))
         return result
     
-    def ProcessJets(self, triggerclass, dataset, histlist):
+    @staticmethod
+    def IndexHistograms(histnames):
+        """
+        Sort the histogram names according to trigger classes in a single pass. Names are
+        parsed with one pattern into histogram type, trigger class and jet pt. Only trigger
+        classes with event histogram are kept.
+
+        :param histnames: names of the histograms
+        :type histnames: list
+        :return: for each trigger class (in order of the event histograms) the name of the event
+                 histogram ("event"), the names of the spectrum histograms by type ("hists") and
+                 the list of jet histograms as (name, jet pt, isMC) ("jets")
+        :rtype: OrderedDict
+        """
+        index = OrderedDict()
+        spectra = []
+        for histname in histnames:
+            histname = str(histname)
+            match = _HISTNAME_PATTERN.match(histname)
+            if not match:
+                continue
+            trigger = match.group("before") + (match.group("after") or "")
+            if match.group("histtype") == "hEventHist":
+                index[trigger] = {"event":histname, "hists":{}, "jets":[]}
+            else:
+                spectra.append((trigger, histname, match))
+        for trigger, histname, match in spectra:
+            entry = index.get(trigger)
+            if not entry:
+                continue
+            histtype = match.group("histtype")
+            if histtype.endswith("TrackJetHist"):
+                if match.group("jetpt"):
+                    entry["jets"].append((histname, int(match.group("jetpt")), histtype.startswith("hMC")))
+            else:
+                entry["hists"][histtype] = histname
+        return index
+    
+    def __BuildDataSet(self, trigger, hlist, histindex):
+        """
+        Build the data set for a given trigger class from the histograms, as listed in the
+        index of the trigger class. In lazy mode the containers are created when they are
+        accessed for the first time.
+        """
+        eventhistname = histindex["event"]
+        triggerdata = DataSet()
+        if self.__lazyLoading:
+            triggerdata.SetJetContainerBuilder(self.__MakeJetContainerBuilder(trigger, hlist, histindex))
+        else:
+            triggerdata.AddEventHistForJets(hlist.get(eventhistname))
+            self.ProcessJets(trigger, triggerdata, hlist, histindex["jets"])
+        trackhists = [("tracksAll", "hTrackHist"), ("tracksWithClusters", "hTrackInAcceptanceHist"), \
+                      ("tracksMCKineAll", "hMCTrackHist"), ("tracksMCKineWithClusters", "hMCTrackInAcceptanceHist")]
+        for contname, histtype in trackhists:
+            histname = histindex["hists"].get(histtype)
+            if not histname:
+                if contname != "tracksAll":
+                    continue
+                histname = "%s%s" %(histtype, trigger)
+            builder = self.__MakeContainerBuilder(self.__datafactory.CreateTrackContainer, hlist, eventhistname, histname)
+            if self.__lazyLoading:
+                triggerdata.AddLazyTrackContainer(contname, builder)
+            else:
+                triggerdata.AddTrackContainer(contname, builder())
+        clusterhists = ["hClusterCalibHist","hClusterUncalibHist"]
+        for clust in clusterhists:
+            histname = histindex["hists"].get(clust)
+            if not histname:
+                continue
+            tag = clust.replace("hCluster","").replace("Hist","")
+            builder = self.__MakeContainerBuilder(self.__datafactory.CreateClusterContainer, hlist, eventhistname, histname)
+            if self.__lazyLoading:
+                triggerdata.AddLazyClusterContainer(tag, builder)
+            else:
+                triggerdata.AddClusterContainer(tag, builder())
+        return triggerdata
+    
+    def __MakeDataSetBuilder(self, trigger, hlist, histindex):
+        """
+        Create function building the data set for a trigger class
+        """
+        return lambda: self.__BuildDataSet(trigger, hlist, histindex)
+    
+    def __MakeContainerBuilder(self, creator, hlist, eventhistname, histname):
+        """
+        Create function building a track or cluster container from the event histogram
+        and the spectrum histogram
+        """
+        return lambda: creator(hlist.get(eventhistname), hlist.get(histname))
+    
+    def __MakeJetContainerBuilder(self, trigger, hlist, histindex):
+        """
+        Create function building the jet container for a trigger class
+        """
+        def BuildJetContainer():
+            jetdata = DataSet()
+            jetdata.AddEventHistForJets(hlist.get(histindex["event"]))
+            self.ProcessJets(trigger, jetdata, hlist, histindex["jets"])
+            return jetdata.GetJetContainer()
+        return BuildJetContainer
+    
+    def ProcessJets(self, triggerclass, dataset, histlist, jethists = None):
         """
         Fill jet hists to the histogram container
         
-        1. find all histograms for the given trigger class that contain the trigger class name and Jet
+        1. find all jet histograms for the given trigger class (from the index, see IndexHistograms)
         2. Group them according to jet pt and histogram type
+        
+        The histograms are provided as dictionary name -> histogram. If the jet histograms
+        of the trigger class are not provided as list of (name, jet pt, isMC), they are
+        taken from the index of the histogram list.
+        """
+        if jethists is None:
+            histindex = self.IndexHistograms(histlist.keys()).get(triggerclass)
+            jethists = histindex["jets"] if histindex else []
+        for histname, jetpt, isMC in jethists:
+            dataset.AddJetSpectrum(histlist.get(histname), jetpt, isMC)
+            
+    def ReadHistograms(self):
+        """
+        Read the histograms, either from the cache (if enabled and the file was already
+        cached) or from the rootfile. Histograms are provided as ordered dictionary
+        name -> histogram. With the cache enabled, histograms read from the rootfile are
+        returned from the new cache entry, so that they have the same types as cached histograms.
         """
-        histiter = TIter(histlist)
+        cachekey = None
+        if self.__cache:
+            cachekey = HistogramCache.MakeKey(self.__filename, self.__directory, self._histlist, self._trackCutsTag)
+            if self.__cache.HasEntry(cachekey):
+                print "Reading histograms for %s from cache" %(self.__filename)
+                return self.__cache.Read(cachekey, self.__lazyLoading)
+        filecontent = self.__ReadHistList()
+        histograms = OrderedDict()
+        histiter = TIter(filecontent["spectra"])
         histfound = histiter.Next()
-        histlist = []
         while histfound:
-            histname = str(histfound.GetName())
-            if triggerclass in histname and "TrackJetHist" in histname:
-                histlist.append(histfound)
+            histograms[str(histfound.GetName())] = histfound
             histfound = histiter.Next()
-            
-        for jethist in histlist:
-            histname = str(jethist.GetName())
-            jetpt = self.__GetJetPt(histname)
-            dataset.AddJetSpectrum(jethist,jetpt, True if "hMC" in histname else False)
-            
-    def __GetJetPt(self, histname):
-        start = histname.index("jetPt") + 5
-        ptstring = histname[start:start + 3]
-        return int(ptstring)
+        result = {"spectra":histograms, "weights":filecontent["weights"]}
+        if cachekey:
+            # read back the new entry, so that the histograms have the same type as for cached files
+            self.__cache.Write(cachekey, histograms, filecontent["weights"], self.__filename)
+            return self.__cache.Read(cachekey, self.__lazyLoading)
+        return result
         
     def __ReadHistList(self):
         """
@@ -194,7 +317,7 @@ class FileReader(object):
         rlist = mydirectory.Get("results")  # old structure
         if not rlist:
             rlist = mydirectory.Get("TriggerTracksResults%s" %(self._trackCutsTag))
-        if self.__isReadWeights:
+        if self.__isReadWeights or self.__cache:
             result["weights"] = {"crosssection":rlist.FindObject("fHistXsection"), "trials":rlist.FindObject("fHistTrials")}
         hlist = rlist.FindObject(self._histlist)
         inputfile.Close()
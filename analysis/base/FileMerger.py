@@ -0,0 +1,415 @@
+#**************************************************************************
+#* Copyright(c) 1998-2014, ALICE Experiment at CERN, All rights reserved. *
+#*                                                                        *
+#* Author: The ALICE Off-line Project.                                    *
+#* Contributors are mentioned in the code where appropriate.              *
+#*                                                                        *
+#* Permission to use, copy, modify and distribute this software and its   *
+#* documentation strictly for non-commercial purposes is hereby granted   *
+#* without fee, provided that the above copyright notice appears in all   *
+#* copies and that both the copyright notice and this permission notice   *
+#* appear in the supporting documentation. The authors make no claims     *
+#* about the suitability of this software for any purpose. It is          *
+#* provided "as is" without express or implied warranty.                  *
+#**************************************************************************
+"""
+Merging of train output files without external tools. Files are merged object by object:
+directories and lists are matched by name, histograms (TH1 and THnBase) are added, other
+objects are taken from the first file. Large numbers of files are merged in a tree reduction,
+where the buckets of each stage are merged in parallel in worker processes. Merged outputs can
+be updated incrementally, based on a manifest of the inputs which went into the output.
+
+:organization: ALICE Collaboration
+:copyright: 1998-2014, ALICE Experiment at CERN, All rights reserved.
+
+:author: Markus Fasel
+:contact: markus.fasel@cern.ch
+:organization: Lawrence Berkeley National Laboratory
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+from multiprocessing import Pool
+from ROOT import TFile, TH1, TObject
+from base.MergeException import MergeException
+
+def MergeObject(target, source):
+    """
+    Merge source object into the target object. Collections are merged entry by entry, entries
+    missing in the target are added as copy. Histograms are added. Other objects are kept from
+    the target.
+
+    :param target: object to merge into
+    :type target: TObject
+    :param source: object to merge
+    :type source: TObject
+    """
+    if target.InheritsFrom("TCollection"):
+        if not source.InheritsFrom("TCollection"):
+            raise MergeException("Incompatible types for %s: this(%s), other(%s)" %(target.GetName(), target.ClassName(), source.ClassName()))
+        for entry in source:
+            match = target.FindObject(entry.GetName())
+            if match:
+                MergeObject(match, entry)
+            else:
+                target.Add(entry.Clone())
+    elif target.InheritsFrom("TH1") or target.InheritsFrom("THnBase"):
+        if source.ClassName() != target.ClassName():
+            raise MergeException("Incompatible types for %s: this(%s), other(%s)" %(target.GetName(), target.ClassName(), source.ClassName()))
+        target.Add(source)
+
+def ReadFileContent(filename):
+    """
+    Read all objects of a ROOT file. Directories are represented as ordered dictionaries
+    name -> object. In case of several cycles of the same key only the first one is read.
+
+    :param filename: name of the ROOT file
+    :type filename: str
+    :return: content of the file
+    :rtype: OrderedDict
+    """
+    inputfile = TFile.Open(filename)
+    if not inputfile or inputfile.IsZombie():
+        raise MergeException("File %s cannot be read" %(filename))
+    content = _ReadDirectory(inputfile)
+    inputfile.Close()
+    return content
+
+def _ReadDirectory(directory):
+    """
+    Read objects inside a directory recursively
+    """
+    content = OrderedDict()
+    for key in directory.GetListOfKeys():
+        name = str(key.GetName())
+        if name in content:
+            continue
+        if key.GetClassName().startswith("TDirectory"):
+            content[name] = _ReadDirectory(directory.GetDirectory(name))
+        else:
+            content[name] = key.ReadObj()
+    return content
+
+def MergeContent(target, source):
+    """
+    Merge the content of a file into the content of another file (see ReadFileContent)
+
+    :param target: file content to merge into
+    :type target: OrderedDict
+    :param source: file content to merge
+    :type source: OrderedDict
+    """
+    for name, entry in source.iteritems():
+        if not name in target:
+            target[name] = entry
+        elif isinstance(entry, OrderedDict):
+            MergeContent(target[name], entry)
+        else:
+            MergeObject(target[name], entry)
+
+def WriteFileContent(filename, content):
+    """
+    Write file content (see ReadFileContent) into a new ROOT file. Collections
+    are written as single key.
+
+    :param filename: name of the output file
+    :type filename: str
+    :param content: file content
+    :type content: OrderedDict
+    """
+    outputfile = TFile(filename, "RECREATE")
+    _WriteDirectory(outputfile, content)
+    outputfile.Close()
+
+def _WriteDirectory(directory, content):
+    """
+    Write objects into a directory recursively
+    """
+    for name, entry in content.iteritems():
+        if isinstance(entry, OrderedDict):
+            _WriteDirectory(directory.mkdir(name), entry)
+            continue
+        directory.cd()
+        if entry.InheritsFrom("TCollection"):
+            entry.Write(name, TObject.kSingleKey)
+        else:
+            entry.Write(name)
+
+def MergeFiles(outputfile, inputfiles):
+    """
+    Merge a list of ROOT files into one output file. Input files are read one after
+    the other, so only the merged content and one input are kept in memory.
+
+    :param outputfile: name of the merged file
+    :type outputfile: str
+    :param inputfiles: files to merge
+    :type inputfiles: list
+    :return: name of the merged file
+    :rtype: str
+    """
+    TH1.AddDirectory(False)
+    merged = None
+    for inputfile in inputfiles:
+        content = ReadFileContent(inputfile)
+        if merged is None:
+            merged = content
+        else:
+            MergeContent(merged, content)
+    if merged is None:
+        raise MergeException("No input files for %s" %(outputfile))
+    outputdir = os.path.dirname(outputfile)
+    if outputdir and not os.path.exists(outputdir):
+        os.makedirs(outputdir, 0755)
+    WriteFileContent(outputfile, merged)
+    return outputfile
+
+def _MergeBucket(task):
+    """
+    Merge one bucket of files in a worker process
+    """
+    return MergeFiles(task[0], task[1])
+
+class TreeMerger(object):
+    """
+    Merger of large numbers of files in a tree reduction: in each stage the files are split
+    into buckets of at most fan-in files, which are merged in parallel. The outputs of one
+    stage are the inputs of the next stage, until only one file is left.
+    """
+
+    def __init__(self, fanin = 10, nworkers = 1, sandbox = None):
+        """
+        Constructor
+
+        :param fanin: maximum number of files merged in one bucket
+        :type fanin: int
+        :param nworkers: number of worker processes
+        :type nworkers: int
+        :param sandbox: directory for the intermediate files
+        :type sandbox: str
+        """
+        if fanin < 2:
+            raise MergeException("Fan-in needs to be at least 2, found %d" %(fanin))
+        self.__fanin = fanin
+        self.__nworkers = nworkers
+        self.__sandbox = sandbox
+        self.__stagetimings = []
+
+    def GetStageTimings(self):
+        """
+        Get the timing of the stages of the last merge
+
+        :return: list of (stage, number of inputs, number of outputs, time in seconds)
+        :rtype: list
+        """
+        return self.__stagetimings
+
+    def Merge(self, outputfile, inputfiles):
+        """
+        Merge files into the output file. Files which do not exist are skipped.
+
+        :param outputfile: name of the merged file
+        :type outputfile: str
+        :param inputfiles: files to merge
+        :type inputfiles: list
+        """
+        self.__stagetimings = []
+        files = []
+        for inputfile in inputfiles:
+            if os.path.exists(inputfile):
+                files.append(inputfile)
+            else:
+                print "File %s not found - skipping" %(inputfile)
+        if not len(files):
+            raise MergeException("No input files found for %s" %(outputfile))
+        sandbox = self.__sandbox
+        if not sandbox:
+            sandbox = "%s.merge%d" %(os.path.abspath(outputfile), os.getpid())
+        pool = None
+        if self.__nworkers > 1:
+            pool = Pool(self.__nworkers)
+        try:
+            stage = 0
+            while True:
+                start = time.time()
+                buckets = [files[first:first + self.__fanin] for first in range(0, len(files), self.__fanin)]
+                if len(buckets) == 1:
+                    tasks = [(outputfile, buckets[0])]
+                else:
+                    rootfile = os.path.basename(outputfile)
+                    tasks = [("%s/stage%d/%d/%s" %(sandbox, stage, ibucket, rootfile), bucket) for ibucket, bucket in enumerate(buckets)]
+                if pool and len(tasks) > 1:
+                    merged = pool.map(_MergeBucket, tasks)
+                else:
+                    merged = [_MergeBucket(task) for task in tasks]
+                timing = time.time() - start
+                self.__stagetimings.append((stage, len(files), len(merged), timing))
+                print "Merge stage %d: %d files into %d files in %.1f s" %(stage, len(files), len(merged), timing)
+                if len(buckets) == 1:
+                    break
+                files = merged
+                stage += 1
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+            if os.path.exists(sandbox):
+                shutil.rmtree(sandbox)
+
+def HashFile(filename, blocksize = 1048576):
+    """
+    Calculate the SHA1 hash of the content of a file
+
+    :param filename: name of the file
+    :type filename: str
+    :param blocksize: size of the blocks read from the file
+    :type blocksize: int
+    :return: hex digest of the hash
+    :rtype: str
+    """
+    filehash = hashlib.sha1()
+    with open(filename, "rb") as inputfile:
+        block = inputfile.read(blocksize)
+        while block:
+            filehash.update(block)
+            block = inputfile.read(blocksize)
+    return filehash.hexdigest()
+
+class IncrementalMerger(object):
+    """
+    Merger updating an existing merged file. Next to the output a manifest is kept with the size,
+    the modification time and the hash of each input file. Inputs which are not yet in the manifest
+    are added to the existing output. The output is rebuilt from scratch only if an input in the
+    manifest changed or disappeared. Inputs are only hashed when their size or modification time
+    differs from the manifest. The old manifest is removed before the output is replaced, so that
+    an interrupted merge always leads to a full rebuild in the next run.
+    """
+
+    def __init__(self, merger = None):
+        """
+        Constructor
+
+        :param merger: merger used to combine files (default: sequential TreeMerger)
+        :type merger: TreeMerger
+        """
+        self.__merger = merger if merger else TreeMerger()
+
+    @staticmethod
+    def GetManifestName(outputfile):
+        """
+        Get the name of the manifest belonging to a merged file
+        """
+        return "%s.manifest.json" %(outputfile)
+
+    def Merge(self, outputfile, inputfiles):
+        """
+        Bring the merged output up to date with the list of input files. Files which do not
+        exist are skipped.
+
+        :param outputfile: name of the merged file
+        :type outputfile: str
+        :param inputfiles: files to merge
+        :type inputfiles: list
+        :return: merge mode ("full", "incremental" or "uptodate")
+        :rtype: str
+        """
+        inputs = []
+        for inputfile in inputfiles:
+            if os.path.exists(inputfile):
+                inputs.append(os.path.abspath(inputfile))
+            else:
+                print "File %s not found - skipping" %(inputfile)
+        if not len(inputs):
+            raise MergeException("No input files found for %s" %(outputfile))
+        manifest = self.__ReadManifest(outputfile)
+        newinputs = [inputfile for inputfile in inputs if not inputfile in manifest]
+        mode = "incremental"
+        touched = False
+        if not len(manifest) or not os.path.exists(outputfile):
+            mode = "full"
+        else:
+            for inputfile, entry in manifest.iteritems():
+                if not inputfile in inputs:
+                    print "Input %s disappeared - rebuilding %s" %(inputfile, outputfile)
+                    mode = "full"
+                    break
+                mtime = entry["mtime"]
+                if self.__HasChanged(inputfile, entry):
+                    print "Input %s changed - rebuilding %s" %(inputfile, outputfile)
+                    mode = "full"
+                    break
+                touched = touched or entry["mtime"] != mtime
+        if mode == "incremental" and not len(newinputs):
+            print "%s is up to date" %(outputfile)
+            if touched:
+                self.__WriteManifest(outputfile, manifest)
+            return "uptodate"
+        if mode == "full":
+            manifest = {}
+            newinputs = inputs
+            tomerge = inputs
+        else:
+            print "Adding %d new inputs to %s" %(len(newinputs), outputfile)
+            tomerge = [outputfile] + newinputs
+        for inputfile in newinputs:
+            manifest[inputfile] = self.__MakeEntry(inputfile)
+        tmpoutput = "%s.tmp%d" %(outputfile, os.getpid())
+        self.__merger.Merge(tmpoutput, tomerge)
+        # the old manifest does not describe the new output - a crash before the new manifest
+        # is written must not lead to adding the new inputs a second time
+        self.__RemoveManifest(outputfile)
+        os.rename(tmpoutput, outputfile)
+        self.__WriteManifest(outputfile, manifest)
+        return mode
+
+    def __MakeEntry(self, inputfile):
+        """
+        Create manifest entry for an input file
+        """
+        return {"size":os.path.getsize(inputfile), "mtime":os.path.getmtime(inputfile), "sha1":HashFile(inputfile)}
+
+    def __HasChanged(self, inputfile, entry):
+        """
+        Check whether an input file differs from its manifest entry. In case only the
+        modification time changed, the entry is updated with the new modification time,
+        so that the file is not hashed again next time.
+        """
+        if os.path.getsize(inputfile) != entry["size"]:
+            return True
+        mtime = os.path.getmtime(inputfile)
+        if mtime == entry["mtime"]:
+            return False
+        if HashFile(inputfile) != entry["sha1"]:
+            return True
+        entry["mtime"] = mtime
+        return False
+
+    def __ReadManifest(self, outputfile):
+        """
+        Read the manifest of a merged file (empty if not existing)
+        """
+        manifestname = self.GetManifestName(outputfile)
+        if not os.path.exists(manifestname):
+            return {}
+        with open(manifestname) as manifestfile:
+            return json.load(manifestfile)
+
+    def __RemoveManifest(self, outputfile):
+        """
+        Remove the manifest of a merged file (if existing)
+        """
+        manifestname = self.GetManifestName(outputfile)
+        if os.path.exists(manifestname):
+            os.remove(manifestname)
+
+    def __WriteManifest(self, outputfile, manifest):
+        """
+        Write the manifest of a merged file
+        """
+        manifestname = self.GetManifestName(outputfile)
+        with open("%s.tmp" %(manifestname), "w") as manifestfile:
+            json.dump(manifest, manifestfile, indent = 1)
+        os.rename("%s.tmp" %(manifestname), manifestname)
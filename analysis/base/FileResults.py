@@ -68,6 +68,7 @@ class ResultData(object):
         """
         self.__name = name
         self.__data = {}
+        self.__lazyData = {}
         self.__mctruth = None
         
         # for iterator
@@ -78,6 +79,7 @@ class ResultData(object):
         Shallow copy constructor
         """
         print "Simple copy called from %s" %(self.__class__)
+        self.__LoadLazyData()
         newobject = ResultData(self.Name)
         if self.__mctruth:
             newobject.MCTruth = copy(self.__mctruth)
@@ -90,6 +92,7 @@ class ResultData(object):
         Deep copy constructor
         """
         print "deep copy called from %s" %(self.__class__)
+        self.__LoadLazyData()
         newobject = ResultData(self.Name)
         if self.__mctruth:
             newobject.MCTruth = deepcopy(self.__mctruth, memo)
@@ -109,6 +112,17 @@ class ResultData(object):
         container
         """
         self.__data[trigger] = data
+        if trigger in self.__lazyData.keys():
+            del self.__lazyData[trigger]
+        
+    def SetLazyData(self, trigger, builder):
+        """
+        Add a new trigger class, for which the data is created only when it is
+        accessed for the first time
+        """
+        self.__lazyData[trigger] = builder
+        if trigger in self.__data.keys():
+            del self.__data[trigger]
         
     def GetName(self):
         """
@@ -133,6 +147,8 @@ class ResultData(object):
         Find data for a given trigger class by its name
         Raising a data exception if the trigger class is not avialable
         """
+        if self.__lazyData.has_key(trigger):
+            self.__data[trigger] = self.__lazyData.pop(trigger)()
         if not self.__data.has_key(trigger):
             raise self.DataException(self.__name, trigger)
         return self.__data[trigger]
@@ -147,6 +163,7 @@ class ResultData(object):
         """
         if not isinstance(other, ResultData):
             raise MergeException("Type incompatibility: this(ResultData), other(%s)" %(str(other.__class__)))
+        self.__LoadLazyData()
         nfailure =0
         for trigger in self.GetListOfTriggers():
             if other.HasTrigger(trigger):
@@ -162,15 +179,18 @@ class ResultData(object):
         """
         Scale all datasets and the MC truth by the scalefactor
         """
+        self.__LoadLazyData()
         for triggerdata in self.__data.values():
             triggerdata.Scale(scalefactor)
         # Scale also the MC truth
-        self.__mctruth.Scale(scalefactor)
+        if self.__mctruth:
+            self.__mctruth.Scale(scalefactor)
         
     def Write(self, rootfilename):
         """
         Write Structure to file
         """
+        self.__LoadLazyData()
         writer = TFile(rootfilename, "Recreate")
         writer.cd()
         for triggername, triggerdata in self.__data.iteritems():
@@ -202,6 +222,7 @@ class ResultData(object):
         """
         Print status of the result data sets
         """
+        self.__LoadLazyData()
         print "Content of result data:"
         for trg, data in self.__data.items():
             print "Trigger %s" %(trg)
@@ -212,18 +233,19 @@ class ResultData(object):
         Provide a list of trigger classes which are currently stored
         in the container
         """
-        return self.__data.keys()
+        return self.__data.keys() + self.__lazyData.keys()
     
     def HasTrigger(self, triggername):
         """
         Check if the container has a given trigger type
         """
-        return triggername in self.__data.keys()
+        return triggername in self.GetListOfTriggers()
     
     def __iter__(self):
         """
         Initialise the iterator
         """
+        self.__LoadLazyData()
         self.__curentIndex = 0
         return self
     
@@ -243,7 +265,7 @@ class ResultData(object):
         """
         Return the amount of trigger classes
         """
-        return len(self.__data)
+        return len(self.GetListOfTriggers())
     
     def __getItem__(self, key):
         """
@@ -252,5 +274,12 @@ class ResultData(object):
         return self.GetData(key)
     
     def __contains__(self, item):
-        return item in self.__data.keys()
+        return item in self.GetListOfTriggers()
+    
+    def __LoadLazyData(self):
+        """
+        Create data for all trigger classes which are not yet created
+        """
+        for trigger in self.__lazyData.keys():
+            self.GetData(trigger)
     
\ No newline at end of file
@@ -0,0 +1,167 @@
+#**************************************************************************
+#* Copyright(c) 1998-2015, ALICE Experiment at CERN, All rights reserved. *
+#*                                                                        *
+#* Author: The ALICE Off-line Project.                                    *
+#* Contributors are mentioned in the code where appropriate.              *
+#*                                                                        *
+#* Permission to use, copy, modify and distribute this software and its   *
+#* documentation strictly for non-commercial purposes is hereby granted   *
+#* without fee, provided that the above copyright notice appears in all   *
+#* copies and that both the copyright notice and this permission notice   *
+#* appear in the supporting documentation. The authors make no claims     *
+#* about the suitability of this software for any purpose. It is          *
+#* provided "as is" without express or implied warranty.                  *
+#**************************************************************************
+"""
+Persistent cache of fit results. Entries are addressed by the key of the fit (see
+base.SpectrumFitter.MakeFitKey: hash of the data, model formula, initial parameters,
+limits and range), so refitting unchanged spectra returns the stored result. Each
+entry is a small JSON file with parameters, errors, covariance and chi2. The total
+size of the cache is bounded: when it is exceeded, the least recently used entries
+are removed. The cache is enabled for all fitters with
+
+    SpectrumFitter.SetDefaultFitCache(FitCache("fitcache"))
+
+:organization: ALICE Collaboration
+:copyright: 1998-2015, ALICE Experiment at CERN, All rights reserved.
+
+:author: Markus Fasel
+:contact: markus.fasel@cern.ch
+:organization: Lawrence Berkeley National Laboratory
+"""
+
+import json
+import os
+from base.SpectrumFitter import FitResult
+
+class FitCache(object):
+    """
+    Size-bounded on-disk cache of fit results
+    """
+
+    def __init__(self, cachedir, maxsize = 10485760):
+        """
+        Constructor
+
+        :param cachedir: directory of the cache
+        :type cachedir: str
+        :param maxsize: maximum size of the cache in bytes
+        :type maxsize: int
+        """
+        self.__cachedir = cachedir
+        self.__maxsize = maxsize
+
+    def GetEntryPath(self, key):
+        """
+        Get the file of a cache entry
+        """
+        return os.path.join(self.__cachedir, "%s.json" %(key))
+
+    def HasEntry(self, key):
+        """
+        Check whether an entry exists for a given key
+        """
+        return os.path.exists(self.GetEntryPath(key))
+
+    def Read(self, key):
+        """
+        Read the fit result for a given key. The entry is marked as recently used.
+        Broken entries are removed.
+
+        :param key: key of the fit
+        :type key: str
+        :return: the fit result (None if not in the cache)
+        :rtype: FitResult
+        """
+        entrypath = self.GetEntryPath(key)
+        try:
+            with open(entrypath) as entryfile:
+                entry = json.load(entryfile)
+            result = FitResult(entry["parameters"], entry["errors"], entry["covariance"], entry["chi2"], entry["ndf"], entry["status"])
+        except IOError:
+            return None
+        except (ValueError, KeyError):
+            print "Removing broken fit cache entry %s" %(entrypath)
+            self.__RemoveEntry(entrypath)
+            return None
+        try:
+            os.utime(entrypath, None)
+        except OSError:
+            # removed by another process in the meanwhile
+            pass
+        return result
+
+    def Write(self, key, result):
+        """
+        Write the fit result for a given key. The entry is written into a temporary file first
+        and renamed at the end, so that incomplete entries are never visible. Afterwards least
+        recently used entries are removed if the cache exceeds its maximum size.
+
+        :param key: key of the fit
+        :type key: str
+        :param result: the fit result
+        :type result: FitResult
+        """
+        if not os.path.exists(self.__cachedir):
+            try:
+                os.makedirs(self.__cachedir)
+            except OSError:
+                # created by another process in the meanwhile
+                pass
+        entry = {"parameters":result.parameters.tolist(), "errors":result.errors.tolist(), "covariance":result.covariance.tolist(), \
+                 "chi2":result.chi2, "ndf":result.ndf, "status":result.status}
+        entrypath = self.GetEntryPath(key)
+        tmppath = "%s.tmp%d" %(entrypath, os.getpid())
+        with open(tmppath, "w") as entryfile:
+            json.dump(entry, entryfile)
+        os.rename(tmppath, entrypath)
+        self.__Evict()
+
+    def GetSize(self):
+        """
+        Get the total size of the cache entries in bytes
+        """
+        return sum(size for size, mtime, entrypath in self.__ListEntries())
+
+    def Clear(self):
+        """
+        Remove all entries from the cache
+        """
+        for size, mtime, entrypath in self.__ListEntries():
+            self.__RemoveEntry(entrypath)
+
+    def __ListEntries(self):
+        """
+        List the entries of the cache as tuples (size, modification time, path)
+        """
+        if not os.path.isdir(self.__cachedir):
+            return []
+        entries = []
+        for filename in os.listdir(self.__cachedir):
+            if not filename.endswith(".json"):
+                continue
+            entrypath = os.path.join(self.__cachedir, filename)
+            try:
+                status = os.stat(entrypath)
+            except OSError:
+                continue
+            entries.append((status.st_size, status.st_mtime, entrypath))
+        return entries
+
+    def __Evict(self):
+        """
+        Remove the least recently used entries until the cache is within its maximum size
+        """
+        entries = self.__ListEntries()
+        totalsize = sum(size for size, mtime, entrypath in entries)
+        for size, mtime, entrypath in sorted(entries, key = lambda entry: entry[1]):
+            if totalsize <= self.__maxsize:
+                break
+            self.__RemoveEntry(entrypath)
+            totalsize -= size
+
+    def __RemoveEntry(self, entrypath):
+        try:
+            os.remove(entrypath)
+        except OSError:
+            pass
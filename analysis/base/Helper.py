@@ -23,16 +23,83 @@ Helper tools for spectrum plotting
 """
 from ROOT import TFile, TGraphErrors, gDirectory
 from copy import deepcopy
+import numpy as np
+
+def GetBinEdges(axis):
+    """
+    Get the bin edges of an axis as array
+    @param axis: Axis (TAxis or HistogramAxis)
+    @return: array of the nbins+1 bin edges
+    """
+    if hasattr(axis, "GetEdges"):
+        return np.array(axis.GetEdges(), dtype = np.float64)
+    nbins = axis.GetNbins()
+    xbins = axis.GetXbins()
+    if xbins.GetSize():
+        return np.array([xbins[i] for i in range(0, nbins+1)], dtype = np.float64)
+    return np.linspace(axis.GetXmin(), axis.GetXmax(), nbins+1)
+
+def _ReadDoubleBuffer(buf, size):
+    """
+    Copy a buffer of doubles returned by ROOT into a numpy array
+    """
+    if hasattr(buf, "SetSize"):
+        buf.SetSize(size)
+    return np.array(np.frombuffer(buf, dtype = np.float64, count = size))
+
+def GetHistogramArrays(hist):
+    """
+    Read bin edges, contents and errors of a 1D histogram into arrays. Contents and errors
+    include the underflow and overflow bin, so that index i corresponds to bin i. Contents
+    of double precision ROOT histograms are read as one block.
+    @param hist: Histogram to read (TH1 or DenseHistogram)
+    @return: tuple of edges, contents and errors
+    """
+    edges = GetBinEdges(hist.GetXaxis())
+    ncells = len(edges) + 1
+    if hasattr(hist, "GetContents"):
+        # numpy-based histogram
+        return edges, np.array(hist.GetContents(), dtype = np.float64), np.sqrt(hist.GetSumw2Array())
+    if hist.InheritsFrom("TArrayD"):
+        contents = _ReadDoubleBuffer(hist.GetArray(), ncells)
+        sumw2 = hist.GetSumw2()
+        if sumw2.GetSize():
+            errors = np.sqrt(_ReadDoubleBuffer(sumw2.GetArray(), ncells))
+        else:
+            errors = np.sqrt(np.abs(contents))
+        return edges, contents, errors
+    contents = np.array([hist.GetBinContent(i) for i in range(0, ncells)], dtype = np.float64)
+    errors = np.array([hist.GetBinError(i) for i in range(0, ncells)], dtype = np.float64)
+    return edges, contents, errors
+
+def SetHistogramArrays(hist, contents, errors):
+    """
+    Write contents and errors (including underflow and overflow bin) into a 1D histogram in one go
+    @param hist: Histogram to fill (TH1 or DenseHistogram)
+    @param contents: Bin contents
+    @param errors: Bin errors
+    """
+    contents = np.ascontiguousarray(contents, dtype = np.float64)
+    errors = np.ascontiguousarray(errors, dtype = np.float64)
+    if hasattr(hist, "GetContents"):
+        hist.GetContents()[:] = contents
+        hist.GetSumw2Array()[:] = errors * errors
+        return
+    if not hist.GetSumw2N():
+        hist.Sumw2()
+    hist.SetContent(contents)
+    hist.SetError(errors)
 
 def NormaliseBinWidth(hist):
     """
     Normalise each bin by its width
     @param hist: Histogram to normalize by the bin width
     """
-    for mybin in range(1,hist.GetXaxis().GetNbins()+1):
-        bw = hist.GetXaxis().GetBinWidth(mybin)
-        hist.SetBinContent(mybin, hist.GetBinContent(mybin)/bw)
-        hist.SetBinError(mybin, hist.GetBinError(mybin)/bw)
+    edges, contents, errors = GetHistogramArrays(hist)
+    binwidths = np.diff(edges)
+    contents[1:-1] /= binwidths
+    errors[1:-1] /= binwidths
+    SetHistogramArrays(hist, contents, errors)
         
 def GetListOfBinLimits(inputhist):
     """
@@ -40,15 +107,7 @@ def GetListOfBinLimits(inputhist):
     @param inputhist: Histogram to obtain the bin limits from
     @return: list of bin limits
     """
-    binlimits = []
-    for i in range(1, inputhist.GetXaxis().GetNbins()+1):
-        if i == 1:
-            binlimits.append(inputhist.GetXaxis().GetBinLowEdge(i))
-        newlimit = inputhist.GetXaxis().GetBinUpEdge(i)
-        if newlimit in binlimits:
-            continue
-        binlimits.append(newlimit)
-    return binlimits    
+    return [float(limit) for limit in np.unique(GetBinEdges(inputhist.GetXaxis()))]
 
 def MakeRatio(num, den, isBinomial = False):
     """
@@ -74,14 +133,17 @@ def HistToGraph(hist, xmin = None, xmax = None):
     @param xmax: Maximum x for the x-range of the points  
     @return: A TGraphErrors created from the histogram
     """
-    output = TGraphErrors()
-    npoints = 0
-    for mybin in range(1, hist.GetXaxis().GetNbins()+1):
-        if xmin and hist.GetXaxis().GetBinLowEdge(mybin) < xmin:
-            continue
-        if xmax and hist.GetXaxis().GetBinLowEdge(mybin) > xmax:
-            break
-        output.SetPoint(npoints, hist.GetXaxis().GetBinCenter(mybin), hist.GetBinContent(mybin))
-        output.SetPointError(npoints, hist.GetXaxis().GetBinWidth(mybin)/2., hist.GetBinError(mybin))
-        npoints = npoints + 1
-    return output
+    edges, contents, errors = GetHistogramArrays(hist)
+    lowedges = edges[:-1]
+    selected = np.ones(len(lowedges), dtype = bool)
+    if xmin:
+        selected &= lowedges >= xmin
+    if xmax:
+        selected &= lowedges <= xmax
+    x = np.ascontiguousarray((0.5 * (edges[:-1] + edges[1:]))[selected])
+    ex = np.ascontiguousarray((0.5 * np.diff(edges))[selected])
+    y = np.ascontiguousarray(contents[1:-1][selected])
+    ey = np.ascontiguousarray(errors[1:-1][selected])
+    if not len(x):
+        return TGraphErrors()
+    return TGraphErrors(len(x), x, y, ex, ey)
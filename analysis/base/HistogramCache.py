@@ -0,0 +1,316 @@
+#**************************************************************************
+#* Copyright(c) 1998-2014, ALICE Experiment at CERN, All rights reserved. *
+#*                                                                        *
+#* Author: The ALICE Off-line Project.                                    *
+#* Contributors are mentioned in the code where appropriate.              *
+#*                                                                        *
+#* Permission to use, copy, modify and distribute this software and its   *
+#* documentation strictly for non-commercial purposes is hereby granted   *
+#* without fee, provided that the above copyright notice appears in all   *
+#* copies and that both the copyright notice and this permission notice   *
+#* appear in the supporting documentation. The authors make no claims     *
+#* about the suitability of this software for any purpose. It is          *
+#* provided "as is" without express or implied warranty.                  *
+#**************************************************************************
+"""
+Persistent cache of the histograms read from train output files. Each entry
+contains the histograms of one histogram list converted into numpy arrays (one
+.npy file per array) together with a JSON manifest describing the content.
+Entries are identified by the source file (path and modification time), the
+directory and list inside the file and the track cuts tag. Reading from the cache
+does not need to parse the ROOT file.
+
+:organization: ALICE Collaboration
+:copyright: 1998-2014, ALICE Experiment at CERN, All rights reserved.
+
+:author: Markus Fasel
+:contact: markus.fasel@cern.ch
+:organization: Lawrence Berkeley National Laboratory
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from collections import OrderedDict
+from base.struct.SparseHistogram import HistogramAxis, DenseHistogram, SparseHistogram, MakeProjectedHistogram
+
+def ConvertHistogram(hist):
+    """
+    Convert a ROOT histogram into numpy arrays. THnSparses are converted into coordinates,
+    contents and sum of weights squared of the filled bins, 1D and 2D histograms into dense
+    arrays. Returns a tuple of the description of the histogram (type, title and axes) and
+    the dictionary of arrays, None for unsupported object types.
+
+    :param hist: histogram to convert
+    :type hist: THnSparse or TH1
+    :return: description and arrays
+    :rtype: tuple
+    """
+    if hist.InheritsFrom("THnBase"):
+        converted = SparseHistogram.BuildFromTHnSparse(hist)
+        arrays = {"coordinates":converted.GetCoordinates(), "contents":converted.GetContents(), "sumw2":converted.GetSumw2Array()}
+        axes = [converted.GetAxis(d) for d in range(0, converted.GetNdimensions())]
+        objtype = "sparse"
+    elif hist.InheritsFrom("TH1") and hist.GetDimension() < 3:
+        converted = DenseHistogram.BuildFromTH1(hist)
+        arrays = {"contents":converted.GetContents(), "sumw2":converted.GetSumw2Array()}
+        axes = [converted.GetXaxis()]
+        if converted.GetDimension() > 1:
+            axes.append(converted.GetYaxis())
+        objtype = "dense"
+    else:
+        print "Object %s of type %s not supported for the conversion" %(hist.GetName(), hist.ClassName())
+        return None
+    description = {"name":hist.GetName(), "type":objtype, "title":hist.GetTitle(), "axes":[]}
+    for axis in axes:
+        description["axes"].append({"name":axis.GetName(), "title":axis.GetTitle(), "edges":axis.GetEdges().tolist()})
+    return description, arrays
+
+def BuildHistogram(description, arrays):
+    """
+    Build histogram from its description and arrays (see ConvertHistogram). Sparse histograms
+    are built as SparseHistogram, 1D and 2D histograms as TH1D/TH2D (DenseHistogram if ROOT
+    is not available).
+
+    :param description: description of the histogram
+    :type description: dict
+    :param arrays: arrays of the histogram
+    :type arrays: dict
+    :return: the histogram
+    """
+    axes = [HistogramAxis(axis["edges"], str(axis["name"]), str(axis["title"])) for axis in description["axes"]]
+    name = str(description["name"])
+    if description["type"] == "sparse":
+        return SparseHistogram(name, str(description["title"]), axes, arrays["coordinates"], arrays["contents"], arrays["sumw2"])
+    return MakeProjectedHistogram(name, axes, arrays["contents"], arrays["sumw2"])
+
+class LazyHistogramList(object):
+    """
+    Histograms of a cache entry, which are built only when they are accessed for the
+    first time. Arrays of the histograms are memory mapped.
+    """
+
+    def __init__(self, cache, key, entries):
+        """
+        Constructor
+
+        :param cache: the histogram cache
+        :type cache: HistogramCache
+        :param key: key of the cache entry
+        :type key: str
+        :param entries: manifest entries of the objects
+        :type entries: list
+        """
+        self.__cache = cache
+        self.__key = key
+        self.__entries = OrderedDict()
+        for entry in entries:
+            self.__entries[str(entry["name"])] = entry
+        self.__histograms = {}
+
+    def keys(self):
+        return self.__entries.keys()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, name):
+        return name in self.__entries
+
+    def __getitem__(self, name):
+        if not name in self.__histograms:
+            self.__histograms[name] = self.__cache.BuildObject(self.__key, self.__entries[name], True)
+        return self.__histograms[name]
+
+    def get(self, name, default = None):
+        if not name in self.__entries:
+            return default
+        return self[name]
+
+    def IsLoaded(self, name):
+        """
+        Check whether a histogram was already built
+        """
+        return name in self.__histograms
+
+class HistogramCache(object):
+    """
+    Cache of histogram lists in columnar format
+    """
+
+    class CacheException(Exception):
+        """
+        Exception handling cache entries which are not found or broken
+        """
+
+        def __init__(self, message):
+            """
+            Constructor
+            """
+            self.__message = message
+
+        def __str__(self):
+            """
+            Make exception a string object
+            """
+            return self.__message
+
+    def __init__(self, cachedir):
+        """
+        Constructor
+
+        :param cachedir: base directory of the cache
+        :type cachedir: str
+        """
+        self.__cachedir = cachedir
+
+    @staticmethod
+    def MakeKey(filename, directory, histlist, trackCutsTag):
+        """
+        Build the key of a cache entry from the source file path and modification time,
+        the directory and the list in the file and the track cuts tag
+
+        :param filename: name of the source file
+        :type filename: str
+        :param directory: directory inside the source file
+        :type directory: str
+        :param histlist: name of the histogram list
+        :type histlist: str
+        :param trackCutsTag: track cuts tag
+        :type trackCutsTag: str
+        :return: key of the cache entry
+        :rtype: str
+        """
+        abspath = os.path.abspath(filename)
+        keystring = "%s|%f|%s|%s|%s" %(abspath, os.path.getmtime(abspath), directory, histlist, trackCutsTag)
+        return hashlib.sha1(keystring).hexdigest()
+
+    def GetEntryPath(self, key):
+        """
+        Get the directory of a cache entry
+        """
+        return os.path.join(self.__cachedir, key)
+
+    def HasEntry(self, key):
+        """
+        Check whether an entry exists for a given key
+        """
+        return os.path.exists(os.path.join(self.GetEntryPath(key), "manifest.json"))
+
+    def Write(self, key, histograms, weights = None, source = ""):
+        """
+        Write a new cache entry. THnSparses are stored as coordinates, contents and sum of weights
+        squared of the filled bins, 1D and 2D histograms as dense arrays. Other objects are ignored.
+        The entry is written into a temporary directory first and renamed at the end, so that
+        incomplete entries are never visible.
+
+        :param key: key of the cache entry
+        :type key: str
+        :param histograms: histograms under their name
+        :type histograms: OrderedDict
+        :param weights: weight histograms (cross section and trials) under their tag
+        :type weights: dict
+        :param source: name of the source file (for information)
+        :type source: str
+        """
+        entrypath = self.GetEntryPath(key)
+        tmppath = "%s.tmp%d" %(entrypath, os.getpid())
+        if os.path.exists(tmppath):
+            shutil.rmtree(tmppath)
+        os.makedirs(tmppath)
+        manifest = {"source":source, "objects":[], "weights":{}}
+        for name, hist in histograms.iteritems():
+            entry = self.__WriteObject(tmppath, "obj%d" %(len(manifest["objects"])), hist)
+            if entry:
+                entry["name"] = name
+                manifest["objects"].append(entry)
+        if weights:
+            for tag, hist in weights.iteritems():
+                if not hist:
+                    continue
+                entry = self.__WriteObject(tmppath, "weight%s" %(tag), hist)
+                if entry:
+                    manifest["weights"][tag] = entry
+        with open(os.path.join(tmppath, "manifest.json"), "w") as manifestfile:
+            json.dump(manifest, manifestfile)
+        if os.path.exists(entrypath):
+            shutil.rmtree(entrypath)
+        os.rename(tmppath, entrypath)
+
+    def Read(self, key, lazy = False):
+        """
+        Read a cache entry. Sparse histograms are returned as SparseHistogram, 1D and 2D
+        histograms as TH1D/TH2D (DenseHistogram if ROOT is not available). In lazy mode
+        the histograms are provided as LazyHistogramList, building histograms from memory
+        mapped arrays on first access.
+
+        :param key: key of the cache entry
+        :type key: str
+        :param lazy: if true histograms are built on first access
+        :type lazy: bool
+        :return: dictionary with the histograms ("spectra") and the weight histograms ("weights")
+        :rtype: dict
+        """
+        manifest = self.ReadManifest(key)
+        result = {"spectra":None, "weights":None}
+        if lazy:
+            result["spectra"] = LazyHistogramList(self, key, manifest["objects"])
+        else:
+            result["spectra"] = OrderedDict()
+            for entry in manifest["objects"]:
+                result["spectra"][str(entry["name"])] = self.BuildObject(key, entry)
+        if len(manifest["weights"]):
+            result["weights"] = {}
+            for tag, entry in manifest["weights"].iteritems():
+                result["weights"][str(tag)] = self.BuildObject(key, entry)
+        return result
+
+    def ReadManifest(self, key):
+        """
+        Read the manifest of a cache entry
+
+        :param key: key of the cache entry
+        :type key: str
+        :return: the manifest
+        :rtype: dict
+        """
+        if not self.HasEntry(key):
+            raise HistogramCache.CacheException("No cache entry for key %s in %s" %(key, self.__cachedir))
+        with open(os.path.join(self.GetEntryPath(key), "manifest.json")) as manifestfile:
+            return json.load(manifestfile)
+
+    def BuildObject(self, key, entry, mmap = False):
+        """
+        Build histogram from the arrays described by a manifest entry
+
+        :param key: key of the cache entry
+        :type key: str
+        :param entry: manifest entry of the object
+        :type entry: dict
+        :param mmap: if true arrays are memory mapped (read-only) instead of read into memory
+        :type mmap: bool
+        :return: the histogram
+        """
+        entrypath = self.GetEntryPath(key)
+        arrays = {}
+        for arrayname, filename in entry["arrays"].iteritems():
+            arrays[arrayname] = np.load(os.path.join(entrypath, filename), mmap_mode = "r" if mmap else None)
+        return BuildHistogram(entry, arrays)
+
+    def __WriteObject(self, entrypath, tag, hist):
+        """
+        Convert object into arrays and write them to the cache entry. Returns the
+        manifest entry of the object (None for unsupported object types)
+        """
+        converted = ConvertHistogram(hist)
+        if not converted:
+            return None
+        entry, arrays = converted
+        entry["arrays"] = {}
+        for arrayname, values in arrays.iteritems():
+            filename = "%s_%s.npy" %(tag, arrayname)
+            np.save(os.path.join(entrypath, filename), values)
+            entry["arrays"][arrayname] = filename
+        return entry
@@ -7,40 +7,92 @@ can be min. bias events or productions in pt-hat bins
 @author: markusfasel
 """
 
+from collections import OrderedDict
+from multiprocessing import Pool
 from base.WeightHandler import WeightHandler
 from base.FileHandler import LegoTrainFileReader
+from base.HistogramCache import ConvertHistogram, BuildHistogram
 from base.SpectraSum import SpectraSum
 
+def _ReadPtHardBin(task):
+    """
+    Read histograms and weight histograms of one pt-hard bin in a worker process. Histograms
+    are sent back to the parent process converted into numpy arrays, as ROOT objects cannot
+    be transferred between processes.
+
+    :param task: filename, pt-hard bin and file format
+    :type task: tuple
+    :return: converted histograms and weight histograms
+    :rtype: dict
+    """
+    filename, pthatbin, isNew = task
+    reader = LegoTrainFileReader(filename, isMC = True, isNew = isNew)
+    reader.SetReadWeights()
+    filecontent = reader.ReadHistograms()
+    result = {"spectra":[], "weights":{}}
+    for name in filecontent["spectra"].keys():
+        converted = ConvertHistogram(filecontent["spectra"][name])
+        if converted:
+            result["spectra"].append((name, converted[0], converted[1]))
+    for tag, hist in filecontent["weights"].iteritems():
+        if hist:
+            result["weights"][tag] = ConvertHistogram(hist)
+    return result
+
 class MonteCarloDataCollection(object):
     """
     Collection of Monte-Carlo based outputs
     """
 
-    def __init__(self, isPtHat = False):
+    def __init__(self, isPtHat = False, streaming = False):
         """
         Constructor
+
+        :param isPtHat: if true data comes in pt-hat bins, weighted by the cross section
+        :type isPtHat: bool
+        :param streaming: if true data in pt-hat bins is weighted and added to the sum when
+                          it is added to the collection, and not kept per pt-hat bin
+        :type streaming: bool
         """
         self.__weighthandler  = None
         if isPtHat:
             self.__weighthandler = WeightHandler()
         self.__data = {"All":None}
+        self.__streaming = streaming
+        self.__summed = None
         
     def AddData(self, results, pthatbin = -1,  weightdata = None):
         """
-        Add new data (with or without pthat bins)
+        Add new data (with or without pthat bins). In streaming mode data in pt-hat bins is
+        scaled by the weight of the bin and added to the running sum.
         """ 
         if pthatbin >= 0:
-            self.__data[pthatbin] = results
             self.__weighthandler.AddPtHatBin(pthatbin, weightdata["crosssection"], weightdata["trials"])
+            if self.__streaming:
+                self.__AddToSum(pthatbin, results)
+            else:
+                self.__data[pthatbin] = results
         else:
             self.__data["All"] = results
             
+    def __AddToSum(self, pthatbin, results):
+        """
+        Weight data of a pt-hat bin and add it to the running sum. The data of the first
+        bin is used as the sum itself, so no copy is made.
+        """
+        self.__weighthandler.ReweightSpectrum(pthatbin, results)
+        if not self.__summed:
+            self.__summed = results
+        else:
+            self.__summed.Add(results)
+            
     def GetData(self, pthatbin = -1):
         """
-        Access to data (if necessary in a given pt-hat bin
+        Access to data (if necessary in a given pt-hat bin. In streaming mode data of the
+        pt-hat bins is not available (None).
         """
         if pthatbin >= 0:
-            return self.__data[pthatbin]
+            return self.__data.get(pthatbin)
         return self.__data["All"]
     
     def GetWeigthHandler(self):
@@ -51,11 +103,14 @@ class MonteCarloDataCollection(object):
     
     def SumWeightedData(self):
         """
-        Sum weighted containers from the different pthat bins
+        Sum weighted containers from the different pthat bins. In streaming mode the
+        running sum is returned.
         """
         if not self.__weighthandler:
             print "No weight handler"
             return None
+        if self.__streaming:
+            return self.__summed
         summer = SpectraSum()
         for pthatbin in self.__data.keys():
             if pthatbin == "All":
@@ -69,38 +124,105 @@ class MonteCarloFileHandler(object):
     Class handling the reading of one file or a set of MonteCarlo files
     """
     
-    def __init__(self, hasPtHardBins = False):
+    def __init__(self, hasPtHardBins = False, streaming = False):
         """
         Constructor
+
+        :param hasPtHardBins: if true files come in pt-hard bins
+        :type hasPtHardBins: bool
+        :param streaming: if true pt-hard bins are weighted and summed directly after reading
+                          (see MonteCarloDataCollection), keeping only one bin and the sum in memory
+        :type streaming: bool
         """
-        self.__datacollection = MonteCarloDataCollection(hasPtHardBins)
+        self.__datacollection = MonteCarloDataCollection(hasPtHardBins, streaming)
         self.__histlist = ""
+        self.__nworkers = 1
+        self.__streaming = streaming
+        self.__pending = []
+        
+    def SetNumberOfWorkers(self, nworkers):
+        """
+        Set the number of worker processes used to read files in pt-hard bins. With more than
+        one worker files are queued and read in parallel when the collection is accessed.
+
+        :param nworkers: number of worker processes
+        :type nworkers: int
+        """
+        self.__nworkers = nworkers
         
     def GetCollection(self):
         """
-        Access to the file collection
+        Access to the file collection. Files still queued for parallel reading are read first.
         """
+        self.__ReadPending()
         return self.__datacollection
     
     def AddFile(self, filename, pthatbin = -1, isNew = True):
         """
         Handle new file
         """
+        if pthatbin >= 0 and self.__nworkers > 1:
+            self.__pending.append((filename, pthatbin, isNew))
+            return
         reader = LegoTrainFileReader(filename, isMC = True, isNew = isNew)
         if pthatbin >= 0:
             reader.SetReadWeights() 
         self.__datacollection.AddData(reader.ReadFile(), pthatbin, reader.GetWeightHistograms())
         
+    def __ReadPending(self):
+        """
+        Read queued files in pt-hard bins in parallel. The histograms are read and converted
+        in the worker processes, the result structures are built in the parent process in the
+        order in which the files were added. In streaming mode files are read in batches of
+        the number of workers, so that only one batch is kept in memory.
+        """
+        if not len(self.__pending):
+            return
+        tasks = self.__pending
+        self.__pending = []
+        batchsize = self.__nworkers if self.__streaming else len(tasks)
+        pool = Pool(min(self.__nworkers, len(tasks)))
+        try:
+            for first in range(0, len(tasks), batchsize):
+                batch = tasks[first:first + batchsize]
+                for task, content in zip(batch, pool.map(_ReadPtHardBin, batch)):
+                    self.__AddConverted(task, content)
+        finally:
+            pool.close()
+            pool.join()
+            
+    def __AddConverted(self, task, content):
+        """
+        Build the result structure of one pt-hard bin from the converted histograms
+        and add it to the collection
+        """
+        filename, pthatbin, isNew = task
+        histograms = OrderedDict()
+        for name, description, arrays in content["spectra"]:
+            histograms[name] = BuildHistogram(description, arrays)
+        weights = {}
+        for tag, converted in content["weights"].iteritems():
+            weights[tag] = BuildHistogram(converted[0], converted[1])
+        reader = LegoTrainFileReader(filename, isMC = True, isNew = isNew)
+        reader.SetReadWeights()
+        self.__datacollection.AddData(reader.BuildResultData({"spectra":histograms, "weights":weights}), pthatbin, reader.GetWeightHistograms())
+        
 class MonteCarloFileMerger(object):
     """
     Class merging Monte-Carlo files in pt-hat bins, weighted by the cross section
     """
     
-    def __init__(self):
+    def __init__(self, nworkers = 1, streaming = True):
         """
         Constructor
+
+        :param nworkers: number of worker processes reading the files
+        :type nworkers: int
+        :param streaming: if true bins are weighted and summed one after the other
+        :type streaming: bool
         """
-        self.__reader = MonteCarloFileHandler(True)
+        self.__reader = MonteCarloFileHandler(True, streaming)
+        self.__reader.SetNumberOfWorkers(nworkers)
         
     def AddFile(self, filename, pthatbin):
         """
@@ -112,11 +234,11 @@ class MonteCarloFileMerger(object):
         summed = self.__reader.GetCollection().SumWeightedData()
         summed.Write(outputfile)
         
-def MergePtHardBins(outputfile, basedir, firstbin, lastbin):
+def MergePtHardBins(outputfile, basedir, firstbin, lastbin, nworkers = 1):
     """
     Merge files from different pt-hard bins, weighted by the cross section, into one file
     """
-    merger = MonteCarloFileMerger()
+    merger = MonteCarloFileMerger(nworkers)
     for pthardbin in range(firstbin, lastbin+1):
         merger.AddFile("%s/%02d/AnalysisResults.root" %(basedir, pthardbin), pthardbin)
     merger.MergeAndWrite(outputfile)
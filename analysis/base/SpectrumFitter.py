@@ -5,15 +5,80 @@ Created on 17.09.2014
 '''
 
 from ROOT import TF1, TGraph, TH1F
+import hashlib
+import numpy as np
+from scipy.optimize import least_squares
+from base.Helper import GetHistogramArrays
+
+# Nodes and weights of the Gauss-Legendre quadrature, cached by order
+_gGaussLegendreCache = {}
+
+def GetGaussLegendreRule(order):
+    """
+    Get nodes and weights of the Gauss-Legendre quadrature of a given order on [-1, 1]
+    (computed once per order)
+    """
+    if not order in _gGaussLegendreCache:
+        _gGaussLegendreCache[order] = np.polynomial.legendre.leggauss(order)
+    return _gGaussLegendreCache[order]
+
+def GaussLegendreIntegral(function, xmin, xmax, order = 16, npanels = 32):
+    """
+    Integrate a vectorized function with a composite Gauss-Legendre quadrature. The
+    range is split into panels growing geometrically from xmin, so that steeply falling
+    spectra are integrated precisely also over wide ranges. Integration limits can be
+    arrays, the integrals for all ranges are evaluated in one go.
+
+    :param function: function evaluated on arrays
+    :type function: callable
+    :param xmin: lower limit(s)
+    :type xmin: float or numpy.ndarray
+    :param xmax: upper limit(s)
+    :type xmax: float or numpy.ndarray
+    :param order: order of the quadrature per panel
+    :type order: int
+    :param npanels: number of panels
+    :type npanels: int
+    :return: integral(s)
+    :rtype: float or numpy.ndarray
+    """
+    nodes, weights = GetGaussLegendreRule(order)
+    xmin, xmax = np.broadcast_arrays(np.asarray(xmin, dtype = float), np.asarray(xmax, dtype = float))
+    length = xmax - xmin
+    # panel edges xmin + ((1 + length)^(i/npanels) - 1)
+    fractions = np.arange(npanels + 1, dtype = float) / npanels
+    edges = xmin[..., np.newaxis] + np.sign(length)[..., np.newaxis] * (np.power(1. + np.abs(length)[..., np.newaxis], fractions) - 1.)
+    lower = edges[..., :-1]
+    halfwidth = 0.5 * (edges[..., 1:] - lower)
+    points = (lower + halfwidth)[..., np.newaxis] + halfwidth[..., np.newaxis] * nodes
+    result = np.sum(halfwidth * np.sum(weights * function(points), axis = -1), axis = -1)
+    return result if result.ndim else float(result)
 
 class FitModel:
+    """
+    Fit model: the ROOT function (for drawing) together with a vectorized evaluation
+    of the same formula used by the fit backend. Parameter settings are kept on both sides.
+    """
     
-    def __init__(self):
+    def __init__(self, npar = 0):
         self._model = None
+        self._formula = ""
+        self._npar = npar
+        self._parameters = np.zeros(npar)
+        self._errors = np.zeros(npar)
+        self._limits = {}
+        self._fixed = set()
+        self._initialised = set()
         
     def GetFunction(self):
         return self._model
     
+    def GetFormula(self):
+        return self._formula
+    
+    def GetNumberOfParameters(self):
+        return self._npar
+    
     def SetFunctionName(self, name):
         self._model.SetName(name)
         
@@ -22,51 +87,218 @@ class FitModel:
     
     def SetParLimits(self, parnum, parmin, parmax):
         self._model.SetParLimits(parnum, parmin, parmax)
+        self._limits[parnum] = (parmin, parmax)
         
     def SetParameter(self, parnum, parval):
         self._model.SetParameter(parnum, parval)
+        self._parameters[parnum] = parval
+        self._initialised.add(parnum)
         
     def FixParameter(self, parnum, parval):
         self._model.FixParameter(parnum, parval)
+        self._parameters[parnum] = parval
+        self._initialised.add(parnum)
+        self._fixed.add(parnum)
         
     def GetParValue(self, parnum):
-        return self._model.GetParameter(parnum)
+        return self._parameters[parnum]
+    
+    def GetParError(self, parnum):
+        return self._errors[parnum]
+    
+    def GetParameters(self):
+        return self._parameters.copy()
+    
+    def GetParLimits(self, parnum):
+        return self._limits.get(parnum, (-np.inf, np.inf))
+    
+    def IsFixed(self, parnum):
+        return parnum in self._fixed
+    
+    def IsInitialised(self, parnum):
+        return parnum in self._initialised
+    
+    def SetFitParameters(self, parameters, errors = None):
+        """
+        Set parameters (and errors) obtained from a fit, also in the ROOT function
+        """
+        self._parameters = np.array(parameters, dtype = float)
+        self._errors = np.array(errors, dtype = float) if errors is not None else np.zeros(self._npar)
+        for parnum in range(0, self._npar):
+            self._model.SetParameter(parnum, float(self._parameters[parnum]))
+            self._model.SetParError(parnum, float(self._errors[parnum]))
+            
+    def SyncFromFunction(self):
+        """
+        Take the parameters from the ROOT function (after a fit with ROOT)
+        """
+        self._parameters = np.array([self._model.GetParameter(parnum) for parnum in range(0, self._npar)])
+        self._errors = np.array([self._model.GetParError(parnum) for parnum in range(0, self._npar)])
+    
+    def InitialiseParameters(self, x, y):
+        """
+        Estimate start values of parameters which were not set from the data points.
+        Nothing to be done in the general case.
+        """
+        pass
+    
+    def Evaluate(self, x, parameters = None):
+        """
+        Evaluate the model on an array of x values. Models without vectorized formula
+        evaluate the ROOT function point by point.
+        """
+        return self._EvalFunction(lambda function, value: function.Eval(value), parameters, x)
+        
+    def Integral(self, xmin, xmax, parameters = None):
+        """
+        Integral of the model between xmin and xmax (can be arrays). Uses Gauss-Legendre
+        quadrature, models with closed-form integral overwrite this. Models without
+        vectorized formula use the integral of the ROOT function.
+        """
+        if self.Evaluate.__func__ is FitModel.Evaluate.__func__:
+            return self._EvalFunction(lambda function, lower, upper: function.Integral(lower, upper), parameters, xmin, xmax)
+        if parameters is None:
+            parameters = self._parameters
+        return GaussLegendreIntegral(lambda x: self.Evaluate(x, parameters), xmin, xmax)
+    
+    def _GetParameters(self, parameters):
+        return self._parameters if parameters is None else parameters
+    
+    def _EvalFunction(self, evaluator, parameters, *values):
+        """
+        Apply an evaluator (function, values) to the ROOT function element-wise on arrays
+        of values. Other parameters than the ones of the model are set in the ROOT function
+        only during the evaluation.
+        """
+        if parameters is not None:
+            for parnum in range(0, self._npar):
+                self._model.SetParameter(parnum, float(parameters[parnum]))
+        try:
+            result = np.vectorize(lambda *args: evaluator(self._model, *[float(arg) for arg in args]), otypes = [float])(*values)
+        finally:
+            if parameters is not None:
+                for parnum in range(0, self._npar):
+                    self._model.SetParameter(parnum, float(self._parameters[parnum]))
+        return result[()]
+    
+    def _InitialiseFromLinearFit(self, x, y):
+        """
+        Initialise parameters 0 and 1 from a straight line fit (parameter 0 is the
+        offset, parameter 1 the slope) of not yet initialised parameters
+        """
+        if len(x) < 2 or (0 in self._initialised and 1 in self._initialised):
+            return
+        slope, offset = np.polyfit(x, y, 1)
+        for parnum, value in [(0, offset), (1, slope)]:
+            if not parnum in self._initialised:
+                self._parameters[parnum] = value
         
 class ExpoModel(FitModel):
     
     def __init__(self):
+        FitModel.__init__(self, 2)
         self._model = TF1("expoBin", "expo", 0, 100)
+        self._formula = "expo"
+        
+    def InitialiseParameters(self, x, y):
+        selected = y > 0
+        self._InitialiseFromLinearFit(x[selected], np.log(y[selected]))
+        
+    def Evaluate(self, x, parameters = None):
+        p = self._GetParameters(parameters)
+        return np.exp(p[0] + p[1] * np.asarray(x, dtype = float))
+    
+    def Integral(self, xmin, xmax, parameters = None):
+        p = self._GetParameters(parameters)
+        xmin = np.asarray(xmin, dtype = float)
+        xmax = np.asarray(xmax, dtype = float)
+        if p[1] == 0:
+            return np.exp(p[0]) * (xmax - xmin)
+        return np.exp(p[0]) / p[1] * (np.exp(p[1] * xmax) - np.exp(p[1] * xmin))
     
 class PowerLawModel(FitModel):
     
     def __init__(self):
+        FitModel.__init__(self, 2)
         self._model = TF1("fitfunctionPowerlaw", "[0] * TMath::Power(x,[1])", 0., 100.)
+        self._formula = "[0] * TMath::Power(x,[1])"
+        
+    def InitialiseParameters(self, x, y):
+        selected = (x > 0) & (y > 0)
+        self._InitialiseFromLinearFit(np.log(x[selected]), np.log(y[selected]))
+        if not 0 in self._initialised:
+            self._parameters[0] = np.exp(self._parameters[0])
+        
+    def Evaluate(self, x, parameters = None):
+        p = self._GetParameters(parameters)
+        return p[0] * np.power(np.asarray(x, dtype = float), p[1])
+    
+    def Integral(self, xmin, xmax, parameters = None):
+        p = self._GetParameters(parameters)
+        xmin = np.asarray(xmin, dtype = float)
+        xmax = np.asarray(xmax, dtype = float)
+        if p[1] == -1.:
+            return p[0] * (np.log(xmax) - np.log(xmin))
+        return p[0] / (p[1] + 1.) * (np.power(xmax, p[1] + 1.) - np.power(xmin, p[1] + 1.))
+    
+class PolynomialModel(FitModel):
+    
+    def __init__(self, order = 1):
+        FitModel.__init__(self, order + 1)
+        self._formula = "pol%d" %(order)
+        self._model = TF1("fitfunctionPol%d" %(order), self._formula, 0., 100.)
+        
+    def InitialiseParameters(self, x, y):
+        if len(x) <= self._npar - 1 or len(self._initialised) == self._npar:
+            return
+        coefficients = np.polyfit(x, y, self._npar - 1)[::-1]
+        for parnum in range(0, self._npar):
+            if not parnum in self._initialised:
+                self._parameters[parnum] = coefficients[parnum]
+        
+    def Evaluate(self, x, parameters = None):
+        p = self._GetParameters(parameters)
+        return np.polyval(p[::-1], np.asarray(x, dtype = float))
+    
+    def Integral(self, xmin, xmax, parameters = None):
+        p = self._GetParameters(parameters)
+        integral = np.concatenate([[0.], p / np.arange(1., self._npar + 1.)])[::-1]
+        return np.polyval(integral, np.asarray(xmax, dtype = float)) - np.polyval(integral, np.asarray(xmin, dtype = float))
     
 class ModifiedHagedornModel(FitModel):
     
     def __init__(self):
+        FitModel.__init__(self, 5)
         self._model = TF1("fitfunctionModHagedorn", "[0]/TMath::Power(TMath::Exp(-[1]*x - [2]*x*x) + x/[3], [4])", 0., 100.)
+        self._formula = "[0]/TMath::Power(TMath::Exp(-[1]*x - [2]*x*x) + x/[3], [4])"
         self._model.SetParName(0, "A")
         self._model.SetParName(1, "a")
         self._model.SetParName(2, "b")
         self._model.SetParName(3, "p0")
         self._model.SetParName(4, "n")
         # Force all parameters to be positive 
-        self._model.SetParLimits(0, 1e-5, 10000)
-        self._model.SetParLimits(1, 1e-3, 1)
-        self._model.SetParLimits(2, 1e-3, 1)
-        self._model.SetParLimits(3, 1e-3, 1)
-        self._model.SetParLimits(4, 1e-5, 10)
-        self._model.SetParameter(0, 100)
-        self._model.SetParameter(1, 0.5)
-        self._model.SetParameter(2, 0.5)
-        self._model.SetParameter(3, 0.5)
-        self._model.SetParameter(4, 5.)
+        self.SetParLimits(0, 1e-5, 10000)
+        self.SetParLimits(1, 1e-3, 1)
+        self.SetParLimits(2, 1e-3, 1)
+        self.SetParLimits(3, 1e-3, 1)
+        self.SetParLimits(4, 1e-5, 10)
+        self.SetParameter(0, 100)
+        self.SetParameter(1, 0.5)
+        self.SetParameter(2, 0.5)
+        self.SetParameter(3, 0.5)
+        self.SetParameter(4, 5.)
+        
+    def Evaluate(self, x, parameters = None):
+        p = self._GetParameters(parameters)
+        x = np.asarray(x, dtype = float)
+        return p[0] / np.power(np.exp(-p[1] * x - p[2] * x * x) + x / p[3], p[4])
         
 class ExpoModifiedHagedornModel(FitModel):
     
     def __init__(self):
+        FitModel.__init__(self, 7)
         self._model = TF1("fitfunctionModHagedorn", "expo(0) + [2]/TMath::Power(TMath::Exp(-[3]*x - [4]*x*x) + x/[5], [6])", 0., 100.)
+        self._formula = "expo(0) + [2]/TMath::Power(TMath::Exp(-[3]*x - [4]*x*x) + x/[5], [6])"
         self._model.SetParName(2, "A");
         self._model.SetParName(3, "a");
         self._model.SetParName(4, "b");
@@ -74,16 +306,152 @@ class ExpoModifiedHagedornModel(FitModel):
         self._model.SetParName(6, "n");
   
         # Force all parameters to be positive 
-        self._model.SetParLimits(2, 1e-5, 1000000);
-        self._model.SetParLimits(3, 1e-7, 1000);
-        self._model.SetParLimits(4, 1e-7, 1000);
-        self._model.SetParLimits(3, 1e-7, 1000);
-        self._model.SetParLimits(5, 1e-7, 1000);
-        self._model.SetParameter(2, 100);
-        self._model.SetParameter(3, 0.5);
-        self._model.SetParameter(4, 0.5);
-        self._model.SetParameter(5, 0.5);
-        self._model.SetParameter(6, 5.);
+        self.SetParLimits(2, 1e-5, 1000000);
+        self.SetParLimits(3, 1e-7, 1000);
+        self.SetParLimits(4, 1e-7, 1000);
+        self.SetParLimits(3, 1e-7, 1000);
+        self.SetParLimits(5, 1e-7, 1000);
+        self.SetParameter(2, 100);
+        self.SetParameter(3, 0.5);
+        self.SetParameter(4, 0.5);
+        self.SetParameter(5, 0.5);
+        self.SetParameter(6, 5.);
+        
+    def Evaluate(self, x, parameters = None):
+        p = self._GetParameters(parameters)
+        x = np.asarray(x, dtype = float)
+        return np.exp(p[0] + p[1] * x) + p[2] / np.power(np.exp(-p[3] * x - p[4] * x * x) + x / p[5], p[6])
+
+class FitResult(object):
+    """
+    Result of a fit: parameters, errors, covariance matrix and chi2
+    """
+    
+    def __init__(self, parameters, errors, covariance, chi2, ndf, status = 0):
+        """
+        Constructor
+        
+        :param parameters: best fit parameters
+        :type parameters: numpy.ndarray
+        :param errors: parameter errors
+        :type errors: numpy.ndarray
+        :param covariance: covariance matrix of the parameters (0 for fixed parameters)
+        :type covariance: numpy.ndarray
+        :param chi2: chi2 of the fit
+        :type chi2: float
+        :param ndf: number of degrees of freedom
+        :type ndf: int
+        :param status: fit status (0 if successful)
+        :type status: int
+        """
+        self.parameters = np.asarray(parameters, dtype = float)
+        self.errors = np.asarray(errors, dtype = float)
+        self.covariance = np.asarray(covariance, dtype = float)
+        self.chi2 = float(chi2)
+        self.ndf = int(ndf)
+        self.status = int(status)
+        
+    def GetReducedChi2(self):
+        return self.chi2 / self.ndf if self.ndf > 0 else 0.
+        
+    def __str__(self):
+        return "chi2/ndf = %f/%d, status %d, parameters: %s" %(self.chi2, self.ndf, self.status, \
+                ", ".join(["%e +- %e" %(value, error) for value, error in zip(self.parameters, self.errors)]))
+        
+def GetFitPoints(data, rangemin, rangemax):
+    """
+    Select the points used in a chi2 fit: bins with center inside the fit range and non-zero error
+    
+    :param data: histogram (TH1) or tuple of arrays (bin edges, contents, errors) with under- and overflow bins
+    :return: tuple of arrays x, y, error of the selected points
+    :rtype: tuple
+    """
+    edges, contents, errors = data if isinstance(data, tuple) else GetHistogramArrays(data)
+    centers = 0.5 * (edges[:-1] + edges[1:])
+    contents = contents[1:-1]
+    errors = errors[1:-1]
+    selected = (centers >= rangemin) & (centers <= rangemax) & (errors > 0)
+    return centers[selected], contents[selected], errors[selected]
+
+def MakeFitKey(model, data, rangemin, rangemax):
+    """
+    Build a key identifying a fit from the content of the data (bin edges, contents and errors),
+    the model formula, the initial parameters, the parameter limits and fixed parameters and
+    the fit range. Fits with the same key give the same result.
+    
+    :param model: the fit model (before the fit)
+    :type model: FitModel
+    :param data: tuple of arrays (bin edges, contents, errors) with under- and overflow bins
+    :type data: tuple
+    :param rangemin: lower limit of the fit range
+    :type rangemin: float
+    :param rangemax: upper limit of the fit range
+    :type rangemax: float
+    :return: key of the fit
+    :rtype: str
+    """
+    keyhash = hashlib.sha1()
+    for values in data:
+        keyhash.update(np.ascontiguousarray(values, dtype = np.float64).tobytes())
+    keyhash.update("%s|%r|%r|%s" %(model.GetFormula(), float(rangemin), float(rangemax), model.GetParameters().tolist()))
+    for parnum in range(0, model.GetNumberOfParameters()):
+        keyhash.update("|%r|%s|%s" %(model.GetParLimits(parnum), model.IsFixed(parnum), model.IsInitialised(parnum)))
+    return keyhash.hexdigest()
+
+def FitArrays(model, x, y, ey):
+    """
+    Chi2 fit of the model to data points using scipy least squares, respecting parameter
+    limits and fixed parameters of the model. The model keeps the fitted parameters.
+    
+    :param model: the fit model
+    :type model: FitModel
+    :param x: x-values of the points
+    :type x: numpy.ndarray
+    :param y: y-values of the points
+    :type y: numpy.ndarray
+    :param ey: errors of the points
+    :type ey: numpy.ndarray
+    :return: the fit result
+    :rtype: FitResult
+    """
+    npar = model.GetNumberOfParameters()
+    model.InitialiseParameters(x, y)
+    start = model.GetParameters()
+    free = [parnum for parnum in range(0, npar) if not model.IsFixed(parnum)]
+    lower = np.array([model.GetParLimits(parnum)[0] for parnum in free], dtype = float)
+    upper = np.array([model.GetParLimits(parnum)[1] for parnum in free], dtype = float)
+    # parameters with limits min >= max (i.e. not set) are unbounded
+    unbounded = lower >= upper
+    lower[unbounded] = -np.inf
+    upper[unbounded] = np.inf
+    
+    def MakeParameters(freeparameters):
+        parameters = start.copy()
+        parameters[free] = freeparameters
+        return parameters
+    def Residuals(freeparameters):
+        return (model.Evaluate(x, MakeParameters(freeparameters)) - y) / ey
+    
+    status = 0
+    covariance = np.zeros((npar, npar))
+    if len(free) and len(x) >= len(free):
+        with np.errstate(all = "ignore"):
+            fit = least_squares(Residuals, np.clip(start[free], lower, upper), bounds = (lower, upper), method = "trf", x_scale = "jac")
+        if not fit.success:
+            print "Fit did not converge: %s" %(fit.message)
+            status = 1
+        parameters = MakeParameters(fit.x)
+        freecovariance = np.linalg.pinv(np.dot(fit.jac.T, fit.jac))
+        covariance[np.ix_(free, free)] = freecovariance
+        chi2 = 2. * fit.cost
+    else:
+        print "Not enough points (%d) to fit %d free parameters" %(len(x), len(free))
+        status = 2
+        parameters = start
+        chi2 = np.sum(((model.Evaluate(x, parameters) - y) / ey) ** 2)
+    result = FitResult(parameters, np.sqrt(np.diag(covariance)), covariance, chi2, len(x) - len(free), status)
+    model.SetFitParameters(result.parameters, result.errors)
+    return result
 
 class SpectrumFitter:
     '''
@@ -98,6 +466,31 @@ class SpectrumFitter:
         def __str_(self):
             return "Fit of the spectrum not yet performed"
 
+    # Fit backend used by default: "root" (TH1::Fit) or "scipy" (least squares on arrays)
+    DefaultBackend = "root"
+    # Cache of fit results used by default (None: no cache)
+    DefaultFitCache = None
+    
+    @staticmethod
+    def SetDefaultBackend(backend):
+        """
+        Set the fit backend used by all fitters created afterwards
+
+        :param backend: "root" (TH1::Fit) or "scipy" (least squares on arrays)
+        :type backend: str
+        """
+        SpectrumFitter.DefaultBackend = backend
+    
+    @staticmethod
+    def SetDefaultFitCache(fitcache):
+        """
+        Set the cache of fit results used by all fitters created afterwards
+
+        :param fitcache: cache of fit results (None to disable caching)
+        :type fitcache: FitCache
+        """
+        SpectrumFitter.DefaultFitCache = fitcache
+
     def __init__(self, name, spectrum, fitmodel = None):
         '''
         Constructor
@@ -108,43 +501,113 @@ class SpectrumFitter:
         if not self._model:
             self._model = PowerLawModel()
         self._fitDone = False
+        self._backend = SpectrumFitter.DefaultBackend
+        self._fitresult = None
+        self._fitrange = None
+        self._fitcache = SpectrumFitter.DefaultFitCache
         
     def SetFitModel(self, fitmodel):
         self._model = fitmodel
         
+    def SetFitBackend(self, backend):
+        """
+        Select the fit backend: "scipy" (least squares on arrays) or "root" (TH1::Fit)
+        """
+        self._backend = backend
+        
+    def GetFitBackend(self):
+        return self._backend
+        
+    def SetFitCache(self, fitcache):
+        """
+        Set the cache of fit results (scipy backend only). Fits of identical data with identical
+        model settings and range are taken from the cache.
+        """
+        self._fitcache = fitcache
+        
+    def SetFitRange(self, rangemin, rangemax):
+        """
+        Set the fit range used when the fit is run outside (i.e. by the FitDriver)
+        """
+        self._fitrange = (rangemin, rangemax)
+        
+    def GetFitRange(self):
+        return self._fitrange
+    
+    def GetFitModel(self):
+        return self._model
+        
     def DoFit(self, rangemin, rangemax = 50):
-        self._data.Fit(self._model.GetFunction(), "N", "", rangemin, rangemax)
+        self._fitrange = (rangemin, rangemax)
+        if self._backend == "root":
+            self._data.Fit(self._model.GetFunction(), "N", "", rangemin, rangemax)
+            self._model.SyncFromFunction()
+            self._fitDone = True
+        else:
+            data = self._data if isinstance(self._data, tuple) else GetHistogramArrays(self._data)
+            fitkey = None
+            fitresult = None
+            if self._fitcache:
+                fitkey = MakeFitKey(self._model, data, rangemin, rangemax)
+                fitresult = self._fitcache.Read(fitkey)
+            if not fitresult:
+                x, y, ey = GetFitPoints(data, rangemin, rangemax)
+                fitresult = FitArrays(self._model, x, y, ey)
+                if self._fitcache:
+                    self._fitcache.Write(fitkey, fitresult)
+            self.SetFitResult(fitresult)
+        
+    def SetFitResult(self, fitresult):
+        """
+        Take over the result of a fit done outside (i.e. in a worker process of the FitDriver)
+        
+        :param fitresult: result of the fit of the model to the data of this fitter
+        :type fitresult: FitResult
+        """
+        self._fitresult = fitresult
+        self._model.SetFitParameters(fitresult.parameters, fitresult.errors)
+        self._model.GetFunction().SetChisquare(fitresult.chi2)
+        self._model.GetFunction().SetNDF(fitresult.ndf)
         self._fitDone = True
         
+    def GetFitResult(self):
+        """
+        Get the result of the fit (only for the scipy backend)
+        """
+        if not self._fitDone:
+            raise self.SpectrumFitterException()
+        return self._fitresult
+        
     def GetParameterisation(self):
         if not self._fitDone:
             raise self.SpectrumFitterException()
         return self._model.GetFunction()
     
     def GetParameterisedValueAt(self, x):
+        """
+        Evaluate the parameterisation at x (scalar or array)
+        """
         if not self._fitDone:
             raise self.SpectrumFitterException()
-        return self._model.GetFunction().Eval(x)
+        return self._model.Evaluate(x)
    
     def CalculateIntegralAbove(self, x):
         if not self._fitDone:
             raise self.SpectrumFitterException()
-        return self._model.GetFunction().Integral(x, 10000)
+        return self._model.Integral(x, 10000)
    
     def CalculateNormalisedIntegralAbove(self, x):
         """
-        Calculate per-event yield above a certain pt, done as sum in 1 GeV bins of the 
-        binned content from a min. pt to a max. pt.
+        Calculate per-event yield above a certain pt, done as sum in 10 GeV steps of the
+        integral divided by 10 from a min. pt to a max. pt (1000 GeV). The steps are
+        contiguous, so the sum is evaluated as a single integral. x can be an array.
         """
         if not self._fitDone:
             raise self.SpectrumFitterException()
         maxint = 1000.
-        ptstart = x
-        yieldval = 0
-        while ptstart < maxint:
-            yieldval += self._model.GetFunction().Integral(ptstart, ptstart+10)/10.
-            ptstart += 10
-        return yieldval
+        x = np.asarray(x, dtype = float)
+        nsteps = np.maximum(np.ceil((maxint - x) / 10.), 0.)
+        return np.where(nsteps > 0, self._model.Integral(x, x + 10. * nsteps) / 10., 0.)
             
     def MakeBinnedParameterisation(self, nbins, xmin, xmax, normBinWidth = False):
         """
@@ -152,14 +615,9 @@ class SpectrumFitter:
         normalised by the bin width
         """
         result = TH1F("binned%s" %(self._name), "", nbins, xmin, xmax)
+        values = self.__CalculateBinValues(np.linspace(xmin, xmax, nbins+1), normBinWidth)
         for mybin in range(2, result.GetXaxis().GetNbins()+1):
-            value = 0
-            if normBinWidth:
-                value = self.CalculateBinMean(result.GetXaxis().GetBinLowEdge(mybin),result.GetXaxis().GetBinUpEdge(mybin))
-            else:
-                value = self.CalculateIntegral(result.GetXaxis().GetBinLowEdge(mybin),result.GetXaxis().GetBinUpEdge(mybin))
-            #print "min %f, max %f, value %e" %(result.GetXaxis().GetBinLowEdge(mybin),result.GetXaxis().GetBinUpEdge(mybin), value)
-            result.SetBinContent(mybin, value)
+            result.SetBinContent(mybin, values[mybin-1])
         return result
     
     def MakeBinnedParameterisationDefault(self, normBinWidth = False):
@@ -168,26 +626,31 @@ class SpectrumFitter:
         normalised by the bin width
         """
         result = TH1F("binned%s" %(self._name), "", self._data.GetXaxis().GetNbins(), self._data.GetXaxis().GetXbins().GetArray())
+        edges = np.array([result.GetXaxis().GetBinLowEdge(mybin) for mybin in range(1, result.GetXaxis().GetNbins()+2)])
+        values = self.__CalculateBinValues(edges, normBinWidth)
         for mybin in range(2, result.GetXaxis().GetNbins()+1):
-            value = 0
-            if normBinWidth:
-                value = self.CalculateBinMean(result.GetXaxis().GetBinLowEdge(mybin),result.GetXaxis().GetBinUpEdge(mybin))
-            else:
-                value = self.CalculateIntegral(result.GetXaxis().GetBinLowEdge(mybin),result.GetXaxis().GetBinUpEdge(mybin))
-            #print "min %f, max %f, value %e" %(result.GetXaxis().GetBinLowEdge(mybin),result.GetXaxis().GetBinUpEdge(mybin), value)
-            result.SetBinContent(mybin, value)
+            result.SetBinContent(mybin, values[mybin-1])
             result.SetBinError(mybin, 0)
         return result
+    
+    def __CalculateBinValues(self, edges, normBinWidth):
+        """
+        Calculate integrals (or mean values if normBinWidth is True) of the parameterisation
+        in all bins defined by the bin edges at once
+        """
+        if normBinWidth:
+            return self.CalculateBinMean(edges[:-1], edges[1:])
+        return self.CalculateIntegral(edges[:-1], edges[1:])
             
     def CalculateIntegral(self, xmin, xmax):
         if not self._fitDone:
             raise self.SpectrumFitterException()
-        return self._model.GetFunction().Integral(xmin, xmax)
+        return self._model.Integral(xmin, xmax)
     
     def CalculateBinMean(self, xmin, xmax):
         if not self._fitDone:
             raise self.SpectrumFitterException()
-        return self._model.GetFunction().Integral(xmin, xmax)/(xmax - xmin)
+        return self._model.Integral(xmin, xmax)/(np.asarray(xmax, dtype = float) - xmin)
                 
     def GetFitFunction(self):
         return self._model.GetFunction()
@@ -239,14 +702,26 @@ class ConstrainedSpectrumFitter(SpectrumFitter):
         
 class MinBiasFitter(SpectrumFitter):
     
-    def __init__(self, name, data, fitmin = 15., model = None):
-        SpectrumFitter.__init__(self, name, data)
-        self.DoFit(fitmin, 50.)
+    def __init__(self, name, data, fitmin = 15., model = None, doFit = True):
+        """
+        Constructor, fitting the spectrum between fitmin and 50 GeV/c unless doFit is False
+        (fit run by the FitDriver)
+        """
+        SpectrumFitter.__init__(self, name, data, model)
+        self.SetFitRange(fitmin, 50.)
+        if doFit:
+            self.DoFit(fitmin, 50.)
         
 class TriggeredSpectrumFitter(SpectrumFitter):
     
-    def __init__(self, name, data, model = None):
-        SpectrumFitter.__init__(self, name, data)
-        self.DoFit(50., 90.)
+    def __init__(self, name, data, model = None, doFit = True):
+        """
+        Constructor, fitting the spectrum between 50 and 90 GeV/c unless doFit is False
+        (fit run by the FitDriver)
+        """
+        SpectrumFitter.__init__(self, name, data, model)
+        self.SetFitRange(50., 90.)
+        if doFit:
+            self.DoFit(50., 90.)
 
         
\ No newline at end of file
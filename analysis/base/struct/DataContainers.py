@@ -3,6 +3,7 @@
 from base.Helper import NormaliseBinWidth
 from base.struct.ClusterTHnSparse import ClusterTHnSparseNew, ClusterTHnSparseOld
 from base.struct.TrackTHnSparse import TrackTHnSparseNew, TrackTHnSparseOld
+from base.struct.THnSparseWrapper import THnSparseCut, THnSparseProjectionRequest
 from base.MergeException import MergeException
 from copy import copy,deepcopy
 from ROOT import TList
@@ -43,7 +44,7 @@ class DataContainer(object):
         Shallow copy constructor
         """
         print "Simple copy called from %s" %(self.__class__)
-        newobject = DataContainer(self.__events, self._spectrum, None)
+        newobject = DataContainer(self._events, self._spectrum, None)
         newobject._Copy(self)
         return newobject
              
@@ -91,7 +92,7 @@ class DataContainer(object):
         """
         Access underlying spectrum container
         """
-        return self.__spectrum
+        return self._spectrum
     
     # Property definitions
     EventHist = property(GetEventHist, fset=SetEventHist)
@@ -143,7 +144,7 @@ class DataContainer(object):
         """
         Scale the underlying spectrum container with the scale factor
         """
-        self.__spectrum.Scale(scalefactor)
+        self._spectrum.Scale(scalefactor)
          
     def GetRootPrimitive(self, name):
         """
@@ -154,7 +155,7 @@ class DataContainer(object):
         events = self._events.GetROOTHisto()
         events.SetName("events")
         result.Add(events)
-        spectrum = self.__spectrum.GetHistogram()
+        spectrum = self._spectrum.GetRootPrimitive()
         spectrum.SetName("spectrum")
         result.Add(spectrum)
         return result
@@ -196,6 +197,72 @@ class DataContainer(object):
             # Normalise by number of events
             projected.Scale(1./self.GetEventCount())
         return projected         
+
+    def MakeProjections(self, dim, selections, doNorm = True):
+        """
+        Make event-normalised projections to 1D for a set of selections in one pass over
+        the spectrum. Each selection is a list of cuts (axis name, minimum, maximum) applied
+        on top of the cuts defined before.
+        
+        :param dim: dimension to project to
+        :type dim: int
+        :param selections: cuts of the selections under the name of the output histogram
+        :type selections: dict
+        :param doNorm: normalise projections by the bin width and the number of events
+        :type doNorm: bool
+        :return: projected histograms under the name of the output histogram
+        :rtype: dict
+        """
+        if not self._spectrum:
+            raise DataContainer.DataException(self._datahistname)
+        if not self._events:
+            raise DataContainer.DataException("EventHist")
+        
+        axisname = self._spectrum.GetAxisDefinition().GetAxisName(dim)
+        requests = []
+        for histname, cuts in selections.iteritems():
+            requests.append(THnSparseProjectionRequest(histname, [axisname], [THnSparseCut(*cut) for cut in cuts]))
+        result = self._spectrum.ProjectionBatch(requests)
+        for projected in result.itervalues():
+            projected.Sumw2()
+            if doNorm:
+                NormaliseBinWidth(projected)
+                projected.Scale(1./self.GetEventCount())
+        return result
+
+    def MakeProjectionsGroupBy(self, dim, groupaxisname, histname = None, doNorm = True):
+        """
+        Make event-normalised projections to 1D for each bin of a categorical axis (i.e.
+        trackcuts, pileup or MBtrigger) in one pass over the spectrum, applying the cuts
+        defined before.
+        
+        :param dim: dimension to project to
+        :type dim: int
+        :param groupaxisname: name of the categorical axis
+        :type groupaxisname: str
+        :param histname: base name of the output histograms
+        :type histname: str
+        :param doNorm: normalise projections by the bin width and the number of events
+        :type doNorm: bool
+        :return: projected histograms under the bin center of the group axis
+        :rtype: OrderedDict
+        """
+        if not self._spectrum:
+            raise DataContainer.DataException(self._datahistname)
+        if not self._events:
+            raise DataContainer.DataException("EventHist")
+        
+        if not histname:
+            histname = "%sProjected%s" %(self._spectrum.GetHistogramName(), groupaxisname)
+        result = self._spectrum.ProjectionGroupBy(histname, self._spectrum.GetAxisDefinition().GetAxisName(dim), groupaxisname)
+        if result is None:
+            raise DataContainer.DataException(groupaxisname)
+        for projected in result.itervalues():
+            projected.Sumw2()
+            if doNorm:
+                NormaliseBinWidth(projected)
+                projected.Scale(1./self.GetEventCount())
+        return result
           
     def Print(self):
         """
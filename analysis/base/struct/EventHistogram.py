@@ -4,12 +4,19 @@ Created on Jan 8, 2015
 @author: markus
 '''
 from copy import copy, deepcopy
+import numpy as np
 
 class EventHistogram(object):
+    """
+    Event counter histogram. Event counts in a vertex range are obtained from a table of
+    cumulative sums over the vertex-z axis, built on first use, so that no projection is
+    needed per request.
+    """
     
     def __init__(self, histo):
         self._histo = histo
         self._vertexrange = {}
+        self._cumulative = None
     
     def GetROOTHisto(self):
         return self._histo
@@ -24,21 +31,52 @@ class EventHistogram(object):
     def GetEventCount(self):
         print "Method virtual - to be implemented by inheriting classes"
         
+    def _BuildCumulativeTable(self):
+        """
+        Build table of cumulative sums over the vertex-z bins (including underflow and
+        overflow) - to be implemented by inheriting classes
+        """
+        pass
+    
+    def _GetCumulativeTable(self):
+        if self._cumulative is None:
+            self._cumulative = self._BuildCumulativeTable()
+        return self._cumulative
+    
+    def _CountInRange(self, cumulative, vertexaxis):
+        """
+        Get the number of events in the vertex range from a row of the cumulative table
+        """
+        first = 0
+        last = len(cumulative) - 2
+        if len(self._vertexrange):
+            first = max(vertexaxis.FindBin(self._vertexrange["min"]), first)
+            last = min(vertexaxis.FindBin(self._vertexrange["max"]), last)
+        if last < first:
+            return 0.
+        return float(cumulative[last + 1] - cumulative[first])
+        
     def _Deepcopy(self, other, memo):
         underlyinghist = other.GetROOTHisto()
         self._histo = deepcopy(underlyinghist, memo)
         self._vertexrange = deepcopy(other.GetVertexRange(), memo)
+        self._cumulative = None
     
     def _Copy(self, other):
         underlyinghist = other.GetROOTHisto()
         self._histo = copy(underlyinghist)
         self._vertexrange = copy(other.GetVertexRange())
+        self._cumulative = None
         
     def Add(self, otherhisto):
+        if isinstance(otherhisto, EventHistogram):
+            otherhisto = otherhisto.GetROOTHisto()
         self._histo.Add(otherhisto)
+        self._cumulative = None
     
     def Scale(self, scalefactor):
         self._histo.Scale(scalefactor)
+        self._cumulative = None
     
         
 class EventHistogramOld(EventHistogram):
@@ -54,16 +92,22 @@ class EventHistogramOld(EventHistogram):
         return self.__usePileupRejected
         
     def GetEventCount(self):
-        if len(self._vertexrange):
-            binMin = self._histo.GetYaxis().FindBin(self._vertexrange["min"])
-            binMax = self._histo.GetYaxis().FindBin(self._vertexrange["max"])
-            eventcounter = self._histo.ProjectionX("eventCounter", binMin, binMax)
-        else:
-            eventcounter = self._histo.ProjectionX("eventcounter")
-        pileupbin = 1
+        pileupbin = 0
         if self.__usePileupRejected:
-            pileupbin = 2
-        return eventcounter.GetBinContent(pileupbin)
+            pileupbin = 1
+        return self._CountInRange(self._GetCumulativeTable()[pileupbin], self._histo.GetYaxis())
+    
+    def _BuildCumulativeTable(self):
+        """
+        One row per pileup state (x-bin 1: all events, x-bin 2: pileup rejected), cumulative
+        over the vertex-z bins (y-axis)
+        """
+        nvertexbins = self._histo.GetYaxis().GetNbins() + 2
+        table = np.zeros((2, nvertexbins + 1))
+        for pileupbin in range(0, 2):
+            contents = [self._histo.GetBinContent(pileupbin + 1, vertexbin) for vertexbin in range(0, nvertexbins)]
+            table[pileupbin, 1:] = np.cumsum(contents)
+        return table
     
     def __copy__(self, other):
         newobj = EventHistogramOld(None)
@@ -87,12 +131,20 @@ class EventHistogramNew(EventHistogram):
         pass
         
     def GetEventCount(self):
+        cumulative = self._GetCumulativeTable()
         if not len(self._vertexrange):
-            return self._histo.Integral()
-        else:
-            binmin = self._histo.GetXaxis().FindBin(self._vertexrange["min"])
-            binmax = self._histo.GetXaxis().FindBin(self._vertexrange["max"])
-            return self._histo.Integral(binmin, binmax)
+            # full range without underflow and overflow
+            return float(cumulative[-2] - cumulative[1])
+        return self._CountInRange(cumulative, self._histo.GetXaxis())
+    
+    def _BuildCumulativeTable(self):
+        """
+        Cumulative sum over the vertex-z bins (x-axis)
+        """
+        nvertexbins = self._histo.GetXaxis().GetNbins() + 2
+        table = np.zeros(nvertexbins + 1)
+        table[1:] = np.cumsum([self._histo.GetBinContent(vertexbin) for vertexbin in range(0, nvertexbins)])
+        return table
     
     def __copy__(self, other):
         newobj = EventHistogramNew(None)
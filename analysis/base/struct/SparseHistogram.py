@@ -0,0 +1,657 @@
+#**************************************************************************
+#* Copyright(c) 1998-2014, ALICE Experiment at CERN, All rights reserved. *
+#*                                                                        *
+#* Author: The ALICE Off-line Project.                                    *
+#* Contributors are mentioned in the code where appropriate.              *
+#*                                                                        *
+#* Permission to use, copy, modify and distribute this software and its   *
+#* documentation strictly for non-commercial purposes is hereby granted   *
+#* without fee, provided that the above copyright notice appears in all   *
+#* copies and that both the copyright notice and this permission notice   *
+#* appear in the supporting documentation. The authors make no claims     *
+#* about the suitability of this software for any purpose. It is          *
+#* provided "as is" without express or implied warranty.                  *
+#**************************************************************************
+"""
+Sparse N-dimensional histogram based on numpy arrays. The histogram stores the
+coordinates of the filled bins (COO format, bin numbering like in ROOT including
+underflow and overflow bin) together with bin contents and sum of weights squared.
+It implements the part of the THnSparse interface used by the THnSparseWrapper, so
+it can be used as drop-in replacement of the ROOT THnSparse. Projections are
+vectorised reductions over the filled bins.
+
+In case ROOT is available projections to 1D and 2D are returned as TH1D/TH2D,
+otherwise as numpy-based DenseHistogram, so that the framework can be used without ROOT.
+Conversions from and to ROOT THnSparse copy all filled bins in one call of a small
+C++ helper compiled by the ROOT interpreter (loop in python if it cannot be compiled).
+
+:organization: ALICE Collaboration
+:copyright: 1998-2014, ALICE Experiment at CERN, All rights reserved.
+
+:author: Markus Fasel
+:contact: markus.fasel@cern.ch
+:organization: Lawrence Berkeley National Laboratory
+"""
+
+import numpy as np
+
+try:
+    from ROOT import TH1D, TH2D, THnSparseD
+    HasROOT = True
+except ImportError:
+    HasROOT = False
+
+# C++ helper copying the filled bins of a THnSparse from and to flat arrays
+_gSparseAccessCode = """
+#include <THnSparse.h>
+namespace SparseHistogramAccess {
+void ReadBins(const THnSparse *hist, Long64_t nbins, Int_t *coordinates, Double_t *contents, Double_t *sumw2) {
+  Int_t ndim = hist->GetNdimensions();
+  for(Long64_t ibin = 0; ibin < nbins; ibin++) {
+    contents[ibin] = hist->GetBinContent(ibin, coordinates + ibin * ndim);
+    sumw2[ibin] = hist->GetBinError2(ibin);
+  }
+}
+void WriteBins(THnSparse *hist, Long64_t nbins, const Int_t *coordinates, const Double_t *contents, const Double_t *sumw2) {
+  Int_t ndim = hist->GetNdimensions();
+  for(Long64_t ibin = 0; ibin < nbins; ibin++) {
+    Long64_t rootbin = hist->GetBin(coordinates + ibin * ndim);
+    hist->SetBinContent(rootbin, contents[ibin]);
+    hist->SetBinError2(rootbin, sumw2[ibin]);
+  }
+}
+}
+"""
+_gSparseAccess = None
+
+def GetSparseAccess():
+    """
+    Get the C++ helper copying the filled bins of a THnSparse from and to arrays. The
+    helper is compiled once, at the first call.
+
+    :return: namespace with the functions ReadBins and WriteBins, None if the helper is not available
+    """
+    global _gSparseAccess
+    if _gSparseAccess is None:
+        _gSparseAccess = False
+        if HasROOT:
+            try:
+                import ROOT
+                if ROOT.gInterpreter.Declare(_gSparseAccessCode):
+                    _gSparseAccess = ROOT.SparseHistogramAccess
+            except AttributeError:
+                pass
+    return _gSparseAccess if _gSparseAccess else None
+
+def _ReadDoubleBuffer(buf, shape):
+    """
+    Copy a buffer of doubles returned by ROOT into a numpy array of the given shape
+    (index order x, y like the bin numbering of the ROOT histogram)
+    """
+    size = int(np.prod(shape))
+    if hasattr(buf, "SetSize"):
+        buf.SetSize(size)
+    return np.array(np.frombuffer(buf, dtype = np.float64, count = size).reshape(shape[::-1]).T)
+
+class HistogramAxis(object):
+    """
+    Axis definition, following the TAxis interface (bin 0 is the underflow
+    bin, bin nbins+1 the overflow bin)
+    """
+
+    def __init__(self, edges, name = "", title = ""):
+        """
+        Constructor
+
+        :param edges: bin edges (nbins + 1 values)
+        :type edges: list
+        :param name: name of the axis
+        :type name: str
+        :param title: title of the axis
+        :type title: str
+        """
+        self.__edges = np.array(edges, dtype = np.float64)
+        self.__name = name
+        self.__title = title
+        self.__first = 1
+        self.__last = self.GetNbins()
+        self.__hasRange = False
+
+    @staticmethod
+    def BuildFromTAxis(rootaxis):
+        """
+        Create axis from a ROOT TAxis
+
+        :param rootaxis: ROOT axis
+        :type rootaxis: TAxis
+        :return: the axis
+        :rtype: HistogramAxis
+        """
+        nbins = rootaxis.GetNbins()
+        edges = [rootaxis.GetBinLowEdge(b) for b in range(1, nbins+1)] + [rootaxis.GetBinUpEdge(nbins)]
+        return HistogramAxis(edges, rootaxis.GetName(), rootaxis.GetTitle())
+
+    def GetEdges(self):
+        """
+        Get the bin edges
+        """
+        return self.__edges
+
+    def GetName(self):
+        return self.__name
+
+    def GetTitle(self):
+        return self.__title
+
+    def SetTitle(self, title):
+        self.__title = title
+
+    def GetNbins(self):
+        return len(self.__edges) - 1
+
+    def GetXmin(self):
+        return self.__edges[0]
+
+    def GetXmax(self):
+        return self.__edges[-1]
+
+    def GetBinLowEdge(self, mybin):
+        return self.__edges[mybin-1]
+
+    def GetBinUpEdge(self, mybin):
+        return self.__edges[mybin]
+
+    def GetBinCenter(self, mybin):
+        return (self.__edges[mybin-1] + self.__edges[mybin])/2.
+
+    def GetBinWidth(self, mybin):
+        return self.__edges[mybin] - self.__edges[mybin-1]
+
+    def FindBin(self, x):
+        """
+        Find bin for a value x. Values below the axis range end up in the
+        underflow bin, values above (including the upper edge) in the overflow bin.
+        Works as well on numpy arrays.
+        """
+        return np.searchsorted(self.__edges, x, side = "right")
+
+    def SetRange(self, first, last):
+        """
+        Set the range selected on the axis (in bins, like TAxis::SetRange).
+        A range covering all bins, including underflow and overflow, releases the range.
+        """
+        if last < first or (first <= 0 and last >= self.GetNbins() + 1):
+            self.__first = 1
+            self.__last = self.GetNbins()
+            self.__hasRange = False
+        else:
+            self.__first = max(first, 0)
+            self.__last = min(last, self.GetNbins() + 1)
+            self.__hasRange = True
+
+    def HasRange(self):
+        """
+        Check whether a range is selected on the axis
+        """
+        return self.__hasRange
+
+    def GetFirst(self):
+        return self.__first
+
+    def GetLast(self):
+        return self.__last
+
+class DenseHistogram(object):
+    """
+    Numpy-based 1D or 2D histogram, used as projection result in case ROOT is not available.
+    Implements the part of the TH1 interface used within the framework. Arrays include
+    underflow and overflow bins.
+    """
+
+    def __init__(self, name, title, axes, contents = None, sumw2 = None):
+        """
+        Constructor
+
+        :param name: name of the histogram
+        :type name: str
+        :param title: title of the histogram
+        :type title: str
+        :param axes: the axes of the histogram (1 or 2)
+        :type axes: list of HistogramAxis
+        :param contents: bin contents, including underflow and overflow
+        :type contents: numpy array
+        :param sumw2: sum of weights squared, including underflow and overflow
+        :type sumw2: numpy array
+        """
+        self.__name = name
+        self.__title = title
+        self.__axes = axes
+        # 1D histograms keep a dummy y-axis (i.e. for the axis title)
+        self.__dummyaxis = HistogramAxis([0., 1.])
+        shape = tuple([axis.GetNbins() + 2 for axis in axes])
+        self.__contents = np.array(contents, dtype = np.float64) if contents is not None else np.zeros(shape)
+        self.__sumw2 = np.array(sumw2, dtype = np.float64) if sumw2 is not None else self.__contents.copy()
+
+    @staticmethod
+    def BuildFromTH1(roothist):
+        """
+        Convert a 1D or 2D ROOT histogram into a dense histogram
+
+        :param roothist: ROOT histogram to convert
+        :type roothist: TH1
+        :return: the dense histogram
+        :rtype: DenseHistogram
+        """
+        axes = [HistogramAxis.BuildFromTAxis(roothist.GetXaxis())]
+        if roothist.GetDimension() > 1:
+            axes.append(HistogramAxis.BuildFromTAxis(roothist.GetYaxis()))
+        result = DenseHistogram(roothist.GetName(), roothist.GetTitle(), axes)
+        shape = result.GetContents().shape
+        if roothist.InheritsFrom("TArrayD"):
+            # double precision histograms: read contents and sum of weights squared as one block
+            # (ROOT stores the x-bin as fastest running index)
+            contents = _ReadDoubleBuffer(roothist.GetArray(), shape)
+            if roothist.GetSumw2N():
+                sumw2 = _ReadDoubleBuffer(roothist.GetSumw2().GetArray(), shape)
+            else:
+                sumw2 = np.abs(contents)
+            return DenseHistogram(roothist.GetName(), roothist.GetTitle(), axes, contents, sumw2)
+        for binindex in np.ndindex(shape):
+            args = [int(b) for b in binindex]
+            result.SetBinContent(*(args + [roothist.GetBinContent(*args)]))
+            result.SetBinError(*(args + [roothist.GetBinError(*args)]))
+        return result
+
+    def GetName(self):
+        return self.__name
+
+    def SetName(self, name):
+        self.__name = name
+
+    def GetTitle(self):
+        return self.__title
+
+    def SetTitle(self, title):
+        self.__title = title
+
+    def GetDimension(self):
+        return len(self.__axes)
+
+    def GetXaxis(self):
+        return self.__axes[0]
+
+    def GetYaxis(self):
+        return self.__axes[1] if len(self.__axes) > 1 else self.__dummyaxis
+
+    def GetNbinsX(self):
+        return self.__axes[0].GetNbins()
+
+    def GetNbinsY(self):
+        return self.__axes[1].GetNbins() if len(self.__axes) > 1 else 1
+
+    def GetContents(self):
+        """
+        Access to the array of bin contents
+        """
+        return self.__contents
+
+    def GetSumw2Array(self):
+        """
+        Access to the array of the sum of weights squared
+        """
+        return self.__sumw2
+
+    def GetBinContent(self, *binindex):
+        return self.__contents[binindex]
+
+    def SetBinContent(self, *args):
+        self.__contents[tuple(args[:-1])] = args[-1]
+
+    def GetBinError(self, *binindex):
+        return np.sqrt(self.__sumw2[binindex])
+
+    def SetBinError(self, *args):
+        self.__sumw2[tuple(args[:-1])] = args[-1] ** 2
+
+    def Sumw2(self):
+        """
+        Sum of weights squared are always stored - nothing to be done
+        """
+        pass
+
+    def Scale(self, scalefactor):
+        self.__contents = self.__contents * scalefactor
+        self.__sumw2 = self.__sumw2 * scalefactor * scalefactor
+
+    def Add(self, other, c1 = 1.):
+        self.__contents = self.__contents + c1 * other.GetContents()
+        self.__sumw2 = self.__sumw2 + c1 * c1 * other.GetSumw2Array()
+
+    def Integral(self, first = None, last = None):
+        """
+        Integral of bin contents (without underflow and overflow bin if no range is given)
+        """
+        if len(self.__axes) > 1:
+            return np.sum(self.__contents[1:-1, 1:-1])
+        if first is None:
+            first = 1
+        if last is None:
+            last = self.GetNbinsX()
+        return np.sum(self.__contents[first:last+1])
+
+    def ProjectionX(self, name = "_px", firstybin = 0, lastybin = -1):
+        """
+        Project 2D histogram on the x-axis in the y-range between firstybin and lastybin
+        """
+        if lastybin < firstybin:
+            firstybin = 0
+            lastybin = self.GetNbinsY() + 1
+        return DenseHistogram(name, self.__title, [self.__axes[0]], \
+                              np.sum(self.__contents[:, firstybin:lastybin+1], axis = 1), \
+                              np.sum(self.__sumw2[:, firstybin:lastybin+1], axis = 1))
+
+def MakeProjectedHistogram(name, axes, contents, sumw2):
+    """
+    Create the output histogram of a 1D or 2D projection from dense arrays (including
+    underflow and overflow bins). The output histogram is a TH1D/TH2D if ROOT is
+    available, otherwise a DenseHistogram.
+
+    :param name: name of the output histogram
+    :type name: str
+    :param axes: axes of the output histogram
+    :type axes: list of HistogramAxis
+    :param contents: bin contents
+    :type contents: numpy array
+    :param sumw2: sum of weights squared
+    :type sumw2: numpy array
+    :return: the output histogram
+    """
+    if not HasROOT:
+        return DenseHistogram(name, "", axes, contents, sumw2)
+    if len(axes) == 1:
+        result = TH1D(name, "", axes[0].GetNbins(), axes[0].GetEdges())
+    else:
+        result = TH2D(name, "", axes[0].GetNbins(), axes[0].GetEdges(), axes[1].GetNbins(), axes[1].GetEdges())
+    result.Sumw2()
+    result.GetXaxis().SetTitle(axes[0].GetTitle())
+    if len(axes) > 1:
+        result.GetYaxis().SetTitle(axes[1].GetTitle())
+    errors = np.sqrt(sumw2)
+    for binindex in zip(*np.nonzero(np.logical_or(contents != 0, sumw2 != 0))):
+        args = [int(b) for b in binindex]
+        result.SetBinContent(*(args + [float(contents[binindex])]))
+        result.SetBinError(*(args + [float(errors[binindex])]))
+    return result
+
+class SparseHistogram(object):
+    """
+    Sparse N-dimensional histogram, drop-in replacement of the ROOT THnSparse
+    """
+
+    def __init__(self, name, title, axes, coordinates = None, contents = None, sumw2 = None):
+        """
+        Constructor
+
+        :param name: name of the histogram
+        :type name: str
+        :param title: title of the histogram
+        :type title: str
+        :param axes: axis definitions
+        :type axes: list of HistogramAxis
+        :param coordinates: bin coordinates of the filled bins (shape nfilled x ndim)
+        :type coordinates: numpy array
+        :param contents: contents of the filled bins
+        :type contents: numpy array
+        :param sumw2: sum of weights squared of the filled bins
+        :type sumw2: numpy array
+        """
+        self.__name = name
+        self.__title = title
+        self.__axes = axes
+        if coordinates is None:
+            coordinates = np.zeros((0, len(axes)), dtype = np.int32)
+            contents = np.zeros(0)
+        self.__coordinates = np.asarray(coordinates, dtype = np.int32).reshape(-1, len(axes))
+        self.__contents = np.asarray(contents, dtype = np.float64)
+        self.__sumw2 = np.asarray(sumw2, dtype = np.float64) if sumw2 is not None else self.__contents.copy()
+
+    @staticmethod
+    def BuildFromTHnSparse(rootsparse):
+        """
+        Convert a ROOT THnSparse into a sparse histogram. All filled bins are read in one
+        call of the C++ helper (loop in python if the helper is not available).
+
+        :param rootsparse: ROOT THnSparse to convert
+        :type rootsparse: THnSparse
+        :return: the sparse histogram
+        :rtype: SparseHistogram
+        """
+        ndim = rootsparse.GetNdimensions()
+        axes = [HistogramAxis.BuildFromTAxis(rootsparse.GetAxis(d)) for d in range(0, ndim)]
+        nfilled = int(rootsparse.GetNbins())
+        coordinates = np.zeros((nfilled, ndim), dtype = np.int32)
+        contents = np.zeros(nfilled)
+        sumw2 = np.zeros(nfilled)
+        access = GetSparseAccess() if nfilled else None
+        if access:
+            access.ReadBins(rootsparse, nfilled, coordinates, contents, sumw2)
+        else:
+            coord = np.zeros(ndim, dtype = np.int32)
+            for ibin in range(0, nfilled):
+                contents[ibin] = rootsparse.GetBinContent(ibin, coord)
+                sumw2[ibin] = rootsparse.GetBinError2(ibin)
+                coordinates[ibin] = coord
+        return SparseHistogram(rootsparse.GetName(), rootsparse.GetTitle(), axes, coordinates, contents, sumw2)
+
+    def ToTHnSparse(self, name = None):
+        """
+        Convert the sparse histogram into a ROOT THnSparseD (i.e. for writing it to a ROOT
+        file). All filled bins are written in one call of the C++ helper (loop in python
+        if the helper is not available).
+
+        :param name: name of the ROOT histogram (default: name of this histogram)
+        :type name: str
+        :return: the ROOT histogram
+        :rtype: THnSparseD
+        """
+        if not HasROOT:
+            raise RuntimeError("Conversion to THnSparse requires ROOT")
+        ndim = len(self.__axes)
+        nbins = np.array([axis.GetNbins() for axis in self.__axes], dtype = np.int32)
+        xmin = np.array([axis.GetXmin() for axis in self.__axes], dtype = np.float64)
+        xmax = np.array([axis.GetXmax() for axis in self.__axes], dtype = np.float64)
+        result = THnSparseD(name if name else self.__name, self.__title, ndim, nbins, xmin, xmax)
+        for dim, axis in enumerate(self.__axes):
+            result.SetBinEdges(dim, np.ascontiguousarray(axis.GetEdges(), dtype = np.float64))
+            result.GetAxis(dim).SetName(axis.GetName())
+            result.GetAxis(dim).SetTitle(axis.GetTitle())
+        result.Sumw2()
+        nfilled = len(self.__contents)
+        coordinates = np.ascontiguousarray(self.__coordinates, dtype = np.int32)
+        contents = np.ascontiguousarray(self.__contents, dtype = np.float64)
+        sumw2 = np.ascontiguousarray(self.__sumw2, dtype = np.float64)
+        access = GetSparseAccess() if nfilled else None
+        if access:
+            access.WriteBins(result, nfilled, coordinates, contents, sumw2)
+        else:
+            for ibin in range(0, nfilled):
+                rootbin = result.GetBin(coordinates[ibin])
+                result.SetBinContent(rootbin, float(contents[ibin]))
+                result.SetBinError2(rootbin, float(sumw2[ibin]))
+        result.SetEntries(float(self.GetEntries()))
+        return result
+
+    def GetName(self):
+        return self.__name
+
+    def SetName(self, name):
+        self.__name = name
+
+    def GetTitle(self):
+        return self.__title
+
+    def GetNdimensions(self):
+        return len(self.__axes)
+
+    def GetAxis(self, dim):
+        return self.__axes[dim]
+
+    def GetNbins(self):
+        """
+        Number of filled bins
+        """
+        return len(self.__contents)
+
+    def GetCoordinates(self):
+        """
+        Access to the coordinates of the filled bins
+        """
+        return self.__coordinates
+
+    def GetContents(self):
+        """
+        Access to the contents of the filled bins
+        """
+        return self.__contents
+
+    def GetSumw2Array(self):
+        """
+        Access to the sum of weights squared of the filled bins
+        """
+        return self.__sumw2
+
+    def GetBinContent(self, ibin, coord = None):
+        """
+        Get the content of the filled bin with index ibin. If coord is given it is set to
+        the bin coordinates (like in THnSparse::GetBinContent).
+        """
+        if coord is not None:
+            coord[:] = self.__coordinates[ibin]
+        return self.__contents[ibin]
+
+    def GetBinError2(self, ibin):
+        return self.__sumw2[ibin]
+
+    def GetBinError(self, ibin):
+        return np.sqrt(self.__sumw2[ibin])
+
+    def GetEntries(self):
+        return np.sum(self.__contents)
+
+    def Sumw2(self):
+        """
+        Sum of weights squared are always stored - nothing to be done
+        """
+        pass
+
+    def FillN(self, values, weights = None):
+        """
+        Fill a set of entries at once
+
+        :param values: values of the entries (shape nentries x ndim)
+        :type values: numpy array
+        :param weights: weights of the entries (default 1)
+        :type weights: numpy array
+        """
+        values = np.asarray(values, dtype = np.float64).reshape(-1, len(self.__axes))
+        if weights is None:
+            weights = np.ones(len(values))
+        weights = np.asarray(weights, dtype = np.float64)
+        coordinates = np.column_stack([self.__axes[d].FindBin(values[:, d]) for d in range(0, len(self.__axes))])
+        self.AddBinContents(coordinates, weights, weights * weights)
+
+    def Add(self, other, c1 = 1.):
+        """
+        Add other sparse histogram (with the same binning), scaled by c1
+        """
+        self.AddBinContents(other.GetCoordinates(), c1 * other.GetContents(), c1 * c1 * other.GetSumw2Array())
+
+    def Scale(self, scalefactor):
+        """
+        Scale histogram. Creates new arrays, so that read-only (i.e. memory mapped) input arrays are not modified.
+        """
+        self.__contents = self.__contents * scalefactor
+        self.__sumw2 = self.__sumw2 * scalefactor * scalefactor
+
+    def Reset(self):
+        self.__coordinates = np.zeros((0, len(self.__axes)), dtype = np.int32)
+        self.__contents = np.zeros(0)
+        self.__sumw2 = np.zeros(0)
+
+    def Projection(self, *args):
+        """
+        Project histogram applying the ranges set on the axes. Supported signatures
+        (options are ignored):
+
+        - Projection(xdim): projection to 1D
+        - Projection(ydim, xdim): projection to 2D
+        - Projection(ndim, dims): projection to ndim dimensions
+        """
+        args = [arg for arg in args if not isinstance(arg, str)]
+        if len(args) == 1:
+            dims = [int(args[0])]
+        elif np.ndim(args[1]) == 0:
+            dims = [int(args[1]), int(args[0])]
+        else:
+            dims = [int(d) for d in args[1][:int(args[0])]]
+        ranges = {}
+        for dim in range(0, len(self.__axes)):
+            if self.__axes[dim].HasRange():
+                ranges[dim] = (self.__axes[dim].GetFirst(), self.__axes[dim].GetLast())
+        return self.ProjectRanges("%s_proj" %(self.__name), dims, ranges)
+
+    def ProjectRanges(self, name, dims, ranges):
+        """
+        Project histogram to the dimensions dims, selecting only bins within the ranges.
+        Projected axes with a range are restricted to the selected range.
+
+        :param name: name of the output histogram
+        :type name: str
+        :param dims: dimensions of the output histogram
+        :type dims: list
+        :param ranges: bin ranges (first, last) selected for the given dimension
+        :type ranges: dict
+        :return: the projected histogram (SparseHistogram for more than 2 dimensions)
+        """
+        selected = np.ones(len(self.__contents), dtype = bool)
+        for dim, binrange in ranges.iteritems():
+            selected &= (self.__coordinates[:, dim] >= binrange[0]) & (self.__coordinates[:, dim] <= binrange[1])
+        outaxes = []
+        outcoords = []
+        for dim in dims:
+            inaxis = self.__axes[dim]
+            first = 1
+            last = inaxis.GetNbins()
+            if dim in ranges:
+                first = max(ranges[dim][0], 1)
+                last = min(ranges[dim][1], inaxis.GetNbins())
+            outaxes.append(HistogramAxis(inaxis.GetEdges()[first-1:last+1], inaxis.GetName(), inaxis.GetTitle()))
+            outcoords.append(self.__coordinates[selected, dim] - (first - 1))
+        if len(dims) > 2:
+            result = SparseHistogram(name, self.__title, outaxes)
+            result.AddBinContents(np.transpose(outcoords), self.__contents[selected], self.__sumw2[selected])
+            return result
+        shape = tuple([axis.GetNbins() + 2 for axis in outaxes])
+        linear = np.ravel_multi_index(outcoords, shape)
+        contents = np.bincount(linear, weights = self.__contents[selected], minlength = np.prod(shape)).reshape(shape)
+        sumw2 = np.bincount(linear, weights = self.__sumw2[selected], minlength = np.prod(shape)).reshape(shape)
+        return MakeProjectedHistogram(name, outaxes, contents, sumw2)
+
+    def AddBinContents(self, coordinates, contents, sumw2):
+        """
+        Add contents to a set of bins, summing entries with the same coordinates
+
+        :param coordinates: bin coordinates (shape nbins x ndim)
+        :type coordinates: numpy array
+        :param contents: contents added to the bins
+        :type contents: numpy array
+        :param sumw2: sum of weights squared added to the bins
+        :type sumw2: numpy array
+        """
+        shape = tuple([axis.GetNbins() + 2 for axis in self.__axes])
+        allcoords = np.concatenate([self.__coordinates, np.asarray(coordinates, dtype = np.int32).reshape(-1, len(self.__axes))])
+        linear = np.ravel_multi_index(np.transpose(allcoords).astype(np.int64), shape)
+        uniquebins, inverse = np.unique(linear, return_inverse = True)
+        self.__coordinates = np.transpose(np.unravel_index(uniquebins, shape)).astype(np.int32).reshape(-1, len(self.__axes))
+        self.__contents = np.bincount(inverse, weights = np.concatenate([self.__contents, contents]), minlength = len(uniquebins))
+        self.__sumw2 = np.bincount(inverse, weights = np.concatenate([self.__sumw2, sumw2]), minlength = len(uniquebins))
@@ -7,8 +7,10 @@ making the handling of THnSparses a lot more handy for users.
 @author: markus
 '''
 
+from collections import OrderedDict
 from copy import copy,deepcopy
 from numpy import array as nparray
+from base.struct.SparseHistogram import SparseHistogram
 
 class AxisFormat(object):
     '''
@@ -110,11 +112,175 @@ class THnSparseCut(object):
         '''
         self.__maximum = maxv
 
+class THnSparseProjectionRequest(object):
+    '''
+    Definition of one projection inside a batch of projections: name of the output
+    histogram, axes to project to, and cuts applied on top of the cuts of the wrapper
+    '''
+    
+    def __init__(self, histname, axes, cuts = None):
+        '''
+        Constructor
+        
+        :param histname: name of the output histogram
+        :type histname: str
+        :param axes: names of the axes to project to, in order of the output dimension
+        :type axes: list
+        :param cuts: additional cuts for this projection
+        :type cuts: list of THnSparseCut
+        '''
+        self.__histname = histname
+        self.__axes = axes
+        self.__cuts = []
+        if cuts:
+            self.__cuts = cuts
+        
+    def GetHistname(self):
+        '''
+        Get the name of the output histogram
+        '''
+        return self.__histname
+    
+    def GetAxes(self):
+        '''
+        Get the names of the projected axes
+        '''
+        return self.__axes
+    
+    def GetListOfCuts(self):
+        '''
+        Get the list of cuts specific for this projection
+        '''
+        return self.__cuts
+    
+    def AddCut(self, axisname, minv, maxv):
+        '''
+        Add cut specific for this projection. A cut on an axis which is also cut in
+        the wrapper replaces the cut of the wrapper.
+        '''
+        self.__cuts.append(THnSparseCut(axisname, minv, maxv))
+
+class ProjectionCache(object):
+    '''
+    Least-recently-used cache of projection results. The size of the cache is limited
+    by the (estimated) memory size of the cached histograms. Histograms are handed out as
+    copies, so modifications by the user do not affect the cache. Cached ROOT histograms
+    are detached from the current directory. A size 0 disables the cache.
+    '''
+    
+    def __init__(self, maxbytes):
+        '''
+        Constructor
+        
+        :param maxbytes: maximum size of the cached histograms in bytes
+        :type maxbytes: int
+        '''
+        self.__maxbytes = maxbytes
+        self.__entries = OrderedDict()
+        self.__size = 0
+        self.__ncopies = 0
+        
+    def GetMaxBytes(self):
+        '''
+        Get the maximum size of the cache
+        '''
+        return self.__maxbytes
+    
+    def GetSize(self):
+        '''
+        Get the size of the cached histograms
+        '''
+        return self.__size
+    
+    def __len__(self):
+        return len(self.__entries)
+    
+    def Get(self, key, histname):
+        '''
+        Get copy of a cached histogram under a new name. Returns None if the key is
+        not in the cache.
+        '''
+        if not key in self.__entries:
+            return None
+        entry = self.__entries.pop(key)
+        self.__entries[key] = entry
+        return self.__CopyHistogram(entry[0], histname)
+    
+    def Insert(self, key, hist):
+        '''
+        Insert histogram into the cache, evicting the least recently used entries if
+        the cache gets too large. Returns a copy of the histogram.
+        '''
+        histname = hist.GetName()
+        if self.__maxbytes <= 0:
+            return hist
+        size = self.EstimateSize(hist)
+        if size > self.__maxbytes:
+            return hist
+        if hasattr(hist, "SetDirectory"):
+            hist.SetDirectory(0)
+        if key in self.__entries:
+            self.__size -= self.__entries.pop(key)[1]
+        while len(self.__entries) and self.__size + size > self.__maxbytes:
+            self.__size -= self.__entries.popitem(False)[1][1]
+        self.__entries[key] = (hist, size)
+        self.__size += size
+        return self.__CopyHistogram(hist, histname)
+        
+    def Clear(self):
+        '''
+        Remove all entries from the cache
+        '''
+        self.__entries = OrderedDict()
+        self.__size = 0
+        
+    @staticmethod
+    def EstimateSize(hist):
+        '''
+        Estimate the memory size of a histogram (bin contents and errors) in bytes
+        '''
+        if isinstance(hist, SparseHistogram):
+            return hist.GetCoordinates().nbytes + hist.GetContents().nbytes + hist.GetSumw2Array().nbytes
+        if hasattr(hist, "GetContents"):
+            return hist.GetContents().nbytes + hist.GetSumw2Array().nbytes
+        if hasattr(hist, "GetNcells"):
+            return 16 * hist.GetNcells()
+        # ROOT THnSparse: content, error and coordinates per filled bin
+        return (16 + 4 * hist.GetNdimensions()) * hist.GetNbins()
+    
+    def __CopyHistogram(self, hist, histname):
+        if hasattr(hist, "Clone"):
+            # clone under a unique name, so that the copy does not replace an object with
+            # the requested name in the current directory
+            self.__ncopies += 1
+            result = hist.Clone("%s_projectioncache%d" %(histname, self.__ncopies))
+            result.SetName(histname)
+            return result
+        result = deepcopy(hist)
+        result.SetName(histname)
+        return result
+
 class THnSparseWrapper(object):
     '''
-    Wrapper class around THnSparse applying cuts on axes and performing projections
+    Wrapper class around THnSparse applying cuts on axes and performing projections.
+    Projection results can be cached, keyed on the projected axes and the cut ranges, so that
+    repeated projections with the same selection do not process the THnSparse again. The
+    cache is disabled by default and enabled with SetProjectionCacheSize (or for all wrappers
+    created afterwards with SetDefaultProjectionCacheSize). Changes of the THnSparse done
+    via GetHistogram require a call of ClearProjectionCache.
     '''
     
+    # default maximum size of the projection cache in bytes (0: no cache)
+    DefaultCacheSize = 0
+    
+    @staticmethod
+    def SetDefaultProjectionCacheSize(maxbytes):
+        '''
+        Set the maximum size of the projection cache in bytes for all wrappers created
+        afterwards. A size 0 disables the cache.
+        '''
+        THnSparseWrapper.DefaultCacheSize = maxbytes
+    
     def __init__(self, rootthnsparse):
         '''
         Constructor
@@ -122,6 +288,7 @@ class THnSparseWrapper(object):
         self._rootthnsparse = rootthnsparse
         self._axisdefinition = None
         self._cutlist = []
+        self._projectioncache = ProjectionCache(THnSparseWrapper.DefaultCacheSize)
         
     def __deepcopy__(self, memo):
         '''
@@ -159,8 +326,18 @@ class THnSparseWrapper(object):
 
     def GetHistogram(self):
         '''
-        Access to underlying root histogram
+        Access to underlying root histogram. In case the histogram is modified the
+        projection cache needs to be cleared (ClearProjectionCache).
+        '''
+        return self._rootthnsparse
+    
+    def GetRootPrimitive(self):
+        '''
+        Get the underlying histogram as ROOT object, so that it can be written to a ROOT file
+        (sparse histograms built from the histogram cache are converted back into a THnSparse)
         '''
+        if hasattr(self._rootthnsparse, "ToTHnSparse"):
+            return self._rootthnsparse.ToTHnSparse()
         return self._rootthnsparse
     
     def GetHistogramName(self):
@@ -171,9 +348,29 @@ class THnSparseWrapper(object):
     
     def Add(self, otherwrapper):
         self._rootthnsparse.Add(otherwrapper.GetHistogram())
+        self._projectioncache.Clear()
     
     def Scale(self, scalefactor):
         self._rootthnsparse.Scale(scalefactor)
+        self._projectioncache.Clear()
+        
+    def SetProjectionCacheSize(self, maxbytes):
+        '''
+        Set the maximum size of the projection cache in bytes. A size 0 disables the cache.
+        '''
+        self._projectioncache = ProjectionCache(maxbytes)
+        
+    def GetProjectionCache(self):
+        '''
+        Access to the projection cache
+        '''
+        return self._projectioncache
+        
+    def ClearProjectionCache(self):
+        '''
+        Remove all cached projections (i.e. after the underlying histogram was modified)
+        '''
+        self._projectioncache.Clear()
         
     def GetAxisDefinition(self):
         return self._axisdefinition
@@ -222,11 +419,15 @@ class THnSparseWrapper(object):
         if not self._axisdefinition or self._axisdefinition.FindAxis(axisname) < 0:
             print "No axis definition or axis %s not found" %(axisname)
             return None
+        cachekey = self._MakeCacheKey("single", [self._axisdefinition.FindAxis(axisname)], self._cutlist)
+        result = self._projectioncache.Get(cachekey, histname)
+        if result is not None:
+            return result
         self._PrepareProjection()
         result = self._rootthnsparse.Projection(self._axisdefinition.FindAxis(axisname))
         result.SetName(histname)
         self._CleanumProjection()
-        return result
+        return self._projectioncache.Insert(cachekey, result)
     
     def Projection2D(self, histname, axisdictionary):
         '''
@@ -238,12 +439,11 @@ class THnSparseWrapper(object):
             return None
         hasfound = True
         for axisname in axisdictionary.keys():
-            if self._axisdefinition.FindAxis(axisname):
+            if self._axisdefinition.FindAxis(axisname) < 0:
                 hasfound = False
                 break
         if not hasfound:
             return None
-        self._PrepareProjection()
         xdim = None
         ydim = None
         for k,v in axisdictionary.iteritems():
@@ -251,10 +451,15 @@ class THnSparseWrapper(object):
                 ydim = self._axisdefinition.FindAxis(k)
             else:
                 xdim = self._axisdefinition.FindAxis(k)
+        cachekey = self._MakeCacheKey("single", [xdim, ydim], self._cutlist)
+        result = self._projectioncache.Get(cachekey, histname)
+        if result is not None:
+            return result
+        self._PrepareProjection()
         result = self._rootthnsparse.Projection(ydim, xdim)
         result.SetName(histname)
         self._CleanumProjection()
-        return result
+        return self._projectioncache.Insert(cachekey, result)
     
     def ProjectionND(self, histname, axisdictionary):
         '''
@@ -266,32 +471,165 @@ class THnSparseWrapper(object):
             return None
         hasfound = True
         for axisname in axisdictionary.keys():
-            if self._axisdefinition.FindAxis(axisname):
+            if self._axisdefinition.FindAxis(axisname) < 0:
                 hasfound = False
                 break
         if not hasfound:
             return None
-        self._PrepareProjection()
         axismap = {}
         for k,v in axisdictionary.iteritems():
             axismap[v] = k
         axislist = []
         for mydim in sorted(axismap.keys()):
             axislist.append(self._axisdefinition.FindAxis(axismap[mydim]))
+        cachekey = self._MakeCacheKey("single", axislist, self._cutlist)
+        result = self._projectioncache.Get(cachekey, histname)
+        if result is not None:
+            return result
+        self._PrepareProjection()
         result = self._rootthnsparse.Projection(len(axislist), nparray(axislist))
         result.SetName(histname)
         self._CleanumProjection()
+        return self._projectioncache.Insert(cachekey, result)
+    
+    def ProjectionBatch(self, requests):
+        '''
+        Make a set of projections in one single pass over the filled bins of the THnSparse.
+        Each projection request consists of output name, projected axes and a set of cuts,
+        which are applied on top of the cuts defined in the wrapper. Projected axes with a
+        cut are restricted to the selected range, like in the single projections.
+        The filled bins of a ROOT THnSparse are read once into arrays (in one call of a
+        compiled helper, see SparseHistogram.BuildFromTHnSparse), all projections are
+        vectorised reductions over these arrays. Returns a dictionary with the projections
+        under the name of the output histogram. Output types are the same as for the single
+        projections (projections to more than 2 dimensions of a ROOT THnSparse are returned
+        as THnSparse).
+        
+        :param requests: list of projection requests
+        :type requests: list of THnSparseProjectionRequest
+        :return: projected histograms
+        :rtype: dict
+        '''
+        if not self._axisdefinition:
+            print "No axis definition"
+            return None
+        selections = []
+        result = {}
+        for request in requests:
+            dims = []
+            for axisname in request.GetAxes():
+                if self._axisdefinition.FindAxis(axisname) < 0:
+                    print "Axis %s not found" %(axisname)
+                    return None
+                dims.append(self._axisdefinition.FindAxis(axisname))
+            ranges = {}
+            for entry in self._MergeCuts(request.GetListOfCuts()):
+                binrange = self._GetCutBinRange(entry)
+                if binrange:
+                    ranges[self._axisdefinition.FindAxis(entry.GetCutname())] = binrange
+            cachekey = ("batch", tuple(dims), tuple(sorted(ranges.items())))
+            cached = self._projectioncache.Get(cachekey, request.GetHistname())
+            if cached is not None:
+                result[request.GetHistname()] = cached
+                continue
+            selections.append({"name":request.GetHistname(), "dims":dims, "ranges":ranges, "key":cachekey})
+        if not len(selections):
+            return result
+        
+        isROOT = not isinstance(self._rootthnsparse, SparseHistogram)
+        source = SparseHistogram.BuildFromTHnSparse(self._rootthnsparse) if isROOT else self._rootthnsparse
+        for sel in selections:
+            projected = source.ProjectRanges(sel["name"], sel["dims"], sel["ranges"])
+            if isROOT and len(sel["dims"]) > 2:
+                projected = projected.ToTHnSparse()
+            result[sel["name"]] = self._projectioncache.Insert(sel["key"], projected)
+        return result
+    
+    def ProjectionGroupBy(self, histname, axisname, groupaxisname):
+        '''
+        Make 1D projections to the axis for each bin of a categorical axis (i.e. track cuts,
+        pileup or min. bias trigger) in one single pass over the THnSparse, applying the cuts
+        defined before. In case the group axis is also cut, only bins inside the cut range
+        are used. Histograms are named <histname>_<bin>.
+        
+        :param histname: base name of the output histograms
+        :type histname: str
+        :param axisname: name of the axis to project to
+        :type axisname: str
+        :param groupaxisname: name of the categorical axis
+        :type groupaxisname: str
+        :return: projected histograms under the bin center of the group axis
+        :rtype: OrderedDict
+        '''
+        if not self._axisdefinition or self._axisdefinition.FindAxis(groupaxisname) < 0:
+            print "No axis definition or axis %s not found" %(groupaxisname)
+            return None
+        groupaxis = self._rootthnsparse.GetAxis(self._axisdefinition.FindAxis(groupaxisname))
+        first = 1
+        last = groupaxis.GetNbins()
+        groupcut = self.__FindCut(groupaxisname)
+        if groupcut:
+            binrange = self._GetCutBinRange(groupcut)
+            if binrange:
+                first = max(binrange[0], first)
+                last = min(binrange[1], last)
+        requests = []
+        for groupbin in range(first, last + 1):
+            center = groupaxis.GetBinCenter(groupbin)
+            requests.append(THnSparseProjectionRequest("%s_%d" %(histname, groupbin), [axisname], [THnSparseCut(groupaxisname, center, center)]))
+        projections = self.ProjectionBatch(requests)
+        if projections is None:
+            return None
+        result = OrderedDict()
+        for groupbin, request in zip(range(first, last + 1), requests):
+            result[groupaxis.GetBinCenter(groupbin)] = projections[request.GetHistname()]
         return result
     
+    def _MergeCuts(self, othercuts):
+        '''
+        Combine the cuts of the wrapper with a set of other cuts. Cuts from the other
+        set replace the cuts of the wrapper on the same axis.
+        '''
+        othernames = [entry.GetCutname() for entry in othercuts]
+        result = [entry for entry in self._cutlist if not entry.GetCutname() in othernames]
+        result.extend(othercuts)
+        return result
+    
+    def _MakeCacheKey(self, mode, dims, cuts):
+        '''
+        Build key for the projection cache from the projection mode, the projected dimensions
+        and the cut list, normalised to the bin ranges of the cuts which restrict an axis
+        '''
+        ranges = {}
+        for entry in cuts:
+            binrange = self._GetCutBinRange(entry)
+            if binrange:
+                ranges[self._axisdefinition.FindAxis(entry.GetCutname())] = binrange
+        return (mode, tuple(dims), tuple(sorted(ranges.items())))
+    
+    def _GetCutBinRange(self, entry):
+        '''
+        Get the bin range (first, last) selected by a cut. Returns None in case the cut
+        covers the full axis, including underflow and overflow bin.
+        '''
+        myaxis = self._rootthnsparse.GetAxis(self._axisdefinition.FindAxis(entry.GetCutname()))
+        minv = 0 if entry.GetMinimum() is None else myaxis.FindBin(entry.GetMinimum())
+        maxv = myaxis.GetNbins()+1 if entry.GetMaximum() is None else myaxis.FindBin(entry.GetMaximum())
+        if minv <= 0 and maxv >= myaxis.GetNbins()+1:
+            return None
+        return (minv, maxv)
+    
     def _PrepareProjection(self):
         '''
         Apply all requested cuts before the projection
         '''
         for entry in self._cutlist:
             myaxis = self._rootthnsparse.GetAxis(self._axisdefinition.FindAxis(entry.GetCutname()))
-            minv = 0 if not entry.GetMinimum() else myaxis.FindBin(entry.GetMinimum())
-            maxv = myaxis.GetNbins()+1 if not entry.GetMaximum() else myaxis.FindBin(entry.GetMaximum())
-            myaxis.SetRange(minv, maxv)
+            binrange = self._GetCutBinRange(entry)
+            if binrange:
+                myaxis.SetRange(binrange[0], binrange[1])
+            else:
+                myaxis.SetRange(0, myaxis.GetNbins()+1)
             
     def _CleanumProjection(self):
         '''
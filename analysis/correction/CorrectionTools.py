@@ -28,9 +28,15 @@ Corrections are done in 1D
 
 from math import pi
 from copy import deepcopy
+import re
 from ROOT import TF1
+import numpy as np
 
+from base.Helper import GetHistogramArrays, SetHistogramArrays
+from base.SpectrumFitter import PolynomialModel, GetFitPoints, FitArrays
 from correction.EfficiencyCorrectionQAPlots import EfficiencyCorrectionPlot, EfficienyFitPlot
+from util.FitDriver import FitDriver
+from util.ToyMC import ToyMCPropagator
 
 class CorrectionQA(object):
     """
@@ -113,11 +119,12 @@ class EfficiencyCorrection(object):
         correctedspectrum = self._ApplyCorrection()
         if self._resolutionCorrection:
             # Apply also resolution correction
-            for mybin in range(1, correctedspectrum.GetXaxis().GetNbins()+1):
-                bincenter = correctedspectrum.GetXaxis().GetBinCenter(mybin) 
-                correctionfactor = self._resolutionCorrection.Eval(bincenter)
-                correctedspectrum.SetBinContent(mybin, correctedspectrum.GetBinContent(mybin)*correctionfactor)
-                correctedspectrum.SetBinError(mybin, correctedspectrum.GetBinError(mybin)*correctionfactor)
+            edges, contents, errors = GetHistogramArrays(correctedspectrum)
+            bincenters = 0.5 * (edges[:-1] + edges[1:])
+            correctionfactors = np.array([self._resolutionCorrection.Eval(bincenter) for bincenter in bincenters])
+            contents[1:-1] *= correctionfactors
+            errors[1:-1] *= correctionfactors
+            SetHistogramArrays(correctedspectrum, contents, errors)
         self._correctionQA.AddQAPlot("EfficiencyCorrection", EfficiencyCorrectionPlot(self._rawspectrum, correctedspectrum))
         return correctedspectrum
     
@@ -161,8 +168,8 @@ class EfficiencyCorrectionBinByBin(EfficiencyCorrection):
         """
         Apply efficiency correction
         """
-        result = deepcopy(self.__rawspectrum)
-        result.Divide(self.__rawspectrum, self.__efficiency, 1., 1., 'b')
+        result = deepcopy(self._rawspectrum)
+        result.Divide(self._rawspectrum, self._rawefficiency, 1., 1., 'b')
         return result
   
 class EfficiencyCorrectionModel(EfficiencyCorrection):
@@ -181,42 +188,142 @@ class EfficiencyCorrectionModel(EfficiencyCorrection):
         EfficiencyCorrection.__init__(self, rawspectum, rawefficiency)
         self._model = model
         self._fits = {}
+        self._toysettings = None
+        self._toyband = None
+        self._nworkers = 1
+        
+    def SetNumberOfWorkers(self, nworkers):
+        """
+        Set the number of worker processes running the efficiency fits (central fit and fits
+        to the points moved up and down by their errors)
+        
+        :param nworkers: number of worker processes
+        :type nworkers: int
+        """
+        self._nworkers = nworkers
+        
+    def SetToyUncertainties(self, ntoys = 1000, nworkers = 1, seed = None):
+        """
+        Estimate the uncertainty of the efficiency fit with toys: the efficiency is resampled
+        within its errors and refitted for each toy, and the 1 sigma band of the fits at the
+        bin centres of the raw spectrum is used instead of the fits to the shifted points.
+        
+        :param ntoys: number of toys
+        :type ntoys: int
+        :param nworkers: number of worker processes running the toys
+        :type nworkers: int
+        :param seed: master seed of the toys
+        :type seed: int
+        """
+        self._toysettings = {"ntoys":ntoys, "nworkers":nworkers, "seed":seed}
+        
+    def GetToyBand(self):
+        """
+        Get the band of the efficiency fits from the toys
+        
+        :return: median, lower and upper band at the bin centres of the raw spectrum (None if toys are not used)
+        :rtype: tuple
+        """
+        return self._toyband
         
     def __MakeEfficencyFit(self):
         """
         Make fit of the efficiency with the given parameterization
-        For error estimation also move up or down the points by their errors
-        """
-        self._fits["center"] = self.__FitEfficiency(self._rawefficiency)
+        For error estimation also move up or down the points by their errors,
+        or refit resampled points (toys)
+        """
+        variations = ["center"] if self._toysettings else ["center", "lower", "upper"]
+        if re.match(r"^pol\d$", self._model):
+            self.__RunEfficiencyFits(variations)
+        else:
+            for variation in variations:
+                self._fits[variation] = self.__FitEfficiency(self.__GetMovedPoints(variation))
         self._correctionQA.AddQAPlot("FitQA", EfficienyFitPlot(self._rawefficiency, self._fits["center"]))
-
-        # Move all points up by their uncertainty
-        def GetMovedPoints(inputspectrum, isUpper):
-            """
-            Local helper function moving all points by their errors
+        if self._toysettings:
+            self._toyband = self.__MakeToyBand()
             
-            :param inputspectrum: Input spectrum
-            :type inputspectrum: TH1
-            :param isUpper: If true, points will be move up, otherwise down
-            :type isUpper: bool
-            """
-            result = deepcopy(inputspectrum)
-            for point in range(1, result.GetXaxis().GetNbins()+1):
-                value = result.GetBinContent(point) 
-                error = result.GetBinError(point)
-                result.SetBinContent(point, value + error if isUpper else value - error)
-            return result
-
-        spectrumlow = GetMovedPoints(self._rawefficiency, False)
-        self._fits["lower"] = self.__FitEfficiency(spectrumlow)
-        spectrumhigh = GetMovedPoints(self._rawefficiency, True)
-        self._fits["upper"] = self.__FitEfficiency(spectrumhigh)
+    def __GetMovedPoints(self, variation):
+        """
+        Get efficiency with all points moved by their errors: down for variation "lower",
+        up for variation "upper", unchanged for "center"
+        
+        :param variation: variation of the points
+        :type variation: str
+        :return: moved efficiency
+        :rtype: TH1
+        """
+        if variation == "center":
+            return self._rawefficiency
+        result = deepcopy(self._rawefficiency)
+        for point in range(1, result.GetXaxis().GetNbins()+1):
+            value = result.GetBinContent(point) 
+            error = result.GetBinError(point)
+            result.SetBinContent(point, value + error if variation == "upper" else value - error)
+        return result
+    
+    def __RunEfficiencyFits(self, variations):
+        """
+        Fit polynomial efficiency models to the efficiency (and the points moved by their errors)
+        with the fit driver, running the fits in parallel with more than one worker
+        
+        :param variations: variations of the points to be fitted ("center", "lower", "upper")
+        :type variations: list
+        """
+        edges, contents, errors = GetHistogramArrays(self._rawefficiency)
+        shifts = {"center":0., "lower":-1., "upper":1.}
+        driver = FitDriver(self._nworkers)
+        models = {}
+        for variation in variations:
+            models[variation] = PolynomialModel(int(self._model[3:]))
+            models[variation].SetFunctionName("efficiencyModel")
+            driver.AddJob(variation, (edges, contents + shifts[variation] * errors, errors), models[variation], 10., 70.)
+        driver.Run()
+        for variation in variations:
+            self._fits[variation] = models[variation].GetFunction()
+        
+    def __MakeToyBand(self):
+        """
+        Refit the efficiency for resampled points and evaluate the fits at the bin centres
+        of the raw spectrum
+        """
+        nbins = self._rawefficiency.GetXaxis().GetNbins()
+        values = [self._rawefficiency.GetBinContent(ibin) for ibin in range(1, nbins+1)]
+        errors = [self._rawefficiency.GetBinError(ibin) for ibin in range(1, nbins+1)]
+        bincenters = [self._rawspectrum.GetXaxis().GetBinCenter(ibin) for ibin in range(1, self._rawspectrum.GetXaxis().GetNbins()+1)]
+        if re.match(r"^pol\d$", self._model):
+            # same least squares fit on arrays as for the central fit
+            edges, contents, binerrors = GetHistogramArrays(self._rawefficiency)
+            model = PolynomialModel(int(self._model[3:]))
+            def FitToy(sample):
+                """
+                Fit one resampled efficiency
+                """
+                toycontents = contents.copy()
+                toycontents[1:nbins+1] = sample
+                x, y, ey = GetFitPoints((edges, toycontents, binerrors), 10., 70.)
+                FitArrays(model, x, y, ey)
+                return model.Evaluate(bincenters)
+        else:
+            def FitToy(sample):
+                """
+                Fit one resampled efficiency
+                """
+                toyefficiency = deepcopy(self._rawefficiency)
+                for ibin in range(0, nbins):
+                    toyefficiency.SetBinContent(ibin+1, sample[ibin])
+                fit = self.__FitEfficiency(toyefficiency)
+                return [fit.Eval(bincenter) for bincenter in bincenters]
+        propagator = ToyMCPropagator(FitToy, values, errors)
+        propagator.SetNumberOfToys(self._toysettings["ntoys"])
+        propagator.SetNumberOfWorkers(self._toysettings["nworkers"])
+        propagator.SetSeed(self._toysettings["seed"])
+        return propagator.GetPercentileBand()
         
     def __FitEfficiency(self, inputvalues):
         """
         Fit efficiency by a given model
         """
-        result = TF1("efficiencyModel", self.__model, 0., 100.)
+        result = TF1("efficiencyModel", self._model, 0., 100.)
         inputvalues.Fit(result, "N", "", 10, 70)
         return result
 
@@ -225,7 +332,7 @@ class EfficiencyCorrectionModel(EfficiencyCorrection):
         Apply efficiency correction
         """
         self.__MakeEfficencyFit()
-        result = deepcopy(self.__rawspectrum)
+        result = deepcopy(self._rawspectrum)
         for ibin in range(1, result.GetXaxis().GetNbins() +1):
             bcent = result.GetXaxis().GetBinCenter(ibin)
             effval = self._fits["center"].Eval(bcent)
@@ -233,8 +340,12 @@ class EfficiencyCorrectionModel(EfficiencyCorrection):
             
             # apply error propagation
             # divide upper value by lower efficiency and vice versa
-            efflow = self._fits["lower"].Eval(bcent)
-            effhigh = self._fits["upper"].Eval(bcent)
+            if self._toyband:
+                efflow = self._toyband[1][ibin-1]
+                effhigh = self._toyband[2][ibin-1]
+            else:
+                efflow = self._fits["lower"].Eval(bcent)
+                effhigh = self._fits["upper"].Eval(bcent)
             ehigh = (result.GetBinContent(ibin) + result.GetBinError(ibin))/efflow - y 
             elow = y - (result.GetBinContent(ibin) - result.GetBinError(ibin))/effhigh
             result.SetBinContent(ibin, y)
@@ -277,9 +388,10 @@ class Normalizer(object):
         :rtype: TH1
         """
         deta = abs(self.__etarange["max"] - self.__etarange["min"])
-        result = deepcopy(self.__efficiencyCorrected)
-        for ib in range(1, self.__efficiencyCorrected.GetXaxis().GetNbins()+1):
-            factor = 1/(2*pi*self.__efficiencyCorrected.GetXaxis().GetBinCenter(ib)*deta)
-            result.SetBinContent(ib, result.GetBinContent(ib)*factor)
-            result.SetBinError(ib, result.GetBinError(ib)*factor)
+        result = deepcopy(self.__correctedspectrum)
+        edges, contents, errors = GetHistogramArrays(result)
+        factors = 1/(2*pi*0.5*(edges[:-1] + edges[1:])*deta)
+        contents[1:-1] *= factors
+        errors[1:-1] *= factors
+        SetHistogramArrays(result, contents, errors)
         return result
\ No newline at end of file
@@ -5,6 +5,7 @@ Created on 22.09.2014
 '''
 
 from base.SpectrumFitter import MinBiasFitter, TriggeredSpectrumFitter
+from util.FitDriver import FitDriver
 import numpy as np
 
 class TriggeredSpectrumScaler(object):
@@ -13,13 +14,17 @@ class TriggeredSpectrumScaler(object):
     '''
 
 
-    def __init__(self, minbiasspectrum, triggeredSpectrum):
+    def __init__(self, minbiasspectrum, triggeredSpectrum, nworkers = 1):
         """
-        Constructor
+        Constructor, fitting min. bias and triggered spectrum (in parallel with more than one worker)
         """
         self.__triggeredspectrum = triggeredSpectrum
-        self.__mbfitter = MinBiasFitter("minbiasfitter", minbiasspectrum)
-        self.__trfitter = TriggeredSpectrumFitter("triggeredfittter", self.__triggeredspectrum)
+        self.__mbfitter = MinBiasFitter("minbiasfitter", minbiasspectrum, doFit = False)
+        self.__trfitter = TriggeredSpectrumFitter("triggeredfittter", self.__triggeredspectrum, doFit = False)
+        driver = FitDriver(nworkers)
+        driver.AddFitter("minbias", self.__mbfitter)
+        driver.AddFitter("triggered", self.__trfitter)
+        driver.Run()
         self.__isScaled = False
         
     def ScaleDownTriggeredSpectrum(self):
@@ -28,11 +33,8 @@ class TriggeredSpectrumScaler(object):
         evaluated from the two fits above 60 GeV
         """
         if not self.__isScaled:
-            pointlist = [60,65,70,75,80,85]
-            scalingfactors = []
-            for point in pointlist:
-                scalingfactors.append(self.__mbfitter.GetParameterisedValueAt(point)/self.__trfitter.GetParameterisedValueAt(point))
-            scalingfactor = np.array(scalingfactors, np.float64).mean()
+            pointlist = np.array([60,65,70,75,80,85], np.float64)
+            scalingfactor = (self.__mbfitter.GetParameterisedValueAt(pointlist)/self.__trfitter.GetParameterisedValueAt(pointlist)).mean()
             print "Using scaling factor %.2f" %(scalingfactor)
             self.__triggeredspectrum.Scale(scalingfactor)
             self.__isScaled = True
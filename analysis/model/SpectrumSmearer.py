@@ -4,7 +4,8 @@ Created on Apr 13, 2015
 @author: markus
 '''
 from copy import deepcopy
-import random
+import numpy as np
+from util.ToyMC import MakeRandomGenerator, ToyMCPropagator
 
 class SpectrumSmearer(object):
     '''
@@ -18,52 +19,153 @@ class SpectrumSmearer(object):
         self.__inputspectrum = spectrum
         self.__niterations  = 1000
         self.__smearmodel = None
-        
+        self.__seed = None
+        self.__chunksize = 1000000
+        self.__ngridpoints = 10000
+        self.__responsematrix = None
+
     def SetNumberOfIterations(self, niter):
         """
         Set the number of iterations
         """
         self.__niterations = niter
-        
+        self.__responsematrix = None
+
     def SetSmearModel(self, model):
         """
-        Set the model used for the smearing
+        Set the model used for the smearing. The model provides the resolution (width of the
+        gaussian response) as function of the value. Python callables are evaluated directly
+        on arrays of values, objects with an Eval method (i.e. TF1) are tabulated on a grid
+        over the spectrum range and interpolated linearly.
         """
         self.__smearmodel = model
-        
+        self.__responsematrix = None
+
+    def SetSeed(self, seed):
+        """
+        Set the seed of the random generator, making the smearing reproducible
+        """
+        self.__seed = seed
+        self.__responsematrix = None
+
+    def SetChunkSize(self, chunksize):
+        """
+        Set the maximum number of trials generated at once. Bins with more iterations
+        are processed in chunks, keeping the memory consumption bounded.
+        """
+        self.__chunksize = chunksize
+
+    def SetNumberOfGridPoints(self, ngridpoints):
+        """
+        Set the number of points at which models with Eval method are tabulated
+        """
+        self.__ngridpoints = ngridpoints
+        self.__responsematrix = None
+
+    def GetBinning(self):
+        """
+        Get the bin limits of the input spectrum
+
+        :return: bin limits
+        :rtype: numpy.ndarray
+        """
+        axis = self.__inputspectrum.GetXaxis()
+        nbins = axis.GetNbins()
+        return np.array([axis.GetBinLowEdge(ibin) for ibin in range(1, nbins + 1)] + [axis.GetBinUpEdge(nbins)])
+
+    def GetResponseMatrix(self):
+        """
+        Get the response matrix of the smearing: the element (i, j) is the fraction of trials
+        generated in bin i which are reconstructed in bin j (trials outside the spectrum
+        range are lost). The matrix is generated once and reused until the settings change.
+
+        :return: response matrix (number of bins x number of bins)
+        :rtype: numpy.ndarray
+        """
+        if self.__responsematrix is None:
+            self.__responsematrix = self.__GenerateResponse()
+        return self.__responsematrix
+
+    def __MakeModelEvaluator(self, xmin, xmax):
+        """
+        Create function evaluating the smear model on arrays of values
+        """
+        if not hasattr(self.__smearmodel, "Eval"):
+            return self.__smearmodel
+        grid = np.linspace(xmin, xmax, self.__ngridpoints)
+        values = np.array([self.__smearmodel.Eval(x) for x in grid])
+        return lambda x: np.interp(x, grid, values)
+
+    def __GenerateResponse(self):
+        """
+        Generate the response matrix: for each bin randomly generate values within the bin,
+        and generate a gaussian response using the smear model for the width. Trials are
+        generated in chunks and histogrammed per chunk.
+        """
+        edges = self.GetBinning()
+        nbins = len(edges) - 1
+        model = self.__MakeModelEvaluator(edges[0], edges[-1])
+        generator = MakeRandomGenerator(self.__seed)
+        response = np.zeros((nbins, nbins))
+        for ibin in range(0, nbins):
+            remaining = self.__niterations
+            while remaining > 0:
+                ntrials = min(remaining, self.__chunksize)
+                binvals = generator.uniform(edges[ibin], edges[ibin+1], ntrials)
+                # widths below 0 (i.e. tabulated models dipping below 0 at the edges) are treated as no smearing
+                generated = generator.normal(binvals, np.maximum(model(binvals), 0.))
+                response[ibin] += np.histogram(generated, edges)[0]
+                remaining -= ntrials
+        return response / float(self.__niterations)
+
     def RunSmearing(self):
         """
         Run smearing of the input spectrum
             - randomly generate values within the bin, and generate a gaussian response
               using the smear model for the width
-            - Fill target bin with weight sigma(bin)/ntiterations
+            - Fill target bin with weight content(bin)/ntiterations
+            - Errors are obtained from smearing the errors of the input spectrum in the same way
         """
-        random.seed()
+        response = self.GetResponseMatrix()
+        nbins = response.shape[0]
+        contents, errors = self.__GetInputValues()
+        smearedcontents = contents.dot(response)
+        smearederrors = errors.dot(response)
+
         smearedspectrum = deepcopy(self.__inputspectrum)
-        # For error propagation
-        smearederror = deepcopy(self.__inputspectrum)
-        for jbin in range(1,smearedspectrum.GetXaxis().GetNbins()+1):
-            smearedspectrum.SetBinContent(jbin, 0)
-            smearedspectrum.SetBinError(jbin, 0)
-            smearederror.SetBinContent(jbin, 0)
-            smearederror.SetBinError(jbin, 0)
-        smearedspectrum.SetName("%sSmeared" %(self.__inputspectrum))
-        
-        # run actual smearing
-        for ibin in range(1, self.__spectrum.GetXaxis().GetNbins()+1):
-            weight = self.__inputspectrum.GetBinContent(ibin)/self.__niterations
-            weighthigh = (self.__inputspectrum.GetBinContent(ibin)+self.__inputspectrum.GetBinError(ibin))/self.__niterations
-            for itrial in range(0, self.__niterations):
-                binval = random.uniform(self.__inputspectrum.GetXaxis().GetBinLowEdge(ibin), self.__inputspectrum.GetXaxis().GetBinUpEdge(ibin))
-                # get the response
-                generated = random.gauss(binval, self.__smearmodel.Eval(binval))
-                binInSpectrum = smearedspectrum.GetXaxis().FindBin(generated)
-                if binInSpectrum < 1 or binInSpectrum >= smearedspectrum.GetXaxis().GetNbins():
-                    continue
-                smearedspectrum.Fill(generated, weight)
-                smearederror.Fill(generated, weighthigh)
-        
-        # Fix errors
-        for ibin in range(1, self.__spectrum.GetXaxis().GetNbins()+1):
-            smearedspectrum.SetBinError(smearederror.GetBinContent(ibin) - smearedspectrum.GetBinContent(ibin))
-        return smearedspectrum
\ No newline at end of file
+        smearedspectrum.SetName("%sSmeared" %(self.__inputspectrum.GetName()))
+        for jbin in range(0, nbins):
+            smearedspectrum.SetBinContent(jbin + 1, smearedcontents[jbin])
+            smearedspectrum.SetBinError(jbin + 1, smearederrors[jbin])
+        return smearedspectrum
+
+    def GetToyUncertainties(self, ntoys = 1000, nworkers = 1, seed = None):
+        """
+        Propagate the uncertainties of the input spectrum through the smearing with toys:
+        the input spectrum is resampled within its errors and smeared for each toy.
+
+        :param ntoys: number of toys
+        :type ntoys: int
+        :param nworkers: number of worker processes
+        :type nworkers: int
+        :param seed: master seed of the toys
+        :type seed: int
+        :return: median, lower and upper 1 sigma band of the smeared spectrum
+        :rtype: tuple
+        """
+        response = self.GetResponseMatrix()
+        contents, errors = self.__GetInputValues()
+        propagator = ToyMCPropagator(lambda sample: sample.dot(response), contents, errors)
+        propagator.SetNumberOfToys(ntoys)
+        propagator.SetNumberOfWorkers(nworkers)
+        propagator.SetSeed(seed)
+        return propagator.GetPercentileBand()
+
+    def __GetInputValues(self):
+        """
+        Get bin contents and errors of the input spectrum as arrays
+        """
+        nbins = self.__inputspectrum.GetXaxis().GetNbins()
+        contents = np.array([self.__inputspectrum.GetBinContent(ibin) for ibin in range(1, nbins + 1)])
+        errors = np.array([self.__inputspectrum.GetBinError(ibin) for ibin in range(1, nbins + 1)])
+        return contents, errors
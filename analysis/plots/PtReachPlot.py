@@ -4,27 +4,36 @@ Created on 17.09.2014
 @author: markusfasel
 '''
 
-from util.PtReachCalculation import PtReachCalculator
 from base.DataCollection import DataCollection, Datapoint
 from base.Graphics import SinglePanelPlot, Frame, GraphicsObject
 from ROOT import TFile
 
 class PtReachData:    
     
-    def __init__(self, name, data, isMinBias, doIntegral = True):
-        self.__calculator = PtReachCalculator(name, data, isMinBias, 50)
+    # Numbers of events at which the pt reach is evaluated
+    DefaultEvents = [500000, 1000000, 20000000, 50000000, 100000000, 200000000, 300000000, 400000000, 500000000, 750000000, 1000000000]
+    
+    def __init__(self, name, events, ptreach, doIntegral = True):
+        """
+        Constructor
+        
+        :param name: name of the trigger
+        :type name: str
+        :param events: numbers of events
+        :type events: list
+        :param ptreach: pt reach for the numbers of events (i.e. one row of CalculatePtReachMatrix)
+        :type ptreach: numpy.ndarray
+        :param doIntegral: pt reach calculated from the integrated yield
+        :type doIntegral: bool
+        """
         self.__data = DataCollection("data%s" %(name))
         self.__isIntegral = doIntegral
         self.__rootobject = None
-        self.__CreateData()
+        self.__CreateData(events, ptreach)
         
-    def __CreateData(self):
-        events = [500000, 1000000, 20000000, 50000000, 100000000, 200000000, 300000000, 400000000, 500000000, 750000000, 1000000000]
-        PtReachCalculation = lambda p : self.__calculator.GetPtReach(p)
-        if self.__isIntegral:
-            PtReachCalculation = lambda p : self.__calculator.GetPtReachForIntegral(p)
-        for nevents in events:
-            self.__data.AddDataPoint(Datapoint(nevents, PtReachCalculation(nevents), 0.))
+    def __CreateData(self, events, ptreach):
+        for nevents, value in zip(events, ptreach):
+            self.__data.AddDataPoint(Datapoint(nevents, value, 0.))
             
     def MakeGraphics(self):
         if not self.__rootobject:
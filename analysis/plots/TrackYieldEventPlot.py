@@ -8,6 +8,7 @@ from base.Graphics import TwoPanelPlot, GraphicsObject, Style, Frame
 from base.SpectrumFitter import SpectrumFitter
 from base.DataCollection import DataCollection, Datapoint
 from copy import deepcopy
+import numpy as np
 from ROOT import kRed, kBlue, kBlack, TF1, TList, TFile, TObject
 
 class YieldCalculator:
@@ -31,17 +32,19 @@ class YieldCalculator:
         return histo
     
     def FindMaxPt(self, nevents, limit):
-        dndpthist = self.GetRawYieldsForNumberOfEvents(nevents)
-        binabove = -1
-        for mybin in range(2, dndpthist.GetXaxis().GetNbins() + 1):
-            if dndpthist.GetBinContent(mybin) >= limit:
-                binabove = mybin
-            else:
-                # we are below the limit, so break
-                break
-        if binabove == -1:
-            return 0
-        return dndpthist.GetBinCenter(mybin)
+        """
+        Find the max. pt for numbers of events (scalar or array): center of the first 10 GeV bin
+        (starting from the second) with less tracks than the limit (last bin if all are above,
+        0 if already the first bin is below). The binned yields are calculated once for all
+        numbers of events.
+        """
+        edges = np.linspace(0., 1000., 101)[1:]
+        centers = 0.5 * (edges[:-1] + edges[1:])
+        yields = self.__fitter.CalculateIntegral(edges[:-1], edges[1:])
+        above = np.outer(np.atleast_1d(nevents), yields) >= limit
+        firstbelow = np.where(above.all(axis = 1), len(centers) - 1, np.argmin(above, axis = 1))
+        result = np.where(firstbelow > 0, centers[firstbelow], 0.)
+        return result if np.ndim(nevents) else result[0]
     
 class EvDepPtReachData:
     
@@ -66,8 +69,8 @@ class EvDepPtReachData:
         
     def __CreateCurve(self):
         eventstocheck = [1e6, 2e6, 5e6, 1e7, 5e7, 1e8, 5e8, 1e9, 5e9, 1e10, 5e10, 1e11, 5e11]
-        for point in eventstocheck:
-            self.__points.AddDataPoint(Datapoint(point, self.__datamodel.FindMaxPt(point, self.__limit), 0))
+        for point, maxpt in zip(eventstocheck, self.__datamodel.FindMaxPt(np.array(eventstocheck), self.__limit)):
+            self.__points.AddDataPoint(Datapoint(point, maxpt, 0))
         self.__CreatePowerLawParameterisation()
 
     def GetGraphics(self, style):
@@ -0,0 +1,30 @@
+'''
+Comparison of the pt spectra for the different track cuts, projected in one pass
+with ProjectionGroupBy on the trackcuts axis
+'''
+
+from base.FileHandler import LegoTrainFileReader
+
+def MakeSpectraForTrackCuts(container):
+    """
+    Make normalised pt spectra for all track cuts at once (track cuts are not selected,
+    old data format with trackcuts axis)
+    """
+    inputcontainer = container.FindTrackContainer("tracksAll")
+    inputcontainer.SetVertexRange(-10., 10.)
+    inputcontainer.SetPileupRejection(True)
+    return inputcontainer.MakeProjectionsGroupBy(0, "trackcuts", "ptSpectrumTrackCuts")
+
+def CompareTrackCuts(filename, trigger):
+    """
+    Print the ratio of the spectra for the different track cuts to the spectrum of the first set of cuts
+    """
+    reader = LegoTrainFileReader(filename)
+    content = reader.ReadFile()
+    spectra = MakeSpectraForTrackCuts(content.GetData(trigger))
+    reference = spectra.values()[0]
+    for cutID, spectrum in spectra.iteritems():
+        ratio = spectrum.Clone("%sRatio" %(spectrum.GetName()))
+        ratio.Divide(reference)
+        print "Track cuts %d: ratio to cuts %d in the first bin %f" %(int(cutID), int(spectra.keys()[0]), ratio.GetBinContent(1))
+    return spectra
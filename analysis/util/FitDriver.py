@@ -0,0 +1,274 @@
+#**************************************************************************
+#* Copyright(c) 1998-2015, ALICE Experiment at CERN, All rights reserved. *
+#*                                                                        *
+#* Author: The ALICE Off-line Project.                                    *
+#* Contributors are mentioned in the code where appropriate.              *
+#*                                                                        *
+#* Permission to use, copy, modify and distribute this software and its   *
+#* documentation strictly for non-commercial purposes is hereby granted   *
+#* without fee, provided that the above copyright notice appears in all   *
+#* copies and that both the copyright notice and this permission notice   *
+#* appear in the supporting documentation. The authors make no claims     *
+#* about the suitability of this software for any purpose. It is          *
+#* provided "as is" without express or implied warranty.                  *
+#**************************************************************************
+"""
+Driver running independent spectrum fits (i.e. fits of different triggers, or systematic
+variations of fit ranges and models) in a pool of worker processes. The data of each job
+is converted into arrays (bin edges, contents and errors) when the job is added, so the
+workers only run the least squares fit on arrays. Results (parameters, covariance, chi2)
+are sent back as FitResult objects and applied to the models in the parent process.
+Jobs found in the fit cache are not sent to the workers. Jobs using the ROOT fit
+backend (TH1::Fit) are fitted in the parent process.
+
+:organization: ALICE Collaboration
+:copyright: 1998-2015, ALICE Experiment at CERN, All rights reserved.
+
+:author: Markus Fasel
+:contact: markus.fasel@cern.ch
+:organization: Lawrence Berkeley National Laboratory
+"""
+
+from collections import OrderedDict
+from multiprocessing import Pool
+from ROOT import TH1D
+from base.Helper import GetHistogramArrays, SetHistogramArrays
+from base.SpectrumFitter import SpectrumFitter, GetFitPoints, FitArrays, MakeFitKey
+
+# driver processed by the worker processes, inherited at fork
+_gDriver = None
+
+def _RunFitJob(name):
+    """
+    Process one fit job of the current driver in a worker process
+    """
+    return _gDriver.RunJob(name)
+
+class FitJob(object):
+    """
+    Definition of a fit: data (as arrays), model and fit range
+    """
+
+    def __init__(self, data, model, rangemin, rangemax, fitter = None, backend = None):
+        """
+        Constructor
+
+        :param data: histogram or tuple of arrays (bin edges, contents, errors) with under- and overflow bins
+        :type data: TH1 or tuple
+        :param model: model to be fitted
+        :type model: FitModel
+        :param rangemin: lower limit of the fit range
+        :type rangemin: float
+        :param rangemax: upper limit of the fit range
+        :type rangemax: float
+        :param fitter: spectrum fitter taking over the result (optional)
+        :type fitter: SpectrumFitter
+        :param backend: fit backend, "root" or "scipy" (default: backend of the fitter or the default backend of the SpectrumFitter)
+        :type backend: str
+        """
+        self.__histogram = None if isinstance(data, tuple) else data
+        self.__data = data if isinstance(data, tuple) else GetHistogramArrays(data)
+        self.__model = model
+        self.__range = (rangemin, rangemax)
+        self.__fitter = fitter
+        self.__backend = backend
+        if not self.__backend:
+            self.__backend = fitter.GetFitBackend() if fitter else SpectrumFitter.DefaultBackend
+
+    def GetData(self):
+        return self.__data
+
+    def GetModel(self):
+        return self.__model
+
+    def GetRange(self):
+        return self.__range
+
+    def GetFitter(self):
+        return self.__fitter
+
+    def GetKey(self):
+        """
+        Get the key of the fit in the fit cache
+        """
+        return MakeFitKey(self.__model, self.__data, self.__range[0], self.__range[1])
+    
+    def IsLocal(self):
+        """
+        Check whether the job needs to be run in the parent process (ROOT fit backend)
+        """
+        return self.__backend == "root"
+
+    def Fit(self):
+        """
+        Fit the model to the data in the fit range. Jobs with the ROOT backend are fitted
+        by the fitter, or with TH1::Fit on the histogram (built from the arrays if needed).
+
+        :return: result of the fit (None for the ROOT backend)
+        :rtype: FitResult
+        """
+        if self.IsLocal():
+            if self.__fitter:
+                self.__fitter.DoFit(self.__range[0], self.__range[1])
+                return self.__fitter.GetFitResult()
+            self.__GetHistogram().Fit(self.__model.GetFunction(), "N", "", self.__range[0], self.__range[1])
+            self.__model.SyncFromFunction()
+            return None
+        x, y, ey = GetFitPoints(self.__data, self.__range[0], self.__range[1])
+        return FitArrays(self.__model, x, y, ey)
+
+    def __GetHistogram(self):
+        """
+        Get the data as histogram, built from the arrays in case the job was defined with arrays
+        """
+        if not self.__histogram:
+            edges, contents, errors = self.__data
+            self.__histogram = TH1D("fitjobdata", "", len(edges) - 1, edges)
+            self.__histogram.SetDirectory(0)
+            SetHistogramArrays(self.__histogram, contents, errors)
+        return self.__histogram
+
+class FitDriver(object):
+    """
+    Driver running a list of independent fit jobs, in parallel if more than one
+    worker is requested
+    """
+
+    def __init__(self, nworkers = 1):
+        """
+        Constructor
+
+        :param nworkers: number of worker processes
+        :type nworkers: int
+        """
+        self.__nworkers = nworkers
+        self.__jobs = OrderedDict()
+        self.__results = OrderedDict()
+        self.__fitcache = SpectrumFitter.DefaultFitCache
+
+    def SetNumberOfWorkers(self, nworkers):
+        """
+        Set the number of worker processes
+        """
+        self.__nworkers = nworkers
+
+    def SetFitCache(self, fitcache):
+        """
+        Set the cache of fit results (default: the default fit cache of the SpectrumFitter)
+        """
+        self.__fitcache = fitcache
+
+    def AddJob(self, name, data, model, rangemin, rangemax, backend = None):
+        """
+        Add new fit job. Without backend the default backend of the SpectrumFitter is used.
+
+        :param name: name of the job
+        :type name: str
+        :param data: histogram or tuple of arrays (bin edges, contents, errors) with under- and overflow bins
+        :type data: TH1 or tuple
+        :param model: model to be fitted
+        :type model: FitModel
+        :param rangemin: lower limit of the fit range
+        :type rangemin: float
+        :param rangemax: upper limit of the fit range
+        :type rangemax: float
+        :param backend: fit backend, "root" or "scipy"
+        :type backend: str
+        """
+        self.__jobs[name] = FitJob(data, model, rangemin, rangemax, backend = backend)
+
+    def AddFitter(self, name, fitter, rangemin = None, rangemax = None):
+        """
+        Add fit job for a spectrum fitter. The fitter takes over the result. Without range the
+        fit range of the fitter is used. Fitters with the ROOT fit backend are fitted by the
+        fitter itself in the parent process.
+
+        :param name: name of the job
+        :type name: str
+        :param fitter: spectrum fitter
+        :type fitter: SpectrumFitter
+        :param rangemin: lower limit of the fit range
+        :type rangemin: float
+        :param rangemax: upper limit of the fit range
+        :type rangemax: float
+        """
+        if rangemin is None or rangemax is None:
+            rangemin, rangemax = fitter.GetFitRange()
+        self.__jobs[name] = FitJob(fitter.GetData(), fitter.GetFitModel(), rangemin, rangemax, fitter)
+
+    def GetListOfJobs(self):
+        """
+        Get the names of the jobs, in the order they were added
+        """
+        return self.__jobs.keys()
+
+    def RunJob(self, name):
+        """
+        Run a single fit job
+
+        :param name: name of the job
+        :type name: str
+        :return: result of the fit
+        :rtype: FitResult
+        """
+        return self.__jobs[name].Fit()
+
+    def Run(self):
+        """
+        Run all fit jobs. The results are applied to the models (and fitters) of the jobs.
+        Results of jobs found in the fit cache are taken from there, new results are stored
+        in the cache. Jobs with the ROOT fit backend are run in the parent process and are
+        not cached.
+
+        :return: results of the fits, by job name in the order of the jobs (None for the ROOT backend)
+        :rtype: OrderedDict
+        """
+        global _gDriver
+        fitresults = {}
+        keys = {}
+        for name, job in self.__jobs.iteritems():
+            if job.IsLocal():
+                fitresults[name] = job.Fit()
+            elif self.__fitcache:
+                keys[name] = job.GetKey()
+                result = self.__fitcache.Read(keys[name])
+                if result:
+                    fitresults[name] = result
+        names = [name for name in self.__jobs.keys() if not name in fitresults]
+        if self.__nworkers < 2 or len(names) < 2:
+            results = [self.RunJob(name) for name in names]
+        else:
+            _gDriver = self
+            pool = Pool(min(self.__nworkers, len(names)))
+            try:
+                results = pool.map(_RunFitJob, names, 1)
+            finally:
+                pool.close()
+                pool.join()
+                _gDriver = None
+        if self.__fitcache:
+            for name, result in zip(names, results):
+                self.__fitcache.Write(keys[name], result)
+        fitresults.update(zip(names, results))
+        for name, job in self.__jobs.iteritems():
+            result = fitresults[name]
+            if job.IsLocal():
+                # model (and fitter) updated by the ROOT fit
+                pass
+            elif not job.GetFitter():
+                job.GetModel().SetFitParameters(result.parameters, result.errors)
+            else:
+                job.GetFitter().SetFitResult(result)
+            self.__results[name] = result
+        return self.__results
+
+    def GetResult(self, name):
+        """
+        Get the result of a fit job (after Run)
+
+        :param name: name of the job
+        :type name: str
+        :return: result of the fit
+        :rtype: FitResult
+        """
+        return self.__results[name]
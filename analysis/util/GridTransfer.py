@@ -0,0 +1,360 @@
+#**************************************************************************
+#* Copyright(c) 1998-2014, ALICE Experiment at CERN, All rights reserved. *
+#*                                                                        *
+#* Author: The ALICE Off-line Project.                                    *
+#* Contributors are mentioned in the code where appropriate.              *
+#*                                                                        *
+#* Permission to use, copy, modify and distribute this software and its   *
+#* documentation strictly for non-commercial purposes is hereby granted   *
+#* without fee, provided that the above copyright notice appears in all   *
+#* copies and that both the copyright notice and this permission notice   *
+#* appear in the supporting documentation. The authors make no claims     *
+#* about the suitability of this software for any purpose. It is          *
+#* provided "as is" without express or implied warranty.                  *
+#**************************************************************************
+"""
+Transfer of files from the grid. Files are copied by a bounded pool of worker threads,
+failed transfers are retried with exponential backoff. The state of the transfers is
+stored on disk, so that an interrupted transfer can be resumed. Copy and listing are
+delegated to a backend (alien or the local file system). Archives can be unpacked by
+the worker threads directly after the transfer.
+
+:organization: ALICE Collaboration
+:copyright: 1998-2014, ALICE Experiment at CERN, All rights reserved.
+
+:author: Markus Fasel
+:contact: markus.fasel@cern.ch
+:organization: Lawrence Berkeley National Laboratory
+"""
+
+import commands
+import json
+import os
+import shutil
+import threading
+import time
+import zipfile
+from Queue import Queue, Empty
+
+class TransferException(Exception):
+    """
+    Error handling for failed transfers
+    """
+
+    def __init__(self, message):
+        """
+        Constructor
+        """
+        self.__message = message
+
+    def __str__(self):
+        """
+        Make exception a string object
+        """
+        return self.__message
+
+class TransferBackend(object):
+    """
+    Interface for copy backends
+    """
+
+    # pure virtual methods:
+    def Copy(self, source, target):
+        """
+        Copy source file to the local target. Raises a TransferException in case of failure
+        """
+        pass
+
+    def List(self, directory):
+        """
+        List the content of a directory
+        """
+        pass
+
+class AlienBackend(TransferBackend):
+    """
+    Backend using the alien command line tools
+    """
+
+    def Copy(self, source, target):
+        status, output = commands.getstatusoutput("alien_cp alien://%s %s" %(source, target))
+        if status != 0 or not os.path.exists(target):
+            raise TransferException("alien_cp failed for %s: %s" %(source, output))
+
+    def List(self, directory):
+        status, output = commands.getstatusoutput("alien_ls %s" %(directory))
+        if status != 0:
+            raise TransferException("alien_ls failed for %s: %s" %(directory, output))
+        return [entry.strip() for entry in output.split("\n") if len(entry.strip())]
+
+class LocalBackend(TransferBackend):
+    """
+    Backend copying files from a local directory mirroring the grid structure
+    """
+
+    def __init__(self, basedir):
+        """
+        Constructor
+
+        :param basedir: local directory replacing the grid root
+        :type basedir: str
+        """
+        self.__basedir = basedir
+
+    def __GetLocalPath(self, path):
+        return os.path.join(self.__basedir, path.lstrip("/"))
+
+    def Copy(self, source, target):
+        localpath = self.__GetLocalPath(source)
+        if not os.path.exists(localpath):
+            raise TransferException("File %s not found" %(localpath))
+        shutil.copyfile(localpath, target)
+
+    def List(self, directory):
+        localpath = self.__GetLocalPath(directory)
+        if not os.path.isdir(localpath):
+            raise TransferException("Directory %s not found" %(localpath))
+        return sorted(os.listdir(localpath))
+
+def ExtractZipMember(archivename, member, outputdir = None):
+    """
+    Extract a single member of a zip archive. The member is streamed into a temporary
+    file in the output directory and renamed at the end. The working directory is not
+    changed, so extraction can run in parallel threads.
+
+    :param archivename: name of the zip archive
+    :type archivename: str
+    :param member: name of the member inside the archive
+    :type member: str
+    :param outputdir: directory of the extracted file (default: directory of the archive)
+    :type outputdir: str
+    :return: path of the extracted file
+    :rtype: str
+    """
+    if not outputdir:
+        outputdir = os.path.dirname(os.path.abspath(archivename))
+    outputfile = os.path.join(outputdir, os.path.basename(member))
+    tmpfile = "%s.part" %(outputfile)
+    try:
+        myarchive = zipfile.ZipFile(archivename)
+        try:
+            with myarchive.open(member) as instream:
+                with open(tmpfile, "wb") as outstream:
+                    shutil.copyfileobj(instream, outstream, 1048576)
+        finally:
+            myarchive.close()
+    except (zipfile.BadZipfile, KeyError) as e:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        raise TransferException("Cannot extract %s from %s: %s" %(member, archivename, str(e)))
+    os.rename(tmpfile, outputfile)
+    return outputfile
+
+def _RunThreads(nthreads, tasks, function):
+    """
+    Process tasks with a bounded number of threads
+    """
+    taskqueue = Queue()
+    for task in tasks:
+        taskqueue.put(task)
+    def Worker():
+        while True:
+            try:
+                task = taskqueue.get_nowait()
+            except Empty:
+                return
+            function(task)
+    threads = [threading.Thread(target = Worker) for i in range(0, min(nthreads, len(tasks)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+class ListingCache(object):
+    """
+    Cache for directory listings. Several directories can be listed in one batch in parallel.
+    """
+
+    def __init__(self, backend, nworkers = 4):
+        """
+        Constructor
+
+        :param backend: backend used for listing
+        :type backend: TransferBackend
+        :param nworkers: number of parallel listings
+        :type nworkers: int
+        """
+        self.__backend = backend
+        self.__nworkers = nworkers
+        self.__listings = {}
+        self.__lock = threading.Lock()
+
+    def List(self, directory):
+        """
+        Get the content of a directory, listed only if it is not in the cache. Directories
+        which cannot be listed are considered as empty.
+        """
+        with self.__lock:
+            if directory in self.__listings:
+                return self.__listings[directory]
+        print "Scanning directory: %s" %(directory)
+        try:
+            content = self.__backend.List(directory)
+        except TransferException as e:
+            print str(e)
+            content = []
+        with self.__lock:
+            self.__listings[directory] = content
+        return content
+
+    def Prefetch(self, directories):
+        """
+        List a batch of directories in parallel
+        """
+        _RunThreads(self.__nworkers, [directory for directory in directories if not directory in self.__listings], self.List)
+
+class TransferState(object):
+    """
+    Persistent state of the transfers, mapping source files to their status. The
+    state is written to disk after each change.
+    """
+
+    def __init__(self, statefile = None):
+        """
+        Constructor
+
+        :param statefile: file storing the state (no persistence if None)
+        :type statefile: str
+        """
+        self.__statefile = statefile
+        self.__lock = threading.Lock()
+        self.__state = {}
+        if statefile and os.path.exists(statefile):
+            with open(statefile) as infile:
+                self.__state = json.load(infile)
+
+    def IsDone(self, source, target):
+        """
+        Check whether a file was already transferred successfully to the target
+        """
+        with self.__lock:
+            entry = self.__state.get(source)
+        return entry is not None and entry["status"] == "done" and entry["target"] == target and os.path.exists(target)
+
+    def SetStatus(self, source, target, status, attempts):
+        """
+        Update the status of a transfer and write the state to disk
+        """
+        with self.__lock:
+            self.__state[source] = {"target":target, "status":status, "attempts":attempts}
+            if self.__statefile:
+                with open("%s.tmp" %(self.__statefile), "w") as outfile:
+                    json.dump(self.__state, outfile, indent = 1)
+                os.rename("%s.tmp" %(self.__statefile), self.__statefile)
+
+class TransferQueue(object):
+    """
+    Queue of file transfers processed by a bounded pool of worker threads. Files are copied into
+    a temporary file first and renamed on success, so incomplete files never appear under the
+    target name. Failed transfers are retried with exponential backoff. A post-processing
+    function (i.e. the extraction of an archive member) can be attached to each transfer.
+    It runs in the worker thread, and its failure counts as failure of the transfer.
+    """
+
+    def __init__(self, backend, nworkers = 4, maxretries = 3, backoff = 2., statefile = None):
+        """
+        Constructor
+
+        :param backend: backend used for copying
+        :type backend: TransferBackend
+        :param nworkers: number of parallel transfers
+        :type nworkers: int
+        :param maxretries: maximum number of retries of a failed transfer
+        :type maxretries: int
+        :param backoff: waiting time before the first retry in seconds, doubled for each further retry
+        :type backoff: float
+        :param statefile: file storing the transfer state for resuming
+        :type statefile: str
+        """
+        self.__backend = backend
+        self.__nworkers = nworkers
+        self.__maxretries = maxretries
+        self.__backoff = backoff
+        self.__state = TransferState(statefile)
+        self.__transfers = []
+        self.__failed = []
+        self.__lock = threading.Lock()
+
+    def Add(self, source, target, postprocess = None):
+        """
+        Add new transfer
+
+        :param source: source file on the grid
+        :type source: str
+        :param target: local target file
+        :type target: str
+        :param postprocess: function called with the transferred file before it is renamed to the target
+        :type postprocess: callable
+        """
+        self.__transfers.append((source, target, postprocess))
+
+    def GetListOfFailed(self):
+        """
+        Get the transfers which failed in the last run
+        """
+        return self.__failed
+
+    def Run(self):
+        """
+        Process all transfers. Transfers already done and files already existing are skipped.
+
+        :return: targets of the successful transfers (including the ones done before)
+        :rtype: list
+        """
+        self.__failed = []
+        tasks = []
+        done = []
+        for source, target, postprocess in self.__transfers:
+            if self.__state.IsDone(source, target) or os.path.exists(target):
+                done.append(target)
+            else:
+                tasks.append((source, target, postprocess))
+        self.__transfers = []
+        print "%d files to transfer, %d already done" %(len(tasks), len(done))
+        _RunThreads(self.__nworkers, tasks, self.__Transfer)
+        return done + [target for source, target, postprocess in tasks if self.__state.IsDone(source, target)]
+
+    def __Transfer(self, task):
+        """
+        Transfer one file, with retries
+        """
+        source, target, postprocess = task
+        targetdir = os.path.dirname(target)
+        tmptarget = "%s.part" %(target)
+        attempt = 0
+        while True:
+            try:
+                if targetdir and not os.path.exists(targetdir):
+                    try:
+                        os.makedirs(targetdir, 0755)
+                    except OSError:
+                        # created by another worker in the meanwhile
+                        pass
+                if os.path.exists(tmptarget):
+                    os.remove(tmptarget)
+                print "Copy %s to %s" %(source, target)
+                self.__backend.Copy(source, tmptarget)
+                if postprocess:
+                    postprocess(tmptarget)
+                os.rename(tmptarget, target)
+                self.__state.SetStatus(source, target, "done", attempt + 1)
+                return
+            except (TransferException, EnvironmentError) as e:
+                attempt += 1
+                if attempt > self.__maxretries:
+                    print "Transfer of %s failed after %d attempts: %s" %(source, attempt, str(e))
+                    self.__state.SetStatus(source, target, "failed", attempt)
+                    with self.__lock:
+                        self.__failed.append((source, target))
+                    return
+                time.sleep(self.__backoff * 2 ** (attempt - 1))
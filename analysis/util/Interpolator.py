@@ -30,6 +30,7 @@ Translated into PYTHON by
 :organization: Lawrence Berkeley National Laboratory
 """
 import math
+import numpy as np
 
 class Interpolator(object):
     
@@ -78,6 +79,98 @@ class Interpolator(object):
         elif method == "hag":
             return self.__InterpolateSimpleHagedorn(x, x1, y1, x2, y2)
 
+    def InterpolateArray(self, x, x1, y1, x2, y2, integrate = False, r = 0, method = "lin"):
+        """
+        Array version of the interpolation handler: evaluates the interpolation for arrays of
+        points x, each with its own pair of neighbors (x1, y1) and (x2, y2), in one go. The
+        method is dispatched once for the whole array. Methods and integrate mode are the same
+        as for Interpolate. Points failing the requirements of the method (non-positive values,
+        identical neighbors) get 0, as in the scalar version.
+
+        :param x:  x at which to evaluate the interpolation 
+        :param x1: lower x steps
+        :param y1: function values at x1
+        :param x2: upper x steps
+        :param y2: function values at x2
+        :param integrate: if true we evaluate the integral
+        :param r: half width of the integration range (scalar or one value per point)
+        :param method: interpolation method
+        :type x: numpy.ndarray
+        :type x1: numpy.ndarray
+        :type y1: numpy.ndarray
+        :type x2: numpy.ndarray
+        :type y2: numpy.ndarray
+        :type integrate: bool
+        :type r: float or numpy.ndarray
+        :type method: str
+        :return: interpolated values
+        :rtype: numpy.ndarray
+        """
+        x, x1, y1, x2, y2, r = np.broadcast_arrays(*[np.asarray(v, dtype = float) for v in (x, x1, y1, x2, y2, r)])
+        if method == "lin":
+            return self.__InterpolateLinearArray(x, x1, y1, x2, y2, integrate, r)
+        elif method == "pow":
+            return self.__InterpolatePowerLawArray(x, x1, y1, x2, y2, integrate, r)
+        elif method == "exp":
+            return self.__InterpolateExponentialArray(x, x1, y1, x2, y2)
+        elif method == "hag":
+            return self.__InterpolateSimpleHagedornArray(x, x1, y1, x2, y2)
+
+    def __InterpolateLinearArray(self, x, x1, y1, x2, y2, integrate = False, r = 0.):
+        """
+        Linear interpolation on arrays (see __InterpolateLinear)
+        """
+        result = np.zeros(x.shape)
+        valid = x1 != x2
+        result[valid] = y1[valid] + ((y2[valid] - y1[valid])/(x2[valid] - x1[valid]))*(x[valid] - x1[valid])
+        if integrate:
+            result *= 2.*r
+        return result
+
+    def __InterpolatePowerLawArray(self, x, x1, y1, x2, y2, integrate = False, r = 0.):
+        """
+        Power law interpolation on arrays (see __InterpolatePowerLaw). In integrate mode
+        the average over [x-r, x+r] is evaluated for points with x-r > 0 (using the limit
+        for r = 0 and n = -1), all other points get 0.
+        """
+        result = np.zeros(x.shape)
+        valid = self.__AssurePositiveArray(x, x1, x2, y1, y2) & (x1 != x2)
+        if integrate:
+            valid &= x - r > 0.
+        n = (np.log(y1[valid]) - np.log(y2[valid]))/(np.log(x1[valid]) - np.log(x2[valid]))
+        a = y1[valid]*np.power(x1[valid], -n)
+        values = a*np.power(x[valid], n)
+        if integrate:
+            rvalid = r[valid]
+            xvalid = x[valid]
+            ranged = rvalid > 0.
+            ispole = ranged & (n == -1.)
+            regular = ranged & ~ispole
+            values[regular] = (a[regular]/(n[regular]+1.))*(np.power(xvalid[regular]+rvalid[regular], n[regular]+1.) - \
+                                                           np.power(xvalid[regular]-rvalid[regular], n[regular]+1.))/(2.*rvalid[regular])
+            values[ispole] = a[ispole]*(np.log(xvalid[ispole]+rvalid[ispole]) - np.log(xvalid[ispole]-rvalid[ispole]))/(2.*rvalid[ispole])
+        result[valid] = values
+        return result
+
+    def __InterpolateExponentialArray(self, x, x1, y1, x2, y2):
+        """
+        Exponential interpolation on arrays (see __InterpolateExponential)
+        """
+        result = np.zeros(x.shape)
+        valid = self.__AssurePositiveArray(x, x1, x2, y1, y2)
+        result[valid] = np.exp(self.__InterpolateLinearArray(x[valid], x1[valid], np.log(y1[valid]), x2[valid], np.log(y2[valid])))
+        return result
+
+    def __InterpolateSimpleHagedornArray(self, x, x1, y1, x2, y2):
+        """
+        Hagedorn interpolation on arrays (see __InterpolateSimpleHagedorn)
+        """
+        result = np.zeros(x.shape)
+        valid = self.__AssurePositiveArray(x, x1, x2, y1, y2)
+        result[valid] = np.exp(self.__InterpolateLinearArray(np.log(1. + x[valid]), np.log(1. + x1[valid]), np.log(y1[valid]), \
+                                                             np.log(1. + x2[valid]), np.log(y2[valid])))
+        return result
+
     def __InterpolateLinear(self, x, x1, y1, x2, y2, integrate = False, r = 0):
         """
         Linear interpolation method
@@ -209,3 +302,12 @@ class Interpolator(object):
         if x <= 0. or x1 <= 0. or x2 <= 0. or y1 <= 0. or y2 <= 0.:
             return False
         return True
+
+    def __AssurePositiveArray(self, x, x1, x2, y1, y2):
+        """
+        Check element-wise if all values are positive
+
+        :return: mask, true where all values are positive
+        :rtype: numpy.ndarray
+        """
+        return (x > 0.) & (x1 > 0.) & (x2 > 0.) & (y1 > 0.) & (y2 > 0.)
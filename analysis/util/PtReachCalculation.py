@@ -3,12 +3,85 @@ Created on 18.09.2014
 
 @author: markusfasel
 '''
-from base.SpectrumFitter import MinBiasFitter, TriggeredSpectrumFitter
-from scipy.optimize import fsolve
+from base.SpectrumFitter import MinBiasFitter, TriggeredSpectrumFitter, GaussLegendreIntegral
+import numpy as np
+
+def CalculatePtReachMatrix(fitters, nevents, limit, doIntegral = False, ptmin = 1., ptmax = 1000., ngridpoints = 1000, niterations = 40):
+    """
+    Calculate the pt reach for a list of trigger fits and an array of event counts at once.
+    The pt reach is the pt at which the expected number of tracks (differential yield at pt,
+    or yield integrated from pt to ptmax, normalised to 10 GeV/c as in
+    SpectrumFitter.CalculateNormalisedIntegralAbove, if doIntegral is set) drops below the
+    limit. As in CalculateNormalisedIntegralAbove the integrated yield is summed in 10 GeV/c
+    steps starting at pt, so it extends up to pt + 10 * ceil((ptmax - pt) / 10). For each fit
+    the yield is tabulated on a logarithmic pt grid (the integrated yield as cumulative sum
+    of the integrals between grid points, plus the part of the last step above ptmax), the
+    table is turned into a monotonically falling envelope (running minimum), and the
+    crossing point of each event count is bracketed via searchsorted in the table. The
+    brackets are refined with a vectorized bisection for all event counts at the same time.
+
+    :param fitters: fitted spectra, one per trigger
+    :type fitters: list of SpectrumFitter
+    :param nevents: number of events
+    :type nevents: numpy.ndarray
+    :param limit: minimum number of tracks
+    :type limit: float
+    :param doIntegral: use the integrated yield above pt instead of the differential yield
+    :type doIntegral: bool
+    :param ptmin: lower end of the pt range scanned
+    :type ptmin: float
+    :param ptmax: upper end of the pt range scanned
+    :type ptmax: float
+    :param ngridpoints: number of points of the yield table
+    :type ngridpoints: int
+    :param niterations: number of bisection steps
+    :type niterations: int
+    :return: pt reach (number of fits x number of event counts), 0 if the limit is not reached at ptmin,
+             ptmax if it is still reached at ptmax
+    :rtype: numpy.ndarray
+    """
+    thresholds = float(limit) / np.asarray(nevents, dtype = float)
+    logpt = np.linspace(np.log(ptmin), np.log(ptmax), ngridpoints)
+    ptgrid = np.exp(logpt)
+    result = np.zeros((len(fitters), len(thresholds)))
+    for ifit, fitter in enumerate(fitters):
+        if doIntegral:
+            # part of the last 10 GeV/c step above ptmax (less than 10 GeV/c, single Gauss-Legendre panel)
+            tail = lambda pt: GaussLegendreIntegral(fitter.GetParameterisedValueAt, ptmax, pt + 10. * np.ceil((ptmax - pt) / 10.), 8, 1) / 10.
+            segments = fitter.CalculateIntegral(ptgrid[:-1], ptgrid[1:]) / 10.
+            table = np.append(np.cumsum(segments[::-1])[::-1], 0.) + tail(ptgrid)
+        else:
+            table = fitter.GetParameterisedValueAt(ptgrid)
+        envelope = np.minimum.accumulate(table)
+        # number of grid points with yield above the threshold (envelope is falling)
+        nabove = len(envelope) - np.searchsorted(envelope[::-1], thresholds, side = "left")
+        inside = (nabove > 0) & (nabove < len(envelope))
+        result[ifit, nabove == len(envelope)] = ptmax
+        if not np.any(inside):
+            continue
+        # the crossing is between grid points nabove-1 (above) and nabove (below)
+        upperbin = nabove[inside]
+        lower = logpt[upperbin - 1]
+        upper = logpt[upperbin]
+        threshold = thresholds[inside]
+        if doIntegral:
+            # integrated yield between the upper grid point and ptmax from the table, the rest
+            # of the (small) bracket is integrated with a single Gauss-Legendre panel
+            gridtail = tail(ptgrid[upperbin])
+            yieldfunction = lambda pt: table[upperbin] - gridtail + tail(pt) + GaussLegendreIntegral(fitter.GetParameterisedValueAt, pt, ptgrid[upperbin], 8, 1) / 10.
+        else:
+            yieldfunction = fitter.GetParameterisedValueAt
+        for iteration in range(0, niterations):
+            middle = 0.5 * (lower + upper)
+            isabove = yieldfunction(np.exp(middle)) >= threshold
+            lower = np.where(isabove, middle, lower)
+            upper = np.where(isabove, upper, middle)
+        result[ifit, inside] = np.exp(0.5 * (lower + upper))
+    return result
 
 class PtReachCalculator(object):
     """
-    classdocs
+    Pt reach as function of the number of events for one trigger, based on a fit of the spectrum
     """
 
     def __init__(self, name, data, isMinBias, limit):
@@ -21,21 +94,21 @@ class PtReachCalculator(object):
         else:
             self.__fitter = TriggeredSpectrumFitter(name, data)
         self.__limit = limit
-        
+
+    def GetFitter(self):
+        """
+        Get the fit of the spectrum used for the pt reach calculation
+        """
+        return self.__fitter
+
     def GetPtReach(self, numberOfEvents):
         """
-        Get the Pt reach for a given number of events
+        Get the Pt reach for a given number of events (or array of numbers of events)
         """
-        model = lambda p : numberOfEvents * self.__fitter.GetParameterisedValueAt(p) - self.__limit
-        initialGuess = 10.
-        result = fsolve(model, initialGuess)
-        return result
-    
+        return CalculatePtReachMatrix([self.__fitter], np.atleast_1d(numberOfEvents), self.__limit)[0]
+
     def GetPtReachForIntegral(self, numberOfEvents):
         """
-        Get the Pt reach for a given number of events using integrated yield above 
+        Get the Pt reach for a given number of events (or array of numbers of events) using integrated yield above
         """
-        model = lambda p : numberOfEvents * self.__fitter.GetNormalisedIntegralAbove(p) - self.__limit
-        initialGuess = 10.
-        result = fsolve(model, initialGuess)
-        return result
+        return CalculatePtReachMatrix([self.__fitter], np.atleast_1d(numberOfEvents), self.__limit, True)[0]
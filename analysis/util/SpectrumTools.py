@@ -35,6 +35,7 @@ from util.Interpolator import Interpolator
 import math
 from copy import deepcopy
 from numpy import array
+import numpy as np
 from scipy.optimize import fsolve 
 import functools
 import operator
@@ -111,18 +112,12 @@ class SpectrumTools(object):
         :return: the ratio of the graphs
         :rtype: TGraphErrors
         """
-        startBin = numerator.GetN()
-        endBin = -1
-        nBins = 0
-
-        for i in range(0, numerator.GetN()+1):
-            x = numerator.GetX()[i]
-            if x >= xmin and x <= xmax: 
-                nBins += 1 
-                if i > endBin:
-                    endBin = i
-                if i < startBin:
-                    startBin = i
+        numx, numy, numex, numey = self.__GetGraphArrays(numerator)
+        denx, deny, denex, deney = self.__GetGraphArrays(denominator)
+        selected = np.nonzero((numx >= xmin) & (numx <= xmax))[0]
+        nBins = len(selected)
+        startBin = selected[0] if nBins else numerator.GetN()
+        endBin = selected[-1] if nBins else -1
 
         print "startBin %d" %(startBin)
         print "endBin %d" %(endBin) 
@@ -130,66 +125,77 @@ class SpectrumTools(object):
         print "xmin %f" %(xmin)
         print "xmax %f" %(xmax)
         
+        # find the two neighboring points in the denominator for all points at once
+        x = numx[selected]
+        lower, upper, found = self.__FindNeighbors(x, denx)
+        x1  = denx[lower]
+        x2  = denx[upper]
+        y1  = deny[lower]
+        y2  = deny[upper]
+        ey1 = deney[lower]
+        ey2 = deney[upper]
+        interpolator = Interpolator()
+        y = np.where(x == x1, y1, np.where(x == x2, y2, interpolator.InterpolateArray(x, x1, y1, x2, y2, method = interpolationMethod)))
+        ey = np.where(x == x1, ey1, np.where(x == x2, ey2, interpolator.InterpolateArray(x, x1, ey1, x2, ey2, method = interpolationMethod)))
+        # points outside the denominator graph
+        y[~found] = 0.
+        ey[~found] = 0.
+        numyselected = numy[selected]
+        numeyselected = numey[selected]
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            yr = np.where(y != 0, numyselected / y, 0.)
+            eyr = np.where((y != 0) & (numyselected != 0), yr * np.sqrt((ey/y)*(ey/y) + (numeyselected/numyselected)*(numeyselected/numyselected)), 0.)
+        
         # create new TGraphErors for result1
         result = TGraphErrors(nBins);
-
-        interpolator = Interpolator()
-        for i in range(startBin, endBin+1):
-            x = numerator.GetX()[i]
-            lower, upper = self.__FindNeighbors(x, denominator)
-            # after break the two neighboring bins are found: k-1 and k
-            x1  = denominator.GetX()[lower]
-            x2  = denominator.GetX()[upper]
-            y1  = denominator.GetY()[lower]
-            y2  = denominator.GetY()[upper]
-            ey1 = max(self.__GetYerrors(denominator, lower))
-            ey2 = max(self.__GetYerrors(denominator, upper)) 
-            if x == lower: 
-                y  = y1
-                ey = ey1
-            elif x == upper: 
-                y  = y2
-                ey = ey2
-            else:
-                y  = interpolator.Interpolate(x,x1,y1,x2,y2, method = interpolationMethod)
-                ey = interpolator.Interpolate(x,x1,ey1,x2,ey2, method=interpolationMethod)
-            numy = numerator.GetY()[i]
-            numey = max(self.__GetYerrors(numerator, i))
-            yr = 0
-            eyr = 0
-            if y == 0:
-                yr = 0
-            else:
-                yr = numy / y  
-            if y != 0  and numy != 0:
-                eyr = (yr * math.sqrt((ey/y)*(ey/y) + (numey/numy)*(numey/numy)))
-            else:
-                eyr = 0
-            result.SetPoint(i-startBin,x,yr);
-            result.SetPointError(i-startBin,max(self.__GetXerrors(numerator, i)),eyr)
+        for i in range(0, nBins):
+            result.SetPoint(i, x[i], yr[i])
+            result.SetPointError(i, numex[selected[i]], eyr[i])
         return result
 
-    
-    def __FindNeighbors(self, x, graph):
+    def __GetGraphArrays(self, graph):
         """
-        Find the upper and lower neighbor of point x in the graph
+        Read points and errors of a graph into numpy arrays. For asymmetric errors the
+        larger of the lower and upper error is used, graphs without errors get errors 0.
         
-        :param x: point to evaluate
-        :param graph: graph to check  
-        :type x: float
+        :param graph: graph to read
         :type graph: TGraph, TGraphErrors, TGraphAsymmErrors
-        :return: tuple of lower and upper boundary
+        :return: tuple of arrays x, y, x-error and y-error
         :rtype: tuple
         """
-        lower = -1
-        upper = -1
-        for i in range(0, graph.GetN()-1):
-            if x >= graph.GetX()[i] and x <= graph.GetX()[i+1]:
-                lower = i 
-                upper = i+1
-                break
-        return lower, upper
+        npoints = graph.GetN()
+        readbuffer = lambda buf: np.array([buf[i] for i in range(0, npoints)], dtype = float) if buf else np.zeros(npoints)
+        x = readbuffer(graph.GetX())
+        y = readbuffer(graph.GetY())
+        if isinstance(graph, TGraphAsymmErrors):
+            ex = np.maximum(readbuffer(graph.GetEXlow()), readbuffer(graph.GetEXhigh()))
+            ey = np.maximum(readbuffer(graph.GetEYlow()), readbuffer(graph.GetEYhigh()))
+        elif isinstance(graph, TGraphErrors):
+            ex = readbuffer(graph.GetEX())
+            ey = readbuffer(graph.GetEY())
+        else:
+            ex = np.zeros(npoints)
+            ey = np.zeros(npoints)
+        return x, y, ex, ey
+    
+    def __FindNeighbors(self, x, xvalues):
+        """
+        Find the upper and lower neighbor of points x in the (sorted) x-values of a graph
+        using binary search. Points outside the graph are assigned to the first or last
+        pair of points and flagged as not found.
         
+        :param x: point(s) to evaluate
+        :param xvalues: x-values of the graph to check  
+        :type x: float or numpy.ndarray
+        :type xvalues: numpy.ndarray
+        :return: tuple of lower and upper boundary and flag whether x is inside the graph
+        :rtype: tuple
+        """
+        lower = np.clip(np.searchsorted(xvalues, x, side = "left") - 1, 0, max(len(xvalues) - 2, 0))
+        upper = np.minimum(lower + 1, len(xvalues) - 1)
+        found = (x >= xvalues[0]) & (x <= xvalues[-1])
+        return lower, upper, found
+
     def RebinPtSpectrum(self, h, nBins = 0, xBins = None):
         """
         Apply rebinning of the spectrum
@@ -450,6 +456,7 @@ class SpectrumTools(object):
     
         xmin = g.GetX()[0]
         xmax = g.GetX()[g.GetN()-1]
+        gx = self.__GetGraphArrays(g)[0]
         h = deepcopy(prototype)
         h.Reset()
   
@@ -464,7 +471,9 @@ class SpectrumTools(object):
             if x > xmax: 
                 break
             # find point k in g closest in x
-            lower, upper = self.__FindNeighbors(x, g)
+            lower, upper, found = self.__FindNeighbors(x, gx)
+            lower = int(lower)
+            upper = int(upper)
             # now x1 and x2 are the points next to x
             x1 = g.GetX()[lower]
             x2 = g.GetX()[upper]
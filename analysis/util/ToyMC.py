@@ -0,0 +1,179 @@
+#**************************************************************************
+#* Copyright(c) 1998-2015, ALICE Experiment at CERN, All rights reserved. *
+#*                                                                        *
+#* Author: The ALICE Off-line Project.                                    *
+#* Contributors are mentioned in the code where appropriate.              *
+#*                                                                        *
+#* Permission to use, copy, modify and distribute this software and its   *
+#* documentation strictly for non-commercial purposes is hereby granted   *
+#* without fee, provided that the above copyright notice appears in all   *
+#* copies and that both the copyright notice and this permission notice   *
+#* appear in the supporting documentation. The authors make no claims     *
+#* about the suitability of this software for any purpose. It is          *
+#* provided "as is" without express or implied warranty.                  *
+#**************************************************************************
+"""
+Toy Monte Carlo error propagation. The input values are resampled within their
+(gaussian) errors, and an arbitrary procedure (smearing, fit, correction) is
+rerun for each sample. Uncertainties are obtained as percentile bands of the
+results. Toys are processed in batches, each with its own seed derived from the
+master seed, so results are reproducible independently of the number of worker
+processes.
+
+:organization: ALICE Collaboration
+:copyright: 1998-2015, ALICE Experiment at CERN, All rights reserved.
+
+:author: Markus Fasel
+:contact: markus.fasel@cern.ch
+:organization: Lawrence Berkeley National Laboratory
+"""
+
+from multiprocessing import Pool
+import numpy as np
+
+def MakeRandomGenerator(seed = None):
+    """
+    Create a seeded numpy random generator. Uses numpy.random.Generator if available
+    (numpy >= 1.17), RandomState otherwise. Both provide uniform and normal.
+
+    :param seed: seed of the generator (None: seeded from the system entropy)
+    :type seed: int
+    :return: the random generator
+    """
+    if hasattr(np.random, "default_rng"):
+        return np.random.default_rng(seed)
+    return np.random.RandomState(seed)
+
+# propagator processed by the worker processes, inherited at fork
+_gPropagator = None
+
+def _RunToyBatch(task):
+    """
+    Process one batch of toys of the current propagator in a worker process
+    """
+    return _gPropagator.RunBatch(task)
+
+class ToyMCPropagator(object):
+    """
+    Propagation of the uncertainties of input values through a procedure via toy Monte Carlo.
+    The procedure is a function taking an array of (resampled) input values and returning an
+    array of results. Worker processes are forked, so the procedure may use ROOT objects
+    internally, but has to return numpy arrays.
+    """
+
+    def __init__(self, procedure, values, errors):
+        """
+        Constructor
+
+        :param procedure: function applied to each toy sample
+        :type procedure: callable
+        :param values: central values of the input
+        :type values: numpy.ndarray
+        :param errors: (gaussian) uncertainties of the input
+        :type errors: numpy.ndarray
+        """
+        self.__procedure = procedure
+        self.__values = np.asarray(values, dtype = float)
+        self.__errors = np.asarray(errors, dtype = float)
+        self.__ntoys = 1000
+        self.__batchsize = 100
+        self.__nworkers = 1
+        self.__seed = None
+        self.__results = None
+
+    def SetNumberOfToys(self, ntoys):
+        """
+        Set the number of toy samples
+        """
+        self.__ntoys = ntoys
+
+    def SetBatchSize(self, batchsize):
+        """
+        Set the number of toys processed in one batch (one task for the worker processes)
+        """
+        self.__batchsize = batchsize
+
+    def SetNumberOfWorkers(self, nworkers):
+        """
+        Set the number of worker processes
+        """
+        self.__nworkers = nworkers
+
+    def SetSeed(self, seed):
+        """
+        Set the master seed. The seeds of the batches are derived from the master seed.
+        """
+        self.__seed = seed
+
+    def GetBatchSeeds(self):
+        """
+        Get the seeds of the batches, derived from the master seed
+
+        :return: list of (number of toys, seed) for each batch
+        :rtype: list
+        """
+        nbatches = (self.__ntoys + self.__batchsize - 1) / self.__batchsize
+        seeds = MakeRandomGenerator(self.__seed).randint(0, 2**31 - 1, nbatches)
+        return [(min(self.__batchsize, self.__ntoys - ibatch * self.__batchsize), int(seeds[ibatch])) for ibatch in range(0, nbatches)]
+
+    def RunBatch(self, task):
+        """
+        Run one batch of toys: resample the input values within their errors and apply the
+        procedure to each sample
+
+        :param task: number of toys and seed of the batch
+        :type task: tuple
+        :return: results of the toys (number of toys x number of results)
+        :rtype: numpy.ndarray
+        """
+        ntoys, seed = task
+        generator = MakeRandomGenerator(seed)
+        samples = generator.normal(self.__values, self.__errors, (ntoys, len(self.__values)))
+        return np.array([np.asarray(self.__procedure(sample), dtype = float) for sample in samples])
+
+    def Run(self):
+        """
+        Run all toys, in parallel batches if more than one worker is requested
+
+        :return: results of all toys (number of toys x number of results)
+        :rtype: numpy.ndarray
+        """
+        global _gPropagator
+        tasks = self.GetBatchSeeds()
+        if self.__nworkers < 2 or len(tasks) < 2:
+            results = [self.RunBatch(task) for task in tasks]
+        else:
+            _gPropagator = self
+            pool = Pool(min(self.__nworkers, len(tasks)))
+            try:
+                results = pool.map(_RunToyBatch, tasks, 1)
+            finally:
+                pool.close()
+                pool.join()
+                _gPropagator = None
+        self.__results = np.concatenate(results)
+        return self.__results
+
+    def GetResults(self):
+        """
+        Get the results of the toys (run them if not yet done)
+        """
+        if self.__results is None:
+            self.Run()
+        return self.__results
+
+    def GetPercentileBand(self, lower = 15.865, upper = 84.135):
+        """
+        Get the per-bin percentile band of the toy results. The default corresponds to
+        a 1 sigma band.
+
+        :param lower: lower percentile
+        :type lower: float
+        :param upper: upper percentile
+        :type upper: float
+        :return: median, lower and upper band of the results
+        :rtype: tuple
+        """
+        results = self.GetResults()
+        median, bandlow, bandhigh = np.percentile(results, [50., lower, upper], axis = 0)
+        return median, bandlow, bandhigh
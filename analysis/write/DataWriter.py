@@ -4,7 +4,9 @@ Created on Dec 18, 2014
 @author: markus
 '''
 
+from collections import OrderedDict
 from base.FileHandler import LegoTrainFileReader
+from write.WriterTasks import RunTasks
 from ROOT import TFile, TList, TObject, TH1F
 
 class DataSpectra(object):
@@ -57,7 +59,7 @@ class DataSpectra(object):
         triggername = property(get_triggername, set_triggername, del_triggername, "Name of the trigger class")
     
     def __init__(self):
-        self.__triggers = {}
+        self.__triggers = OrderedDict()
 
     def get_triggers(self):
         return self.__triggers
@@ -81,25 +83,41 @@ class DataSpectra(object):
 
 class DataWriter(object):
     
-    def __init__(self, filename, isNew):
+    def __init__(self, filename, isNew, nworkers = 1):
         self._inputdata = self.__ReadFile(filename, isNew)
-        self._outputdata = DataSpectra()
+        self._outputdata = OrderedDict()
+        self._nworkers = nworkers
         
     def __ReadFile(self, filename, isNewStruct):
         reader = LegoTrainFileReader(filename, isNew = isNewStruct, trackCuts="standard")
         return reader.ReadFile()
     
     def Convert(self):
-        for trigger in ["MinBias", "EMCJHigh", "EMCJLow", "EMCGHigh", "EMCGLow"]:
-            trdata = self._ProcessTrigger(trigger, self._inputdata.GetData(trigger))
-            self._outputdata.AddTrigger(trigger, trdata["spectrum"], trdata["events"])
+        """
+        Process all trigger classes. With more than one worker the trigger classes are processed
+        in parallel processes, the results are added in the same order as in the serial processing.
+        Each trigger class provides the spectra for all output files at once.
+        """
+        triggers = ["MinBias", "EMCJHigh", "EMCJLow", "EMCGHigh", "EMCGLow"]
+        for trigger, trdata in zip(triggers, RunTasks(self, triggers, self._nworkers)):
+            for outputfile, spectrum in trdata["spectra"].iteritems():
+                if not outputfile in self._outputdata:
+                    self._outputdata[outputfile] = DataSpectra()
+                self._outputdata[outputfile].AddTrigger(trigger, spectrum, trdata["events"])
+            
+    def ProcessTask(self, trigger):
+        """
+        Process one trigger class
+        """
+        return self._ProcessTrigger(trigger, self._inputdata.GetData(trigger))
         
     def WriteOutput(self):
-        myoutput = TFile(self._GetOutputFile(), "RECREATE")
-        myoutput.cd()
-        for obj in self._outputdata.GetListOfROOTPrimitives():
-            obj.Write(obj.GetName(), TObject.kSingleKey)
-        myoutput.Close()
+        for outputfile, outputdata in self._outputdata.iteritems():
+            myoutput = TFile(outputfile, "RECREATE")
+            myoutput.cd()
+            for obj in outputdata.GetListOfROOTPrimitives():
+                obj.Write(obj.GetName(), TObject.kSingleKey)
+            myoutput.Close()
         
     def _MakeProjection(self, trackContainer):
         return trackContainer.MakeProjection(0, "spectrum", doNorm = False)
@@ -118,14 +136,21 @@ class DataWriter(object):
         
 class DataTrackWriter(DataWriter):
     
-    def __init__(self, filename, isNew):
-        DataWriter.__init__(self, filename, isNew)
-        self.__etacut = None
+    def __init__(self, filename, isNew, nworkers = 1):
+        DataWriter.__init__(self, filename, isNew, nworkers)
+        self.__etacuts = []
         self.__phicut = None
         self.__inAcceptance = False
         
     def SetEtaCut(self, tag, emin, emax):
-        self.__etacut = {"etamin":emin, "etamax":emax, "tag":tag}
+        self.__etacuts = [{"etamin":emin, "etamax":emax, "tag":tag}]
+        
+    def AddEtaCut(self, tag, emin = None, emax = None):
+        """
+        Add eta selection (without limits: full eta range). Spectra of all eta selections are
+        projected in one pass over the track container, each selection is written to its own file.
+        """
+        self.__etacuts.append({"etamin":emin, "etamax":emax, "tag":tag})
         
     def SetPhiCut(self, tag, phimin, phimax):
         self.__phicut = {"phimin":phimin, "phimax":phimax, "tag": tag}
@@ -133,10 +158,10 @@ class DataTrackWriter(DataWriter):
     def SetInAcceptance(self, inAcceptance = True):
         self.__inAcceptance = inAcceptance
         
-    def _GetOutputFile(self):
+    def _GetOutputFile(self, etacut = None):
         kinestring="etaall"
-        if self.__etacut:
-            kinestring = "eta%s" %(self.__etacut["tag"])
+        if etacut:
+            kinestring = "eta%s" %(etacut["tag"])
         if self.__phicut:
             kinestring +=  self.__phicut["tag"]
         accString = "All"
@@ -148,8 +173,6 @@ class DataTrackWriter(DataWriter):
         tc.SetVertexRange(-10, 10)
         tc.SetPileupRejection(True)
         tc.SelectTrackCuts(1)
-        if self.__etacut:
-            tc.SetEtaRange(self.__etacut["etamin"], self.__etacut["etamax"])
         if self.__phicut:
             tc.SetPhiRange(self.__phicut["phimin"], self.__phicut["phimax"])
     
@@ -159,15 +182,21 @@ class DataTrackWriter(DataWriter):
             containerName = "tracksWithClusters" 
         tc = dset.FindTrackContainer(containerName)
         self.__DefineTracks(tc)
-        projected = self._MakeProjection(tc)
+        selections = OrderedDict()
+        for etacut in self.__etacuts if len(self.__etacuts) else [None]:
+            cuts = []
+            if etacut and not (etacut["etamin"] is None and etacut["etamax"] is None):
+                cuts.append(("eta", etacut["etamin"], etacut["etamax"]))
+            selections[self._GetOutputFile(etacut)] = cuts
+        projected = tc.MakeProjections(0, selections, doNorm = False)
         nevents = self._GetNumberOfEvents(tc)
-        return {"spectrum":projected, "events":nevents}
+        return {"spectra":projected, "events":nevents}
 
         
 class DataClusterWriter(DataWriter): 
     
-    def __init__(self, filename, isNew):
-        DataWriter.__init__(self, filename, isNew)
+    def __init__(self, filename, isNew, nworkers = 1):
+        DataWriter.__init__(self, filename, isNew, nworkers)
         self.__useCalibrated = True
         
     def SetUseCalibratedClusters(self, doUse = True):
@@ -188,22 +217,29 @@ class DataClusterWriter(DataWriter):
         self.__DefineClusters(cc)
         projected = self._MakeProjection(cc)
         nevents = self._GetNumberOfEvents(cc)
-        return {"spectrum":projected, "events":nevents}
+        return {"spectra":{self._GetOutputFile():projected}, "events":nevents}
     
     def __DefineClusters(self, cc):
         cc.SetVertexRange(-10, 10)
         cc.SetPileupRejection(True)
     
-def WriteTracks(filename, inAcceptance = False, etaSel = "all", isNew = True):
-    writer = DataTrackWriter(filename, isNew)
+def WriteTracks(filename, inAcceptance = False, etaSel = "all", isNew = True, nworkers = 1):
+    """
+    Write track spectra. etaSel can be a list of eta selections, which are projected in one
+    pass and written into one file each.
+    """
+    writer = DataTrackWriter(filename, isNew, nworkers)
     writer.SetInAcceptance(inAcceptance)
-    if etaSel == "centcms":
-        writer.SetEtaCut("centcms", -0.7999, -0.200001)
+    for selection in etaSel if isinstance(etaSel, list) else [etaSel]:
+        if selection == "centcms":
+            writer.AddEtaCut("centcms", -0.7999, -0.200001)
+        else:
+            writer.AddEtaCut("all")
     writer.Convert()
     writer.WriteOutput()
 
-def WriteClusters(filename, calib = True, isNew = True):
-    writer = DataClusterWriter(filename, isNew)
+def WriteClusters(filename, calib = True, isNew = True, nworkers = 1):
+    writer = DataClusterWriter(filename, isNew, nworkers)
     writer.SetUseCalibratedClusters(calib)
     writer.Convert()
     writer.WriteOutput()
\ No newline at end of file
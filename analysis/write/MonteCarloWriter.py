@@ -4,15 +4,20 @@ Created on Nov 17, 2014
 @author: markus
 '''
 import os
+from collections import OrderedDict
 from ROOT import TFile,TH1D,TList,TObject
 
 from base.MonteCarloFileHandler import MonteCarloFileHandler
+from base.struct.THnSparseWrapper import THnSparseProjectionRequest
+from write.WriterTasks import RunTasks
+
+TRIGGERS = ["MinBias", "EMCJHigh", "EMCJLow", "EMCGHigh", "EMCGLow"]
 
 class BinContent(object):
     
     def __init__(self):
         self.__MCtruth = None
-        self.__triggers = {}
+        self.__triggers = OrderedDict()
         
     def SetMCtruth(self, mctruth):
         self.__MCtruth = mctruth
@@ -31,7 +36,7 @@ class BinContent(object):
     
 class MonteCarloWriter(object):
     
-    def __init__(self, isNew):
+    def __init__(self, isNew, nworkers = 1):
         '''
         Constructor
         '''
@@ -39,8 +44,9 @@ class MonteCarloWriter(object):
         self._nevents = {}
         self.__CreateEventContainers()
         self._isNew = isNew 
-        self._pthardbins = {}
+        self._outputs = OrderedDict()
         self._listofbins = []
+        self._nworkers = nworkers
         self._inputcol = self.ReadData()
         
     def __CreateEventContainers(self):
@@ -49,6 +55,7 @@ class MonteCarloWriter(object):
         
     def ReadData(self):
         reader = MonteCarloFileHandler(True)
+        reader.SetNumberOfWorkers(self._nworkers)
         entries = os.listdir(os.getcwd())
         for mypthardbin in entries:
             if not str(mypthardbin).isdigit():
@@ -65,26 +72,87 @@ class MonteCarloWriter(object):
         self._nevents[trigger].SetBinContent(self._nevents[trigger].GetXaxis().FindBin(pthardbin), nevents)
 
     def Convert(self):
+        """
+        Process all pt-hard bins. Each (pt-hard bin, trigger class) unit and the MC truth of each
+        pt-hard bin are independent tasks, which are processed in parallel processes with more
+        than one worker. Results are collected in the same order as in the serial processing.
+        Each task provides its spectra for all output files at once.
+        """
+        tasks = []
         for mybin in self._listofbins:
             self._weights.SetBinContent(mybin+1, self._inputcol.GetWeigthHandler().GetWeight(mybin))
-            self._pthardbins[mybin] = self.ProcessBin(int(mybin))
+            tasks.append((int(mybin), None))
+            for trigger in TRIGGERS:
+                tasks.append((int(mybin), trigger))
+        for task, result in zip(tasks, RunTasks(self, tasks, self._nworkers)):
+            mybin, trigger = task
+            self.__AddResult(self._outputs, mybin, trigger, result)
+            
+    def ProcessBin(self, mybin):
+        """
+        Process all trigger classes of one pt-hard bin. Returns the content of the bin
+        under the name of the output file
+        """
+        outputs = OrderedDict()
+        self.__AddResult(outputs, mybin, None, self.ProcessTask((mybin, None)))
+        for trigger in TRIGGERS:
+            self.__AddResult(outputs, mybin, trigger, self.ProcessTask((mybin, trigger)))
+        return OrderedDict([(outputfile, pthardbins[mybin]) for outputfile, pthardbins in outputs.iteritems()])
+    
+    def ProcessTask(self, task):
+        """
+        Process one task: MC truth (trigger None) or trigger class in a given pt-hard bin
+        """
+        mybin, trigger = task
+        if not trigger:
+            return self.ProcessMCtruth(mybin)
+        return self.ProcessTrigger(mybin, trigger)
+    
+    def __AddResult(self, outputs, mybin, trigger, result):
+        """
+        Add result of a task to the content of the pt-hard bin in each output file
+        """
+        spectra = result["spectra"] if trigger else result
+        for outputfile, spectrum in spectra.iteritems():
+            if not outputfile in outputs:
+                outputs[outputfile] = {}
+            if not mybin in outputs[outputfile]:
+                outputs[outputfile][mybin] = BinContent()
+            if trigger:
+                outputs[outputfile][mybin].AddTrigger(trigger, spectrum)
+            else:
+                outputs[outputfile][mybin].SetMCtruth(spectrum)
+        if trigger and result["events"] is not None:
+            self.SetNumberOfEvents(trigger, mybin, result["events"])
             
     def WriteResults(self):
-        outputfile = TFile(self.CreateOutputFilename(), "RECREATE")
-        outputfile.cd()
-        self._weights.Write(self._weights.GetName(), TObject.kSingleKey)
-        for trigger in self._nevents.values():
-            trigger.Write(trigger.GetName(), TObject.kSingleKey)
-        for mybin in self._pthardbins:
-            bindata = self._pthardbins[mybin].MakeROOTPrimitive("bin%d" %(mybin))
-            bindata.Write(bindata.GetName(), TObject.kSingleKey)
-        outputfile.Close()
+        for outputfilename, pthardbins in self._outputs.iteritems():
+            outputfile = TFile(outputfilename, "RECREATE")
+            outputfile.cd()
+            self._weights.Write(self._weights.GetName(), TObject.kSingleKey)
+            for trigger in self._nevents.values():
+                trigger.Write(trigger.GetName(), TObject.kSingleKey)
+            for mybin in pthardbins:
+                bindata = pthardbins[mybin].MakeROOTPrimitive("bin%d" %(mybin))
+                bindata.Write(bindata.GetName(), TObject.kSingleKey)
+            outputfile.Close()
+        
+    def ProcessMCtruth(self, mybin):
+        """
+        Process MC truth of a pt-hard bin. Returns the MC truth spectra under the name
+        of the output file (empty if not needed)
+        """
+        return {}
         
     # pure virtual methods:
     def CreateOutputFilename(self):
         pass
     
-    def ProcessBin(self, mybin):
+    def ProcessTrigger(self, mybin, trigger):
+        """
+        Process trigger class in a pt-hard bin. Returns a dictionary with the
+        spectra under the name of the output file and the number of events (None if not needed)
+        """
         pass
 
 class TrackWriter(MonteCarloWriter):
@@ -92,14 +160,14 @@ class TrackWriter(MonteCarloWriter):
     Class Writing projected raw spectrum and MC truth 
     '''
 
-    def __init__(self, isNew):
+    def __init__(self, isNew, nworkers = 1):
         '''
         Constructor
         '''
-        MonteCarloWriter.__init__(self, isNew)
+        MonteCarloWriter.__init__(self, isNew, nworkers)
         self.__inAcceptance = False
         self.__MCKine = False
-        self.__etacut = None
+        self.__etacuts = []
         self.__phicut = None
         
     def SetInAcceptance(self):
@@ -115,36 +183,52 @@ class TrackWriter(MonteCarloWriter):
         self.__MCKine = False
         
     def SetEtaCut(self, etaMin, etaMax, tag):
-        self.__etacut = {"etaMin":etaMin, "etaMax":etaMax, "tag":tag}
+        self.__etacuts = [{"etaMin":etaMin, "etaMax":etaMax, "tag":tag}]
+        
+    def AddEtaCut(self, etaMin, etaMax, tag):
+        """
+        Add eta selection (limits None: full eta range). Spectra of all eta selections are
+        projected in one pass over the histograms, each selection is written to its own file.
+        """
+        self.__etacuts.append({"etaMin":etaMin, "etaMax":etaMax, "tag":tag})
+        
+    def __GetEtaSelections(self):
+        """
+        Get the eta cuts (axis name, minimum, maximum) of all eta selections under the name of the output file
+        """
+        selections = OrderedDict()
+        for etacut in self.__etacuts if len(self.__etacuts) else [None]:
+            cuts = []
+            if etacut and not (etacut["etaMin"] is None and etacut["etaMax"] is None):
+                cuts.append(("eta", etacut["etaMin"], etacut["etaMax"]))
+            selections[self.CreateOutputFilename(etacut)] = cuts
+        return selections
         
     def SetPhiCut(self, phiMin, phiMax, tag):
         self.__phicut = {"phiMin":phiMin, "phiMax":phiMax, "tag":tag}
         
-    def ProcessBin(self, mybin):
-        results = BinContent()
+    def ProcessMCtruth(self, mybin):
+        bindata = self._inputcol.GetData(mybin)
+        return self.ProjectMCtruth(bindata.GetMCTruth(), "MCTruthbin%d" %(mybin))
+        
+    def ProcessTrigger(self, mybin, trigger):
         bindata = self._inputcol.GetData(mybin)
-        results.SetMCtruth(self.ProjectMCtruth(bindata.GetMCTruth(), "MCTruthbin%d" %(mybin)))
         kinestring = "tracksMCKine" if self.__MCKine else "tracks"
         acceptancestring = "WithClusters" if self.__inAcceptance else "All"
-        for trigger in ["MinBias","EMCJHigh","EMCJLow","EMCGHigh","EMCGLow"]:
-            histname = "%s%s" %(kinestring, acceptancestring)
-            print "histname: %s" %(histname)
-            tc = bindata.GetData(trigger).FindTrackContainer(histname)
-            if self.__etacut:
-                print "Using eta range %f %f" %(self.__etacut["etaMin"], self.__etacut["etaMax"])
-                tc.SetEtaRange(self.__etacut["etaMin"], self.__etacut["etaMax"])
-            if self.__phicut:
-                tc.SetPhiRange(self.__phicut["phiMin"], self.__phicut["phiMax"])
-            sn = "%sbin%d" %(trigger, mybin)
-            spectrum = self.Project(tc, sn)
-            results.AddTrigger(trigger, spectrum)
-            self.SetNumberOfEvents(trigger, mybin, tc.GetEventCount())
-        return results
+        histname = "%s%s" %(kinestring, acceptancestring)
+        print "histname: %s" %(histname)
+        tc = bindata.GetData(trigger).FindTrackContainer(histname)
+        if self.__phicut:
+            tc.SetPhiRange(self.__phicut["phiMin"], self.__phicut["phiMax"])
+        spectra = self.Project(tc, self.__GetEtaSelections())
+        for spectrum in spectra.itervalues():
+            spectrum.SetName("%sbin%d" %(trigger, mybin))
+        return {"spectra":spectra, "events":tc.GetEventCount()}
     
-    def CreateOutputFilename(self):
+    def CreateOutputFilename(self, etacut = None):
         kinestring="etaall"
-        if self.__etacut:
-            kinestring = "eta%s" %(self.__etacut["tag"])
+        if etacut:
+            kinestring = "eta%s" %(etacut["tag"])
         if self.__phicut:
             kinestring +=  self.__phicut["tag"]
         return "MonteCarloProjected%s%sKine%s.root" %("Acc" if self.__inAcceptance else "All", "MC" if self.__MCKine else "Rec", kinestring)
@@ -154,22 +238,28 @@ class TrackWriter(MonteCarloWriter):
         inputcontainer.ApplyCut(inputcontainer.GetAxisDefinition().GetAxisName(3),-10., 10.)
         #inputcontainer.ApplyCut(inputcontainer.GetAxisDefinition().GetAxisName(4), 1, 1)
         print "finish applying cut"
-        if self.__etacut:
-            print "apply eta cut"
-            inputcontainer.ApplyCut("eta", self.__etacut["etaMin"], self.__etacut["etaMax"])
-        return inputcontainer.Projection1D(outputname, inputcontainer.GetAxisDefinition().GetAxisName(0))
+        requests = []
+        for outputfile, cuts in self.__GetEtaSelections().iteritems():
+            request = THnSparseProjectionRequest(outputfile, [inputcontainer.GetAxisDefinition().GetAxisName(0)])
+            for cut in cuts:
+                request.AddCut(*cut)
+            requests.append(request)
+        projected = inputcontainer.ProjectionBatch(requests)
+        for hist in projected.itervalues():
+            hist.SetName(outputname)
+        return projected
 
-    def Project(self, inputcontainer, outputname):
+    def Project(self, inputcontainer, selections):
         inputcontainer.SetVertexRange(-10., 10.)
         inputcontainer.SetPileupRejection(True)
         inputcontainer.SelectTrackCuts(1)
-        return inputcontainer.MakeProjection(0, outputname, doNorm = False)
+        return inputcontainer.MakeProjections(0, selections, doNorm = False)
         
         
 class ClusterWriter(MonteCarloWriter):
     
-    def __init__(self, isNew):
-        MonteCarloWriter.__init__(self, isNew)
+    def __init__(self, isNew, nworkers = 1):
+        MonteCarloWriter.__init__(self, isNew, nworkers)
         self.__calibrated = True
         
     def SetCalibrated(self):
@@ -179,18 +269,14 @@ class ClusterWriter(MonteCarloWriter):
         self.__calibrated = False
         
     
-    def ProcessBin(self, pthatbin):
+    def ProcessTrigger(self, pthatbin, trigger):
         """
-        Make projections of the different cluster hists
+        Make projections of the cluster hist for a given trigger class
         """
-        results = BinContent()
         bindata = self._inputcol.GetData(pthatbin)
-        for trigger in ["MinBias","EMCJHigh","EMCJLow","EMCGHigh","EMCGLow"]:
-            clustercont = bindata.GetData(trigger).FindClusterContainer("Calib" if self.__calibrated else "Uncalib")
-            spectrum = self.ProjectContainer(clustercont, "%sbin%d" %(trigger, pthatbin))
-            results.AddTrigger(trigger, spectrum)
-            self.SetNumberOfEvents(trigger, pthatbin, clustercont.GetEventCount())
-        return results
+        clustercont = bindata.GetData(trigger).FindClusterContainer("Calib" if self.__calibrated else "Uncalib")
+        spectrum = self.ProjectContainer(clustercont, "%sbin%d" %(trigger, pthatbin))
+        return {"spectra":{self.CreateOutputFilename():spectrum}, "events":clustercont.GetEventCount()}
 
     def ProjectContainer(self, inputcontainer, outputname):
         inputcontainer.SetVertexRange(-10, 10)
@@ -234,33 +320,30 @@ class JetData(object):
         
 class JetWriter(MonteCarloWriter):
     
-    def __init__(self, isNew):
-        MonteCarloWriter.__init__(self, isNew)
+    def __init__(self, isNew, nworkers = 1):
+        MonteCarloWriter.__init__(self, isNew, nworkers)
         
-    def ProcessBin(self, mybin):
-        results = BinContent()
+    def ProcessTrigger(self, mybin, trigger):
         bindata = self._inputcol.GetData(mybin)
-        for trigger in ["MinBias","EMCJHigh","EMCJLow","EMCGHigh","EMCGLow"]:
-            print "Doing trigger %s" %(trigger)
-            jetcont =  bindata.GetData(trigger).GetJetContainer()
-            outputcont = TList()
-            outputcont.SetName(trigger)
-            for jetpt in jetcont.GetListOfJetPts():
-                print "Inspecting jet pt %f" %(jetpt)
-                jetdat = JetData(jetpt,trigger)
-                projectedRec = jetcont.MakeProjectionRecKine(jetpt, 0, "projectedPtRec")
-                projectedMC = jetcont.MakeProjectionMCKine(jetpt, 0, "projectedPtMC")
-                jetdat.AddSpectrum(projectedRec, False)
-                jetdat.AddSpectrum(projectedMC, True)
-                outputcont.Add(jetdat.ROOTify())
-            results.AddTrigger(trigger, outputcont)
-        return results
+        print "Doing trigger %s" %(trigger)
+        jetcont =  bindata.GetData(trigger).GetJetContainer()
+        outputcont = TList()
+        outputcont.SetName(trigger)
+        for jetpt in jetcont.GetListOfJetPts():
+            print "Inspecting jet pt %f" %(jetpt)
+            jetdat = JetData(jetpt,trigger)
+            projectedRec = jetcont.MakeProjectionRecKine(jetpt, 0, "projectedPtRec")
+            projectedMC = jetcont.MakeProjectionMCKine(jetpt, 0, "projectedPtMC")
+            jetdat.AddSpectrum(projectedRec, False)
+            jetdat.AddSpectrum(projectedMC, True)
+            outputcont.Add(jetdat.ROOTify())
+        return {"spectra":{self.CreateOutputFilename():outputcont}, "events":None}
     
     def CreateOutputFilename(self):
         return "MCTracksInJets.root"
     
-def RunTrackProjection(doAcc = False, doMCKine = False, etaSel = "all", phiSel = False, isNew = False):
-    writer = TrackWriter(isNew)
+def RunTrackProjection(doAcc = False, doMCKine = False, etaSel = "all", phiSel = False, isNew = False, nworkers = 1):
+    writer = TrackWriter(isNew, nworkers)
     if doAcc:
         writer.SetInAcceptance()
     else:
@@ -269,17 +352,21 @@ def RunTrackProjection(doAcc = False, doMCKine = False, etaSel = "all", phiSel =
         writer.SetMCKine()
     else:
         writer.SetRecKine()
-    if etaSel == "centcms":
-        writer.SetEtaCut(-0.7999, -0.200001, "centcms")
-    elif etaSel == "emc":
-        writer.SetEtaCut(-0.5, 0.5, "emc")
+    # a list of eta selections is projected in one pass, each selection is written into its own file
+    for selection in etaSel if isinstance(etaSel, list) else [etaSel]:
+        if selection == "centcms":
+            writer.AddEtaCut(-0.7999, -0.200001, "centcms")
+        elif selection == "emc":
+            writer.AddEtaCut(-0.5, 0.5, "emc")
+        else:
+            writer.AddEtaCut(None, None, "all")
     if phiSel:
         writer.SetPhiCut(1.5, 3.1, "emcphi") 
     writer.Convert()
     writer.WriteResults()
     
-def RunClusterProjection(doCalib = True, isNew = False):
-    writer = ClusterWriter(isNew)
+def RunClusterProjection(doCalib = True, isNew = False, nworkers = 1):
+    writer = ClusterWriter(isNew, nworkers)
     if doCalib:
         writer.SetCalibrated()
     else:
@@ -287,7 +374,7 @@ def RunClusterProjection(doCalib = True, isNew = False):
     writer.Convert()
     writer.WriteResults()
     
-def RunJetProjection(isNew = False):
-    writer = JetWriter(isNew)
+def RunJetProjection(isNew = False, nworkers = 1):
+    writer = JetWriter(isNew, nworkers)
     writer.Convert()
     writer.WriteResults()
\ No newline at end of file
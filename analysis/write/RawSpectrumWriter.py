@@ -5,12 +5,14 @@ Created on 14.11.2014
 '''
 from base.FileHandler import LegoTrainFileReader
 from base.SpectrumFitter import MinBiasFitter
+from util.FitDriver import FitDriver
 from ROOT import TList, TFile, TObject
 
 class RawSpectrumWriter(object):
     
-    def __init__(self):
+    def __init__(self, nworkers = 1):
         self.__categories = {"Full":{}, "EMCAL":{}}
+        self.__nworkers = nworkers
         
     def AddTriggerToCategory(self, category, trigger, spectrum):
         self.__categories[category][trigger] = spectrum
@@ -20,19 +22,50 @@ class RawSpectrumWriter(object):
         results = reader.ReadFile()
         categories = {"Full":"tracksAll", "EMCAL":"tracksWithClusters"}
         
+        minbiasspectra = {}
         for trigger in ["MinBias", "EMCJHigh", "EMCJLow", "EMCGHigh", "EMCGLow"]:
             data = results.GetData(trigger)
             for stype,cont in categories.iteritems():
                 spectrum = self.MakeNormalisedSpectrum(data.FindTrackContainer(cont), trigger, stype)
                 self.AddTriggerToCategory(stype, trigger, spectrum)
                 if trigger == "MinBias":
-                    self.AddTriggerToCategory(stype, "MinBiasFit", self.FitMinBias(spectrum, stype))
+                    minbiasspectra[stype] = spectrum
+        for stype, param in self.FitMinBiasCategories(minbiasspectra).iteritems():
+            self.AddTriggerToCategory(stype, "MinBiasFit", param)
                 
     def FitMinBias(self, spectrum, category):
-        fitter = MinBiasFitter("mbfitter", spectrum)
-        param = fitter.MakeBinnedParameterisationDefault(True)
-        param.SetName("FitMinBias%s" %(category)) 
-        return param
+        """
+        Fit the min. bias spectrum of one category
+        
+        :param spectrum: min. bias spectrum
+        :type spectrum: TH1
+        :param category: category of the spectrum
+        :type category: str
+        :return: binned parameterisation
+        :rtype: TH1
+        """
+        return self.FitMinBiasCategories({category:spectrum})[category]
+                
+    def FitMinBiasCategories(self, spectra):
+        """
+        Fit the min. bias spectra of all categories (in parallel with more than one worker)
+        
+        :param spectra: min. bias spectra by category
+        :type spectra: dict
+        :return: binned parameterisations by category
+        :rtype: dict
+        """
+        driver = FitDriver(self.__nworkers)
+        fitters = {}
+        for category, spectrum in spectra.iteritems():
+            fitters[category] = MinBiasFitter("mbfitter%s" %(category), spectrum, doFit = False)
+            driver.AddFitter(category, fitters[category])
+        driver.Run()
+        params = {}
+        for category, fitter in fitters.iteritems():
+            params[category] = fitter.MakeBinnedParameterisationDefault(True)
+            params[category].SetName("FitMinBias%s" %(category))
+        return params
                 
     def MakeNormalisedSpectrum(self, spectrum, trigger, category):
         spectrum.SetVertexRange(-10., 10.)
@@ -55,7 +88,7 @@ class RawSpectrumWriter(object):
             myobject.Write(myobject.GetName(), TObject.kSingleKey)
         outputfile.Close()
         
-def Create(filename):
-    writer = RawSpectrumWriter()
+def Create(filename, nworkers = 1):
+    writer = RawSpectrumWriter(nworkers)
     writer.Process(filename)
     writer.WriteToFile("normspectra.root")
\ No newline at end of file
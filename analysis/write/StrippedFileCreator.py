@@ -22,6 +22,10 @@ Module creating stripped rootfiles for
 - MCjets
 - Patches in events
 
+The input file is read in a single pass: each object is read once and routed to
+the output files (sinks) of its categories. Cross section and number of trials are
+shared between all output files.
+
 :organization: ALICE Collaboration
 :copyright: 1998-2015, ALICE Experiment at CERN, All rights reserved.
 
@@ -30,541 +34,266 @@ Module creating stripped rootfiles for
 :organization: Lawrence Berkeley National Laboratory
 """
 
-from ROOT import TFile, TIter, TList
+from ROOT import TFile, TList
 import os,sys,getopt
 
-class StrippedTriggerContainer(object):
+TRIGGERS = ["MinBias", "EMCJLow", "EMCJHigh", "EMCGLow", "EMCGHigh"]
+
+class StrippedOutputSink(object):
     """
-    Trigger class structure for stripped format creator
+    Output file for one category of histograms. The file is created when the first
+    object is written, together with the shared metadata (cross section and number
+    of trials). Objects of trigger classes are written into a directory per trigger
+    class.
     """
     
-    def __init__(self, name):
+    def __init__(self, filename, metadata):
         """
         Constructor
-        """
-        self.__name = name
-        self.__eventhist = None
-        self.__trackContainers = []
-        self.__clusterContainers = []
-        self.__patchContainers = []  
-        self.__jetContainers = []
-        self.__MCJetContainers = []
-        self.__RecJetContainers = []
-        
-    def SetEventHist(self, eventhist):
-        """
-        Set the event histogram
-        
-        :param eventhist: Event hist
-        :type eventhist: TH1
-        """
-        self.__eventhist = eventhist
-        
-    def AddTrackContainer(self, cont):
-        """
-        Add Track THnSparse to the trigger class
-        
-        :param cont: Track hist
-        :type cont: THnSparse
-        """
-        self.__trackContainers.append(cont)
-        
-    def AddClusterContainer(self, cont):
-        """
-        Add Cluster THnSparse to the trigger class
-        
-        :param cont: Cluster hist
-        :type cont: THnSparse
-        """
-        self.__clusterContainers.append(cont)
-        
-    def AddPatchContainer(self, cont):
-        """
-        Add Trigger patch THnSparse to the trigger class
-        
-        :param cont: Trigger patch hist
-        :type cont: THnSparse
-        """
-        self.__patchContainers = cont
-        
-    def AddMCJetContainer(self, cont):
-        """
-        Add MC-Jet THnSparse to the trigger class
-        
-        :param cont: MC jet hist
-        :type cont: THnSparse
-        """
-        self.__MCJetContainers.append(cont)
-        
-    def AddRecJetContainer(self, cont):
-        """
-        Add Rec-Jet THnSparse to the trigger class
         
-        :param cont: Rec jet hist
-        :type cont: THnSparse
+        :param filename: Name of the output file
+        :type filename: str
+        :param metadata: Shared objects written at the top level, as (name, object)
+        :type metadata: list
         """
-        self.__RecJetContainers.append(cont)
+        self.__filename = filename
+        self.__metadata = metadata
+        self.__outputfile = None
+        self.__triggers = []
         
-    def GetName(self):
+    def GetFilename(self):
         """
-        Get the name of the trigger class
+        Get the name of the output file
         
-        :return: name of the trigger class
+        :return: Name of the output file
         :rtype: str
         """
-        return self.__name
-        
-    def GetEventHist(self):
-        """
-        Get the event histogram
-        
-        :return: Event hist
-        :rtype: TH1
-        """
-        return self.__eventhist
+        return self.__filename
     
-    def GetTrackContainers(self):
-        """
-        Get the track THnSparse
-        
-        :return: Track THnSparse
-        :rtype: THnSparse
-        """
-        return self.__trackContainers
-    
-    def GetClusterContainers(self):
-        """
-        Get the cluster THnSparse
-        
-        :return: Cluster THnSparse
-        :rtype: THnSparse
-        """
-        return self.__clusterContainers
-    
-    def GetPatchContainer(self):
-        """
-        Get the trigger patch THnSparse
-        
-        :return: Trigger patch THnSparse
-        :rtype: THnSparse
-        """
-        return self.__patchContainers
-    
-    def GetMCJetContainers(self):
-        """
-        Get the MC-jet THnSparse
-        
-        :return: MC jet THnSparse
-        :rtype: THnSparse
-        """
-        return self.__MCJetContainers
-    
-    def GetRecJetContainers(self):
-        """
-        Get the Rec-Jet THnSparse
-        
-        :return: rec jet THnSparse
-        :rtype: THnSparse
-        """
-        return self.__RecJetContainers
-    
-class StrippedTruthContainer(object):
-    """
-    MC truth data representation for stripped file creation
-    """
-    
-    def __init__(self):
-        """
-        Constructor
-        """
-        self.__particles = None
-        self.__events = None
-        self.__correlationMatrix = None
-        
-    def SetParticleHist(self, particlehist):
-        """
-        Set the particle histogram
-        
-        :param particlehist: particle histogram
-        :type particlehist: THnSparse
-        """
-        self.__particles = particlehist
-        
-    def SetEventHist(self, events):
-        """
-        Set the event histogram
-        
-        :param events: Event histogram
-        :type events: TH1
-        """
-        self.__events = events
-        
-    def SetCorrelationMatrix(self, corrmatrix):
+    def IsOpen(self):
         """
-        Set the correlation matrix
+        Check whether the output file was created
         
-        :param corrmatrix: Correlation matrix
-        :type corrmatrix: THnSparse
+        :return: True if objects were written
+        :rtype: bool
         """
-        self.__correlationMatrix = corrmatrix
+        return self.__outputfile is not None
         
-    def GetEventHist(self):
+    def GetListOfTriggers(self):
         """
-        Get the event histogram
+        Get the trigger classes with a directory in the output file
         
-        :return: The event histogram
-        :rtype: TH1
+        :return: list of trigger classes
+        :rtype: list
         """
-        return self.__events
+        return self.__triggers
     
-    def GetParticleHist(self):
-        """
-        Get the particle THnSparse
-        
-        :return: The particle hist
-        :rtype: THnSparse
-        """
-        return self.__particles
+    def Write(self, obj, name = None, trigger = None):
+        """
+        Write object to the output file
+        
+        :param obj: Object to write
+        :type obj: TObject
+        :param name: Name of the object in the file (default: name of the object)
+        :type name: str
+        :param trigger: Trigger class directory (None for top level)
+        :type trigger: str
+        """
+        if not self.__outputfile:
+            self.__outputfile = TFile(self.__filename, "RECREATE")
+            self.__outputfile.cd()
+            for metaname, metaobject in self.__metadata:
+                metaobject.Write(metaname)
+        if trigger:
+            if not trigger in self.__triggers:
+                self.__outputfile.mkdir(trigger)
+                self.__triggers.append(trigger)
+            self.__outputfile.cd(trigger)
+        else:
+            self.__outputfile.cd()
+        obj.Write(name if name else obj.GetName())
+        
+    def Close(self):
+        """
+        Close the output file
+        """
+        if self.__outputfile:
+            self.__outputfile.Close()
+            self.__outputfile = None
     
-    def GetCorrelationMatrix(self):
-        """
-        Get the correlation matrix
-        
-        :return: The correlation matrix
-        :rtype: THnSparse
-        """
-        return self.__correlationMatrix
-        
 class StrippedFileCreator(object):
     """
-    Creator class for stripped files
+    Creator class for stripped files. Objects from the input file are routed to the
+    output sinks of the different categories:
+    - triggers: global trigger patch histograms
+    - particles: MC truth particles
+    - tracks, clusters, patches, mcjets, recjets: histograms per trigger class
+    Event histograms are buffered and written at the end into all trigger class
+    directories which were created in the outputs.
     """
+    
+    # output files of the categories
+    OUTPUTFILES = {"triggers":"Triggers.root", "particles":"MCParticles.root", "tracks":"Tracks.root", "clusters":"Clusters.root", 
+                   "patches":"Patches.root", "mcjets":"MCJets.root", "recjets":"RecJets.root"}
 
-    def __init__(self):
+    def __init__(self, outputdirectory):
         """
         Constructor
-        """
-        self.__statuslist = []
-        self.__triggerclasses = []
-        self.__globaltriggers = []
-        self.__particles = None
-        self.__crosssection = None
-        self.__ntrials = None
-        
-    def WriteGlobalTriggers(self, outputfilename):
-        """
-        Write global trigger patch histograms
-        
-        :param outputfilename: Name of the output file
-        :type outputfilename: str
-        """
-        if not len(self.__globaltriggers):
-            return
-        outputfile = TFile(outputfilename, "RECREATE")
-        outputfile.cd()
-        if self.__crosssection:
-            self.__crosssection.Write("crosssection")
-        if self.__ntrials:
-            self.__ntrials.Write("ntrials")
-        for trigger in self.__triggerclasses:
-            if trigger.GetName() == "MinBias":
-                trigger.GetEventHist().Write("events")
-        for cont in self.__globaltriggers:
-            cont.Write(cont.GetName())
-        outputfile.Close()
-        
-    def WriteParticles(self, outputfilename):
-        """
-        Write information at MC truth level
-        
-        :param outputfilename: Name of the output file
-        :type outputfilename: str
-        """
-        if not self.__particles:
-            return
-        outputfile = TFile(outputfilename, "RECREATE")
-        outputfile.cd()
-        if self.__crosssection:
-            self.__crosssection.Write("crosssection")
-        if self.__ntrials:
-            self.__ntrials.Write("ntrials")
-        self.__particles.GetParticleHist().Write("MCTrueParticles")
-        self.__particles.GetEventHist().Write("events")
-        outputfile.Close()
-        
-        
-    def WriteTracks(self, outputfilename):
-        """
-        Write track histograms for each trigger class separated to an
-        output file
-        
-        :param outputfilename: Name of the output file
-        :type outputfilename: str
-        """
-        if not "tracks" in self.__statuslist:
-            return
-        outputfile = TFile(outputfilename, "RECREATE")
-        outputfile.cd()
-        if self.__crosssection:
-            self.__crosssection.Write("crosssection")
-        if self.__ntrials:
-            self.__ntrials.Write("ntrials")
-        for trigger in self.__triggerclasses:
-            if not len(trigger.GetTrackContainers()):
-                continue
-            outputfile.mkdir(trigger.GetName())
-            outputfile.cd(trigger.GetName())
-
-            trigger.GetEventHist().Write("events")
-            for histo in trigger.GetTrackContainers():
-                histo.Write()
-        outputfile.Close()
         
-    def WriteClusters(self, outputfilename):
+        :param outputdirectory: Directory of the output files
+        :type outputdirectory: str
         """
-        Write cluster histograms for each trigger class separated to an
-        output file
+        self.__outputdirectory = outputdirectory
+        self.__sinks = {}
+        self.__eventhists = {}
         
-        :param outputfilename: Name of the output file
-        :type outputfilename: str
+    def GetListOfCategories(self):
         """
-        if not "clusters" in self.__statuslist:
-            return
-        outputfile = TFile(outputfilename, "RECREATE")
-        outputfile.cd()
-        if self.__crosssection:
-            self.__crosssection.Write("crosssection")
-        if self.__ntrials:
-            self.__ntrials.Write("ntrials")
-        for trigger in self.__triggerclasses:
-            if not len(trigger.GetClusterContainers()):
-                continue
-            outputfile.mkdir(trigger.GetName())
-            outputfile.cd(trigger.GetName())
-
-            trigger.GetEventHist().Write("events")
-            for histo in trigger.GetClusterContainers():
-                histo.Write()
-        outputfile.Close()
+        Get the categories for which output was written
         
-    def WritePatches(self, outputfilename):
+        :return: list of categories
+        :rtype: list
         """
-        Write patch histograms for each trigger class separated to an
-        output file
-        
-        :param outputfilename: Name of the output file
-        :type outputfilename: str
-        """
-        if not "patches" in self.__statuslist:
-            return
-        outputfile = TFile(outputfilename, "RECREATE")
-        outputfile.cd()
-        if self.__crosssection:
-            self.__crosssection.Write("crosssection")
-        if self.__ntrials:
-            self.__ntrials.Write("ntrials")
-        for trigger in self.__triggerclasses:
-            if not len(trigger.GetPatchContainers()):
-                continue
-            outputfile.mkdir(trigger.GetName())
-            outputfile.cd(trigger.GetName())
-
-            trigger.GetEventHist().Write("events")
-            for histo in trigger.GetPatchContainers():
-                histo.Write()
-        outputfile.Close()
-        
-    def WriteMCJets(self, outputfilename):
-        """
-        Write MCjet histograms for each trigger class separated to an
-        output file
-        
-        :param outputfilename: Name of the output file
-        :type outputfilename: str
-        """
-        if not "mcjets" in self.__statuslist:
-            return 
-        outputfile = TFile(outputfilename, "RECREATE")
-        outputfile.cd()
-        if self.__crosssection:
-            self.__crosssection.Write("crosssection")
-        if self.__ntrials:
-            self.__ntrials.Write("ntrials")
-        for trigger in self.__triggerclasses:
-            if not len(trigger.GetMCJetContainers()):
-                continue
-            outputfile.mkdir(trigger.GetName())
-            outputfile.cd(trigger.GetName())
-
-            trigger.GetEventHist().Write("events")
-            for histo in trigger.GetMCJetContainers():
-                histo.Write()
-        outputfile.Close()
-        
-    def WriteRecJets(self, outputfilename):
+        return [category for category, sink in self.__sinks.iteritems() if sink.IsOpen()]
+    
+    @staticmethod
+    def Route(name):
         """
-        Write MCjet histograms for each trigger class separated to an
-        output file
+        Find categories and trigger class of an object by its name
         
-        :param outputfilename: Name of the output file
-        :type outputfilename: str
+        :param name: Name of the object
+        :type name: str
+        :return: list of categories and trigger class (None if not trigger dependent)
+        :rtype: tuple
         """
-        if not "recjets" in self.__statuslist:
-            return
-        outputfile = TFile(outputfilename, "RECREATE")
-        outputfile.cd()
-        if self.__crosssection:
-            self.__crosssection.Write("crosssection")
-        if self.__ntrials:
-            self.__ntrials.Write("ntrials")
-        for trigger in self.__triggerclasses:
-            if not len(trigger.GetMCJetContainers()):
-                continue
-            outputfile.mkdir(trigger.GetName())
-            outputfile.cd(trigger.GetName())
-
-            trigger.GetEventHist().Write("events")
-            for histo in trigger.GetMCJetContainers():
-                histo.Write()
-        outputfile.Close()
+        trigger = None
+        for mytrigger in TRIGGERS:
+            if mytrigger in name:
+                trigger = mytrigger
+                break
+        categories = []
+        if "PatchInfo" in name:
+            categories.append("patches" if trigger else "triggers")
+        if name == "hMCtrueParticles" or "hTrackPtCorrelation" in name:
+            categories.append("particles")
+        if trigger:
+            if "hEventHist" in name:
+                categories.append("events")
+            if "hTrackHist" in name or "hTrackInAcceptanceHist" in name or ("hMCTrack" in name and not "Jet" in name):
+                categories.append("tracks")
+            if "hCluster" in name:
+                categories.append("clusters")
+            if "hMCJetHist" in name or "hParticleJetHist" in name:
+                categories.append("mcjets")
+            if "hRecJetHist" in name or "hTrackJet" in name or "hMCTrackJet" in name:
+                categories.append("recjets")
+        return categories, trigger
 
-    def ReadFile(self, inputfilename, isPythiaHard):
+    def Convert(self, inputfilename, isPythiaHard):
         """
-        Read the rootfile, extract histograms and
-        assign them to trigger classes and histogram
-        categories used later for the creation of 
-        stripped output files
+        Read the rootfile and route all histograms to the
+        output files of their categories
         
-        :param inputfilename:
-        :type inputfilename:
+        :param inputfilename: Name of the input file
+        :type inputfilename: str
         :param isPythiaHard: if true then PYTHIA hard related histograms are available
-        :type isPythiaHard:
+        :type isPythiaHard: bool
         """
+        # state of the previous input file
+        self.__sinks = {}
+        self.__eventhists = {}
         reader = TFile.Open(inputfilename)
+        if not reader or reader.IsZombie():
+            print "Cannot open %s" %(inputfilename)
+            return
         
         # Find the directory of the task
-        taskdirectory = ""
-        keyiter = TIter(reader.GetListOfKeys())
-        fileentry = keyiter.Next()
-        while fileentry and not len(taskdirectory):
-            if fileentry.GetName().Contains("PtEMCalTriggerTask"):
-                taskdirectory = fileentry.GetName()
-            fileentry = keyiter.Next()
+        taskdirectory = None
+        for fileentry in reader.GetListOfKeys():
+            if "PtEMCalTriggerTask" in fileentry.GetName():
+                taskdirectory = reader.GetDirectory(fileentry.GetName())
+                break
         if not taskdirectory:
             print "Did not find task output"
+            reader.Close()
+            return
+        resultlist = None
+        for listkey in taskdirectory.GetListOfKeys():
+            listobject = listkey.ReadObj()
+            if isinstance(listobject, TList):
+                resultlist = listobject
+                break
+        if resultlist is None:
+            print "Did not find result list in the task output of %s - skipping" %(inputfilename)
+            reader.Close()
             return
-        reader.cd(taskdirectory)
-        histlist = TIter(taskdirectory).Next()
-        
-        # get the pythia hard histograms
-        if isPythiaHard:
-            self.__crosssection = histlist.Get("")
-            self.__ntrials = histlist.Get("")
         
         # find the list with the tasks histograms
-        listiter = TIter(histlist)
-        listentry = listiter.Next()
-        while listentry:
+        histlist = None
+        for listentry in resultlist:
             if isinstance(listentry, TList):
                 histlist = listentry
                 break
-            listentry = listiter.Next()
-            
-        # create output trigger classes
-        for trigger in ["MinBias", "EMCJLow", "EMCJHigh", "EMCGLow", "EMCGHigh"]:
-            self.__triggerclasses = StrippedTriggerContainer(trigger)
-
-        # iterate over histograms and assign 
-        contentIter = TIter(histlist)
-        contentObject = contentIter.Next()
-        while contentObject:
+        if histlist is None:
+            print "Did not find histogram list in the task output of %s - skipping" %(inputfilename)
+            reader.Close()
+            return
+        
+        # get the pythia hard histograms, shared by all outputs
+        metadata = []
+        if isPythiaHard:
+            for name, histname in [("crosssection", "fHistXsection"), ("ntrials", "fHistTrials")]:
+                hist = resultlist.FindObject(histname)
+                if hist:
+                    metadata.append((name, hist))
+        for category, filename in self.OUTPUTFILES.iteritems():
+            self.__sinks[category] = StrippedOutputSink(os.path.join(self.__outputdirectory, filename), metadata)
+        
+        # route each object to its outputs
+        for contentObject in histlist:
             try:
                 contentObject.SetDirectory(None)
             except:
                 pass
-            
-            #handle different categories
-            if "PatchInfo" in contentObject.GetName():
-                isInTriggers = False
-                for trigger in self.__triggerclasses:
-                    if trigger.GetName() in contentObject.GetName():
-                        trigger.AddPatchContainer(contentObject)
-                        isInTriggers = True
-                        if not "patches" in self.__statuslist:
-                            self.__statuslist.append("patches")
-                if not isInTriggers:
-                    self.__globaltriggers.append(contentObject)
-            if contentObject.GetName() == "hMCtrueParticles":
-                if not self.__particles:
-                    self.__particles = StrippedTruthContainer()
-                self.__particles.SetParticleHist(contentObject)
-            if "hTrackPtCorrelation" in contentObject.GetName():
-                if not self.__particles:
-                    self.__particles = StrippedTruthContainer()
-                self.__particles.SetCorrelationMatrix(contentObject)
-            if "hEventHist" in contentObject.GetName():
-                for trigger in self.__triggerclasses:
-                    if trigger.GetName() in contentObject.GetName():
-                        trigger.SetEventHist(contentObject)
-            for myname in ["hTrackHist","hMCTrackHist","hTrackInAcceptanceHist", "hMCTrackInAcceptanceHist"]:
-                if myname in contentObject.GetName():
-                    for trigger in self.__triggerclasses:
-                        if trigger.GetName() in contentObject.GetName():
-                            trigger.AddTrackContainer(contentObject)
-                            if not "tracks" in self.__statuslist:
-                                self.__statuslist.append("tracks")
-            if "hMCTrack" in contentObject.GetName() and not "Jet" in contentObject.GetName():
-                for trigger in self.__triggerclasses:
-                    if trigger.GetName() in contentObject.GetName():
-                        trigger.AddTrackContainer(contentObject)
-                        if not "tracks" in self.__statuslist:
-                            self.__statuslist.append("tracks")
-            if "hCluster" in contentObject.GetName():
-                for trigger in self.__triggerclasses:
-                    if trigger.GetName() in contentObject.GetName():
-                        trigger.AddClusterContainer(contentObject)
-                        if not "custers" in self.__statuslist:
-                            self.__statuslist.append("clusters")
-            if "hMCJetHist" in contentObject.GetName or "hParticleJetHist" in contentObject.GetName():
-                for trigger in self.__triggerclasses():
-                    if trigger.GetName() in contentObject.GetName():
-                        trigger.AddMCJetContainer(contentObject)
-                        if not "mcjets" in self.__statuslist:
-                            self.__statuslist.append("mcjets")
-            recjetstrings = ["hRecJetHist", "hTrackJet", "hMCTrackJet"]
-            for mystr in recjetstrings:
-                if mystr in contentObject.GetName():
-                    for trigger in self.__triggerclasses():
-                        if trigger.GetName() in contentObject.GetName():
-                            trigger.AddMCJetContainer(contentObject)
-                            if not "mcjets" in self.__statuslist:
-                                self.__statuslist.append("recjets")
-        
-        # add the event hist to the Spectrum
-        if self.__particles:
-            for trg in self.__triggerclasses:
-                if trg.GetName() == "MinBias":
-                    self.__particles.SetEventHist(trg.GetEventHist())
+            name = contentObject.GetName()
+            categories, trigger = self.Route(name)
+            for category in categories:
+                if category == "events":
+                    self.__eventhists[trigger] = contentObject
+                elif category == "particles":
+                    self.__sinks[category].Write(contentObject, "MCTrueParticles" if name == "hMCtrueParticles" else name)
+                else:
+                    self.__sinks[category].Write(contentObject, None, trigger)
+        
+        # add the event hists and close the outputs
+        for category, sink in self.__sinks.iteritems():
+            if not sink.IsOpen():
+                continue
+            if category in ["triggers", "particles"]:
+                if "MinBias" in self.__eventhists:
+                    sink.Write(self.__eventhists["MinBias"], "events")
+            else:
+                for trigger in sink.GetListOfTriggers():
+                    if trigger in self.__eventhists:
+                        sink.Write(self.__eventhists[trigger], "events", trigger)
+            sink.Close()
         
         # we are DONE
         reader.Close()
         
-def ConvertTrainFile(infilename, isPythiaHard):
+def ConvertTrainFile(infilename, isPythiaHard = False):
     """
-    Convert rootfile into stripped format consisting of several root files
+    Convert rootfile into stripped format consisting of several root files,
+    written into the directory of the input file
     
-    ::
+    :param infilename: Name of the input file
+    :type infilename: str
+    :param isPythiaHard: if true then PYTHIA hard related histograms are available
+    :type isPythiaHard: bool
     """
     directory = os.path.dirname(os.path.abspath(infilename))
-    converter = StrippedFileCreator()
-    converter.ReadFile(infilename, isPythiaHard)
-    
-    converter.WriteGlobalTriggers("%s/Triggers.root" %directory)
-    converter.WriteParticles("%s/MCParticles.root" %directory)
-    converter.WriteTracks("%s/Tracks.root" %directory)
-    converter.WriteClusters("%s/Clusters.root" %directory)
-    converter.WriteRecJets("%s/RecJets.root" %directory)
-    converter.WriteMCJets("%s/MCJets.root" %directory)
+    converter = StrippedFileCreator(directory)
+    converter.Convert(infilename, isPythiaHard)
 
 def Usage():
     """
@@ -582,11 +311,13 @@ if __name__ == "__main__":
     if len(sys.argv) < 2:
         Usage()
         sys.exit(1)
+    opt = []
     if len(sys.argv) > 2:
         opt,arg = getopt.getopt(sys.argv[2:], "ph")
-    if "p" in opt:
-        Usage()
-        sys.exit(1)
-    if "t" in opt:
-        isPythiaHard = True
+    for o,a in opt:
+        if o == "-h":
+            Usage()
+            sys.exit(1)
+        elif o == "-p":
+            isPythiaHard = True
     ConvertTrainFile(sys.argv[1], isPythiaHard)
\ No newline at end of file
@@ -0,0 +1,65 @@
+#**************************************************************************
+#* Copyright(c) 1998-2014, ALICE Experiment at CERN, All rights reserved. *
+#*                                                                        *
+#* Author: The ALICE Off-line Project.                                    *
+#* Contributors are mentioned in the code where appropriate.              *
+#*                                                                        *
+#* Permission to use, copy, modify and distribute this software and its   *
+#* documentation strictly for non-commercial purposes is hereby granted   *
+#* without fee, provided that the above copyright notice appears in all   *
+#* copies and that both the copyright notice and this permission notice   *
+#* appear in the supporting documentation. The authors make no claims     *
+#* about the suitability of this software for any purpose. It is          *
+#* provided "as is" without express or implied warranty.                  *
+#**************************************************************************
+"""
+Execution of independent writer tasks (i.e. projections for one trigger class in one
+pt-hard bin) in a pool of worker processes. The worker processes are forked from the
+parent process after the input data was read, so they share the input data of the
+writer. Results are sent back to the parent process as pickled ROOT objects and
+returned in the order of the tasks.
+
+:organization: ALICE Collaboration
+:copyright: 1998-2014, ALICE Experiment at CERN, All rights reserved.
+
+:author: Markus Fasel
+:contact: markus.fasel@cern.ch
+:organization: Lawrence Berkeley National Laboratory
+"""
+
+from multiprocessing import Pool
+
+# writer processed by the worker processes, inherited at fork
+_gWriter = None
+
+def _RunTask(task):
+    """
+    Process one task of the current writer in a worker process
+    """
+    return _gWriter.ProcessTask(task)
+
+def RunTasks(writer, tasks, nworkers = 1):
+    """
+    Run tasks of a writer. The writer needs to implement ProcessTask(task). With more
+    than one worker the tasks are processed in parallel in a process pool.
+
+    :param writer: writer processing the tasks
+    :type writer: object
+    :param tasks: list of tasks
+    :type tasks: list
+    :param nworkers: number of worker processes
+    :type nworkers: int
+    :return: results of the tasks, in the order of the tasks
+    :rtype: list
+    """
+    global _gWriter
+    if nworkers < 2 or len(tasks) < 2:
+        return [writer.ProcessTask(task) for task in tasks]
+    _gWriter = writer
+    pool = Pool(min(nworkers, len(tasks)))
+    try:
+        return pool.map(_RunTask, tasks, 1)
+    finally:
+        pool.close()
+        pool.join()
+        _gWriter = None
@@ -1,49 +1,21 @@
 #!  /usr/bin/env python 
 
-import getpass, os, shutil, sys
+import getopt, getpass, os, sys
+
+if __name__ == "__main__":
+    # add the analysis package to the python path
+    distribution = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(sys.argv[0]))), "analysis")
+    if not distribution in [os.path.abspath(path) for path in sys.path]:
+        sys.path.append(distribution)
+
+from base.FileMerger import MergeFiles, TreeMerger
 
 def MergeBucket(outputfile, listoffiles):
-    mergecommand = "hadd -f %s" %(outputfile)
-    for f in listoffiles:
-        mergecommand += " %s" %(f)
-    os.system(mergecommand)
+    MergeFiles(outputfile, listoffiles)
     
-def RecursiveMerge(outputfile, listoffiles, bucketfactor, sandbox, iteration = 0):
-    if not os.path.exists(sandbox):
-        os.makedirs(sandbox, 0755)
-    stagedir = "%s/iter%d" %(sandbox, iteration)
-    if not os.path.exists(stagedir):
-        os.mkdir(stagedir)
-    rootfile = os.path.basename(outputfile)
-    listfornext = []
-    patchcounter = 0
-    package = []
-    for f in listoffiles:
-        if os.path.exists(f):
-            print "Adding file %s" %f
-            package.append(f)
-        if len(package) >= bucketfactor:
-            mergedfile = "%s/%d/%s" %(stagedir, patchcounter, rootfile)
-            os.makedirs(os.path.dirname(mergedfile), 0755)
-            MergeBucket(mergedfile, package)
-            patchcounter +=1
-            package = []
-            listfornext.append(mergedfile)
-    # merge last bunch
-    if len(package):
-        mergedfile = "%s/%d/%s" %(stagedir, patchcounter, rootfile)
-        os.makedirs(os.path.dirname(mergedfile), 0755)
-        MergeBucket(mergedfile, listoffiles)
-        listfornext.append(mergedfile)
-    if len(listfornext) == 1:
-        # we are done
-        # move output file to its final location
-        # clean sandbox
-        shutil.move(listfornext[0], outputfile)    
-        shutil.rmtree(sandbox)
-    else:
-        # next iteration step
-        RecursiveMerge(outputfile, listfornext, bucketfactor, sandbox, iteration+1)
+def RecursiveMerge(outputfile, listoffiles, bucketfactor, sandbox, nworkers = 1):
+    merger = TreeMerger(bucketfactor, nworkers, sandbox)
+    merger.Merge(outputfile, listoffiles)
         
 def FindLastStage(inputdirs):
     maxID = -1
@@ -70,7 +42,7 @@ def FindRecursive(inputpath, rootfilename):
                 result.append(f)
     return result
 
-def RunMerge(inputdir, rootfile):
+def RunMerge(inputdir, rootfile, fanin = 10, nworkers = 1):
     for r in os.listdir(inputdir):
         print "Doing run %s" %r
         for b in os.listdir("%s/%s" %(inputdir, r)):
@@ -81,7 +53,15 @@ def RunMerge(inputdir, rootfile):
                 print "merging run %s, bin %s" %(r, b)
                 mergeinputdir = "%s/%s/%s/%s" %(inputdir, r, b, stageToMerge)
                 outputfile = "%s/%s/%s/%s" %(inputdir, r, b, rootfile)
-                RecursiveMerge(outputfile, FindRecursive(mergeinputdir, rootfile), 10, "/tmp/%s/merge" %(getpass.getuser()))
+                RecursiveMerge(outputfile, FindRecursive(mergeinputdir, rootfile), fanin, "/tmp/%s/merge" %(getpass.getuser()), nworkers)
                 
 if __name__ == "__main__":
-    RunMerge(sys.argv[1], sys.argv[2])
\ No newline at end of file
+    fanin = 10
+    nworkers = 1
+    opts, args = getopt.getopt(sys.argv[1:], "f:j:")
+    for o, a in opts:
+        if o == "-f":
+            fanin = int(a)
+        elif o == "-j":
+            nworkers = int(a)
+    RunMerge(args[0], args[1], fanin, nworkers)
\ No newline at end of file
@@ -1,75 +1,77 @@
 #! /usr/bin/env python
 
-import sys, os, commands, zipfile
+import sys, os, getopt
 
-def aliencopy(sourcelocation, targetlocation):
-    print "Copy %s to %s" %(sourcelocation, targetlocation)
-    os.system("alien_cp alien://%s %s" %(sourcelocation, targetlocation))
-    
-def alienlist(inputdir):
-    print "Scanning directory: %s" %(inputdir)
-    runlist = []
-    tmplist = commands.getstatusoutput("alien_ls %s" %(inputdir))[1].split("\n")
-    for r in tmplist:
-        runlist.append(r.lstrip().rstrip())
-    return runlist
+if __name__ == "__main__":
+    # add the analysis package to the python path
+    distribution = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(sys.argv[0]))), "analysis")
+    if not distribution in [os.path.abspath(path) for path in sys.path]:
+        sys.path.append(distribution)
+
+from util.GridTransfer import AlienBackend, LocalBackend, ListingCache, TransferQueue, ExtractZipMember
 
-def extractZipfile(filename):
-    if not ".zip" in filename or not os.path.exists(filename):
-        return
-    cwd = os.getcwd()
-    os.chdir(os.path.dirname(filename))
-    #unzip
-    myarchive = zipfile.ZipFile(os.path.basename(filename))
-    myarchive.extractall()
-    os.chdir(cwd)
-    
-def TransferFile(inputfile, outputfile):
-    if not os.path.exists(os.path.dirname(outputfile)):
-        os.makedirs(os.path.dirname(outputfile), 0755)
-    aliencopy(inputfile, outputfile)
-    extractZipfile(outputfile)
-    
+def makeExtractor(targetfile, member):
+    if not ".zip" in targetfile or not member:
+        return None
+    return lambda archive: ExtractZipMember(archive, member)
 
-def transferMergingStage(inputpath, outputpath, targetfile):
-    dirs = alienlist(inputpath)
-    for indir in dirs:
+def queueMergingStage(listing, transfers, inputpath, outputpath, targetfile, extractor):
+    for indir in listing.List(inputpath):
         if not indir.isdigit():
             continue
-        inputfile = "%s/%s/%s" %(inputpath, indir, targetfile) 
+        inputfile = "%s/%s/%s" %(inputpath, indir, targetfile)
         outputfile = "%s/%s/%s" %(outputpath, indir, targetfile)
-        TransferFile(inputfile, outputfile)
+        transfers.Add(inputfile, outputfile, extractor)
 
-def transfer(trainrun, outputlocation, targetfile):
+def transfer(trainrun, outputlocation, targetfile, backend, nworkers = 4, member = "AnalysisResults.root"):
     sample = "/alice/sim/2013/LHC13b4_plus"
-    runlist =  alienlist(sample)
+    listing = ListingCache(backend, nworkers)
+    transfers = TransferQueue(backend, nworkers, statefile = os.path.join(os.path.abspath(outputlocation), "transferstate.json"))
+    extractor = makeExtractor(targetfile, member)
+    runlist = [r for r in listing.List(sample) if r.isdigit()]
+    # list all run and pt-hard bin directories in one batch
+    bindirs = {}
     for r in runlist:
-        if not r.isdigit():
-            continue
-        print "Doing run %s" %(r)
         for b in range(1, 11):
-            inputdir= ("%s/%d/%d/%s" %(sample, int(r), b, trainrun))
-            inputfile = "%s/%s" %(inputdir, targetfile)
-            outputdir = os.path.abspath("%s/%d/%02d" %(outputlocation, int(r), b))
-            outputfile = "%s/%s" %(outputdir, targetfile)
-            if not os.path.exists(outputfile):
-                TransferFile(inputfile, outputfile)
-                
-            # copy stage files
-            outputlist = alienlist(inputdir)
-            for content in outputlist:
-                if not "Stage" in content or ".xml" in content:
-                    continue
-                print "Copying %s" %(os.path.basename(content))
-                stagedir = "%s/%s" %(outputdir, os.path.basename(content))
-                if not os.path.exists(stagedir):
-                    os.mkdir(stagedir, 0755)
-                transferMergingStage(inputdir, stagedir, targetfile)
+            bindirs[(int(r), b)] = "%s/%d/%d/%s" %(sample, int(r), b, trainrun)
+    listing.Prefetch(bindirs.values())
+    stagedirs = {}
+    for (r, b), inputdir in sorted(bindirs.iteritems()):
+        outputdir = os.path.abspath("%s/%d/%02d" %(outputlocation, r, b))
+        transfers.Add("%s/%s" %(inputdir, targetfile), "%s/%s" %(outputdir, targetfile), extractor)
+        for content in listing.List(inputdir):
+            if not "Stage" in content or ".xml" in content:
+                continue
+            stagename = os.path.basename(content)
+            stagedirs["%s/%s" %(inputdir, stagename)] = "%s/%s" %(outputdir, stagename)
+    # copy stage files
+    listing.Prefetch(stagedirs.keys())
+    for inputdir, outputdir in sorted(stagedirs.iteritems()):
+        queueMergingStage(listing, transfers, inputdir, outputdir, targetfile, extractor)
+    transfers.Run()
+    failed = transfers.GetListOfFailed()
+    if len(failed):
+        print "%d transfers failed:" %(len(failed))
+        for source, target in failed:
+            print "  %s" %(source)
 
 if __name__ == "__main__":
-    trainrun = sys.argv[1] 
-    outputpath = sys.argv[2]
+    nworkers = 4
+    member = "AnalysisResults.root"
+    backend = AlienBackend()
+    opts, args = getopt.getopt(sys.argv[1:], "j:l:m:")
+    for o, a in opts:
+        if o == "-j":
+            nworkers = int(a)
+        elif o == "-l":
+            # local directory replacing the grid
+            backend = LocalBackend(a)
+        elif o == "-m":
+            # member extracted from zip archives
+            member = a
+    trainrun = args[0]
+    outputpath = args[1]
     outputfile = "root_archive.zip"
-    if len(sys.argv) > 3:
-        outputfile = sys.argv[3]
-    transfer(trainrun, outputpath, outputfile)
\ No newline at end of file
+    if len(args) > 2:
+        outputfile = args[2]
+    transfer(trainrun, outputpath, outputfile, backend, nworkers, member)
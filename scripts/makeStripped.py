@@ -1,20 +1,15 @@
 #! /usr/bin/env python
 
 import os, sys, getopt
+from multiprocessing import Pool
 
 if __name__ == "__main__":
     # extract directory path, and add it if necessary to the PythonPath
-    distribution = os.path.dirname(os.path.dirname(os.path.abspath(sys.argv[0])))
-    paths = os.getenv("PYTHONPATH").split(":")
-    found = False
-    for path in paths:
-        if os.path.abspath(path) == "distribution":
-            found = True
-            break
-    if not found:
+    distribution = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(sys.argv[0]))), "analysis")
+    if not distribution in [os.path.abspath(path) for path in sys.path]:
         sys.path.append(distribution)
         
-from write.StrippedFileCreator import ConvertTrainFile, isPythiaHard
+from write.StrippedFileCreator import ConvertTrainFile
 
 def FindRecursive(filename, inputdir):
     result = []
@@ -30,21 +25,38 @@ def FindRecursive(filename, inputdir):
                 result.append(os.path.join(dirpath, filename))
     return result
 
+def ConvertFile(task):
+    myfile, isPythiaHard = task
+    print "Converting inputfile %s" %myfile
+    ConvertTrainFile(myfile, isPythiaHard)
+
 if __name__ == "__main__":
     filename = sys.argv[1]
     isPythiaHard = False
     rootfile = None
+    nworkers = 1
     if len(sys.argv) > 2:
-        opts, args = getopt.getopt(sys.argv[2:], "r:p")
+        opts, args = getopt.getopt(sys.argv[2:], "r:pj:")
         for o,a in opts:
             if o == "-r":
                 rootfile = str(a)
             elif o == "-p":
-                isPythiaHard == True
+                isPythiaHard = True
+            elif o == "-j":
+                nworkers = int(a)
     files = FindRecursive(filename, os.getcwd())
+    tasks = []
     for f in files:
         myfile = f
         if rootfile:
             myfile += "#%s" %rootfile
-        print "Converting inputfile %s" %myfile
-        ConvertTrainFile(sys.argv, isPythiaHard)
+        tasks.append((myfile, isPythiaHard))
+    if nworkers > 1 and len(tasks) > 1:
+        # files are independent, convert them in parallel
+        pool = Pool(nworkers)
+        pool.map(ConvertFile, tasks, 1)
+        pool.close()
+        pool.join()
+    else:
+        for task in tasks:
+            ConvertFile(task)
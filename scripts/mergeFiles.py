@@ -0,0 +1,30 @@
+#! /usr/bin/env python
+import getopt, os, sys
+
+if __name__ == "__main__":
+    # add the analysis package to the python path
+    distribution = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(sys.argv[0]))), "analysis")
+    if not distribution in [os.path.abspath(path) for path in sys.path]:
+        sys.path.append(distribution)
+
+from base.FileMerger import IncrementalMerger, TreeMerger
+
+def MergeFileList(outputfile, filelist, fanin = 10, nworkers = 1, incremental = False):
+    merger = TreeMerger(fanin, nworkers)
+    if incremental:
+        merger = IncrementalMerger(merger)
+    merger.Merge(outputfile, filelist)
+
+if __name__ == "__main__":
+    fanin = 10
+    nworkers = 1
+    incremental = False
+    opts, args = getopt.getopt(sys.argv[1:], "f:j:i")
+    for o, a in opts:
+        if o == "-f":
+            fanin = int(a)
+        elif o == "-j":
+            nworkers = int(a)
+        elif o == "-i":
+            incremental = True
+    MergeFileList(args[0], args[1:], fanin, nworkers, incremental)
@@ -17,6 +17,7 @@ for d in ${dirs[@]}; do
                 inputfiles=$(printf "%s %s/%s/AnalysisResults.root" "$inputfiles" $BASE $d)
         fi
 done
-cmd=$(printf "root -b -q %s/macros/LoadLibsAna.C \'%s/macros/mergeFiles.C(\"%s/merged/AnalysisResults.root\",\"%s\")\'" $SRC $SRC $BASE "$inputfiles")
+# incremental merge: only periods not yet in the merged output are added
+cmd=$(printf "%s/mergeFiles.py -i %s/merged/AnalysisResults.root %s" $SCRIPTPATH $BASE "$inputfiles")
 echo $cmd
 eval $cmd
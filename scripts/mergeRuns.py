@@ -1,11 +1,19 @@
 #! /usr/bin/env python
-import os, sys
+import getopt, os, sys
 
-def ExecMerge(outputfile, filelist):
-    mergecommand = "hadd -f %s" %(outputfile)
-    for gridfile in filelist:
-        mergecommand += " %s" %(gridfile) 
-    os.system(mergecommand)
+if __name__ == "__main__":
+    # add the analysis package to the python path
+    distribution = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(sys.argv[0]))), "analysis")
+    if not distribution in [os.path.abspath(path) for path in sys.path]:
+        sys.path.append(distribution)
+
+from base.FileMerger import IncrementalMerger, TreeMerger
+
+def ExecMerge(outputfile, filelist, fanin = 10, nworkers = 1, incremental = False):
+    merger = TreeMerger(fanin, nworkers)
+    if incremental:
+        merger = IncrementalMerger(merger)
+    merger.Merge(outputfile, filelist)
     
 def GetRunlist(basedir):
     tmplist = os.listdir(basedir)
@@ -23,10 +31,9 @@ def GetFilelist(inputpath, runlist, pthardbin, filename):
             result.append(tmpfile)
     return result
 
-def DoMerge(inputpath, filename):
+def DoMerge(inputpath, filename, fanin = 10, nworkers = 1, incremental = False):
     mergedir = "%s/merged" %(inputpath)
     runlist = GetRunlist(inputpath)
-    basedir = os.getcwd()
     if not os.path.exists(mergedir):
         os.makedirs(mergedir, 0755)
         
@@ -36,14 +43,26 @@ def DoMerge(inputpath, filename):
         outputdir = "%s/%02d" %(mergedir, pthard)
         if not os.path.exists(outputdir):
             os.makedirs(outputdir, 0755)
-        os.chdir(outputdir)
-        ExecMerge(filename, files)
-        os.chdir(basedir)
+        if not len(files):
+            print "No files found for pt-hard bin %d" %(pthard)
+            continue
+        ExecMerge("%s/%s" %(outputdir, filename), files, fanin, nworkers, incremental)
     print "Done"
 
 if __name__ == "__main__":
-    inputpath = sys.argv[1]
+    fanin = 10
+    nworkers = 1
+    incremental = False
+    opts, args = getopt.getopt(sys.argv[1:], "f:j:i")
+    for o, a in opts:
+        if o == "-f":
+            fanin = int(a)
+        elif o == "-j":
+            nworkers = int(a)
+        elif o == "-i":
+            incremental = True
+    inputpath = args[0]
     rootfile = "AnalysisResults.root"
-    if len(sys.argv) > 2:
-        rootfile = sys.argv[2]
-    DoMerge(inputpath, rootfile)
\ No newline at end of file
+    if len(args) > 1:
+        rootfile = args[1]
+    DoMerge(inputpath, rootfile, fanin, nworkers, incremental)
\ No newline at end of file